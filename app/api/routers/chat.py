@@ -1,25 +1,44 @@
 # app/api/routers/chat.py
+import asyncio
+import json
 import logging
 import time
 import uuid
 import re
-from typing import List, Dict, Any
+from contextlib import nullcontext
+from typing import List, Dict, Any, AsyncIterator
 
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from langchain_core.runnables import RunnableConfig
 
 # 导入契约 (Schema)
-from app.schemas.chat import ChatRequest, ChatResponse, SourceDocument
+from app.schemas.chat import ChatRequest, ChatResponse, SourceDocument, ChatBatchRequest, ChatBatchResponse
 # 导入图谱实例
-from app.core.gprah import app_graph
+from app.core.gprah import app_graph, prefetch_vector_evidence
 # 导入配置
 from app.core.config import settings
+# 语义答案缓存
+from app.core.answer_cache import get_answer_cache, knowledge_version
+from app.core.vector import get_embeddings, VectorStoreService
+from app.core.search_filter import UnsupportedFilterError
+# 相同请求合并执行
+from app.core.singleflight import SingleFlight, normalize_query
+# 准入控制 (并发上限 + 优先级队列)
+from app.core.admission import chat_admission, AdmissionRejected, DEFAULT_PRIORITY
+# 指标与请求级耗时明细
+from app.core.metrics import track, start_stage_breakdown, REQUEST_LATENCY, TTFT
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 并发的相同问题 (归一化 query + 相同选项) 只运行一次图，结果分发给所有等待者
+_chat_flight = SingleFlight("ChatFlight")
+
 @router.post("/chat", response_model=ChatResponse, summary="多源检索问答接口")
 async def chat_endpoint(
     request: Request,
@@ -34,65 +53,399 @@ async def chat_endpoint(
     """
     req_id = str(uuid.uuid4())
     start_time = time.time()
+    stage_latency = start_stage_breakdown()
     
     logger.info(f"[{req_id}] 收到请求: {body.query} | Config: Graph={body.enable_graph}, Web={body.enable_web}")
+    await _check_filters([body])
+
+    # 0. 语义缓存：相似问题 + 相同选项直接返回
+    query_vector = None
+    # 生成回答前的知识库版本：期间有新文档入库时，回答不写入缓存
+    cache_version = knowledge_version()
+    if settings.answer_cache_enabled:
+        try:
+            with track("embedding"):
+                query_vector = await run_in_threadpool(get_embeddings().embed_query, body.query)
+            cached = get_answer_cache().lookup(query_vector, body.options_key())
+            if cached is not None:
+                response = ChatResponse(**cached)
+                response.cached = True
+                response.latency = round(time.time() - start_time, 3)
+                response.stage_latency = dict(stage_latency)
+                REQUEST_LATENCY.observe(response.latency, endpoint="chat")
+                return response
+        except Exception as e:
+            # 缓存只是加速手段，出错时照常走完整流程
+            logger.warning(f"[{req_id}] 语义缓存查询失败: {e}")
 
     try:
         # 1. 构造图初始状态 (Input State)
-        # 必须与 app/core/graph.py 中的 AgentState 对应
-        initial_state = {
-            "original_query": body.query,
-            "sub_queries": [],          
-            "retrieved_contents": [],   
-            "final_answer": ""          
-        }
+        initial_state = _build_initial_state(body)
 
         # 2. 构造运行时配置 (Runtime Config)
         # 将请求参数通过 metadata 传递给 Graph 中的 Node 使用
-        run_config: RunnableConfig = {
-            "configurable": {"thread_id": req_id},
-            "metadata": {
-                "top_k": body.top_k,
-                "enable_graph": body.enable_graph,
-                "enable_web": body.enable_web
-            }
-        }
+        run_config = _build_run_config(req_id, body)
 
         # 3. 异步执行图
-        # 使用 ainvoke 非阻塞调用
-        final_state = await app_graph.ainvoke(initial_state, config=run_config) # type: ignore
+        # 使用 ainvoke 非阻塞调用；相同的进行中请求会被合并
+        # 只有真正执行图的请求才占用准入名额，缓存命中和合并等待者不占
+        priority = _request_priority(request)
 
-        # 4. 提取结果
-        answer = final_state.get("final_answer", "抱歉，未能生成回答。")
-        raw_contents = final_state.get("retrieved_contents", [])
-        sub_queries = final_state.get("sub_queries", [])
+        async def _run_graph():
+            # 合并执行体在独立 Task 中运行，单独记录一份耗时明细随结果返回给所有等待者
+            graph_latency = start_stage_breakdown()
+            async with chat_admission.slot(priority):
+                final_state = await app_graph.ainvoke(initial_state, config=run_config) # type: ignore
+            return final_state, dict(graph_latency)
 
-        # 5. 数据清洗与转换
-        # 5.1 解析证据来源
-        structured_sources = _parse_sources(raw_contents)
-        
-        # 5.2 构建推理轨迹 (Reasoning Trace)
-        # 这里我们将图谱执行过程中的关键中间状态可视化给前端
-        trace = _build_trace(body.query, sub_queries, structured_sources)
+        flight_key = f"{normalize_query(body.query)}|{body.options_key()}|{body.budget_ms}"
+        (final_state, graph_latency), shared = await _chat_flight.do(flight_key, _run_graph)
+        if shared:
+            logger.info(f"[{req_id}] 复用进行中的相同请求结果")
 
-        # 6. 计算耗时并返回
-        latency = round(time.time() - start_time, 3)
-        
-        return ChatResponse(
-            answer=answer,
-            sources=structured_sources,
-            latency=latency,
-            reasoning_trace=trace
-        )
+        # 4. 提取结果、解析证据、构建推理轨迹并计算耗时
+        response = _build_response(body, final_state, start_time, {**stage_latency, **graph_latency})
+        REQUEST_LATENCY.observe(response.latency, endpoint="chat")
+
+        # 5. 写入语义缓存 (合并请求只由发起者写入一次；因超预算丢弃过检索源的不完整回答不缓存)
+        if query_vector is not None and not shared and not response.dropped_sources:
+            get_answer_cache().store(
+                query_vector, body.options_key(), body.query, response.model_dump(), version=cache_version
+            )
+
+        return response
 
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
     except Exception as e:
         logger.error(f"[{req_id}] 处理异常: {str(e)}", exc_info=True)
         # 生产环境建议隐藏具体堆栈，仅返回通用错误信息
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 
+@router.post("/chat/batch", response_model=ChatBatchResponse, summary="批量问答接口")
+async def chat_batch_endpoint(request: Request, body: ChatBatchRequest):
+    """
+    批量问答端点：供离线评测/回归脚本一次提交 N 个问题。
+    向量检索在整批范围内合并执行，之后各问题的图并发运行。
+    批量预取与每个问题的图各自占用一个准入名额，默认按 batch 优先级排队 (让位于交互式请求)。
+    """
+    start_time = time.time()
+    logger.info(f"收到批量请求: {len(body.requests)} 条")
+    await _check_filters(body.requests)
+
+    try:
+        responses = await run_chat_batch(body.requests, priority=_request_priority(request, default="batch"))
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
+    except Exception as e:
+        logger.error(f"批量处理异常: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+    latency = round(time.time() - start_time, 3)
+    REQUEST_LATENCY.observe(latency, endpoint="chat_batch")
+    return ChatBatchResponse(responses=responses, latency=latency)
+
+
+async def run_chat_batch(bodies: List[ChatRequest], priority: str | None = None) -> List[ChatResponse]:
+    """
+    批量问答的 Python 入口 (也可在脚本中直接 await 调用)：
+    1. 按 top_k 与向量检索选项 (ANN 参数、过滤条件) 分组，每组一次批量编码 + 一次 Milvus 批量搜索 + 共享重排序微批
+    2. 预取结果写入 state["vector_prefetch"]，node_vector_search 命中后不再单独检索
+    3. 最多 batch_graph_concurrency 个并发执行各问题剩余的路由/图谱/联网/生成步骤
+    给定 priority 时，预取阶段与每个问题的图各自占用一个准入名额，批量请求和交互式请求一样受并发上限约束；
+    不给则不经过准入控制 (脚本直接调用)。全部问题都被准入拒绝时抛出 AdmissionRejected
+    """
+    if not bodies:
+        return []
+
+    start_time = time.time()
+    req_ids = [str(uuid.uuid4()) for _ in bodies]
+
+    # 1. 分组预取向量证据
+    prefetch: List[Dict[str, List[str]]] = [{} for _ in bodies]
+    groups: Dict[tuple, List[int]] = {}
+    for idx, body in enumerate(bodies):
+        if body.enable_vector:
+            options_key = json.dumps(body.vector_options(), sort_keys=True, default=str)
+            groups.setdefault((body.top_k, options_key), []).append(idx)
+
+    if groups:
+        async with _admitted(priority):
+            for (top_k, options_key), indices in groups.items():
+                queries = [bodies[i].query for i in indices]
+                try:
+                    evidence = await run_in_threadpool(
+                        prefetch_vector_evidence, queries, top_k, bodies[indices[0]].vector_options()
+                    )
+                except Exception as e:
+                    # 预取失败不影响整批，节点会退回逐条检索
+                    logger.error(f"批量向量预取失败 (top_k={top_k}, options={options_key}): {e}", exc_info=True)
+                    continue
+                for i, results in zip(indices, evidence):
+                    prefetch[i] = {bodies[i].query: results}
+
+    # 2. 并发执行图：先占本批的并发位再排准入队列，单个批量请求同时最多排入 batch_graph_concurrency 个等待者
+    states = [_build_initial_state(body, vector_prefetch=prefetch[i]) for i, body in enumerate(bodies)]
+    configs = [_build_run_config(req_id, body) for req_id, body in zip(req_ids, bodies)]
+    semaphore = asyncio.Semaphore(settings.batch_graph_concurrency)
+
+    async def _run_graph(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+        async with semaphore, _admitted(priority):
+            return await app_graph.ainvoke(state, config=config) # type: ignore
+
+    final_states = await asyncio.gather(
+        *(_run_graph(state, config) for state, config in zip(states, configs)), return_exceptions=True
+    )
+    if all(isinstance(s, AdmissionRejected) for s in final_states):
+        raise final_states[0] # type: ignore
+
+    # 3. 组装结果，单条失败不拖垮整批
+    responses = []
+    for req_id, body, final_state in zip(req_ids, bodies, final_states):
+        if isinstance(final_state, Exception):
+            logger.error(f"[{req_id}] 批量子请求失败: {final_state}")
+            final_state = {"final_answer": f"生成过程中发生错误: {final_state}"}
+        responses.append(_build_response(body, final_state, start_time))
+    return responses
+
+
+@router.post("/chat/stream", summary="多源检索问答接口 (SSE 流式)")
+async def chat_stream_endpoint(request: Request, body: ChatRequest):
+    """
+    流式问答端点 (Server-Sent Events)：
+    1. 每个 LangGraph 节点完成时推送一次 `node` 事件 (路由决策 / 各路证据)
+    2. 生成节点产出的 token 以 `token` 事件实时推送
+    3. 结束时推送 `done` 事件，携带完整回答、来源、总耗时与首 token 耗时 (ttft)
+    """
+    req_id = str(uuid.uuid4())
+    logger.info(f"[{req_id}] 收到流式请求: {body.query} | Config: Graph={body.enable_graph}, Web={body.enable_web}")
+    await _check_filters([body])
+
+    # 在返回响应头之前完成准入，这样被拒绝时客户端能拿到真实的 429/503 状态码
+    try:
+        await chat_admission.acquire(_request_priority(request))
+    except AdmissionRejected as e:
+        raise e.to_http_exception()
+    admitted_at = time.monotonic()
+
+    released = False
+    def _release():
+        nonlocal released
+        if not released:
+            released = True
+            # 与 slot() 一样上报占用时长，流式请求通常最长，不能缺席服务时长估计
+            chat_admission.release(time.monotonic() - admitted_at)
+
+    return StreamingResponse(
+        _stream_graph_events(req_id, body, on_finish=_release),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # 兜底：客户端在流开始前断开时生成器不会执行，由后台任务归还名额
+        background=BackgroundTask(_release)
+    )
+
+
+async def _stream_graph_events(req_id: str, body: ChatRequest, on_finish=None) -> AsyncIterator[str]:
+    """
+    驱动 app_graph.astream，把节点更新与生成 token 转换为 SSE 文本帧
+    """
+    start_time = time.time()
+    stage_latency = start_stage_breakdown()
+    ttft = None
+    answer_parts: List[str] = []
+    final_answer = ""
+    raw_contents: List[str] = []
+    sub_queries: List[str] = []
+    routes: List[str] = []
+    dropped_sources: List[str] = []
+
+    try:
+        # updates: 每个节点执行完后的增量状态；messages: 节点内部 LLM 的逐 token 输出
+        async for mode, chunk in app_graph.astream(
+            _build_initial_state(body),
+            config=_build_run_config(req_id, body),
+            stream_mode=["updates", "messages"]
+        ): # type: ignore
+            if mode == "messages":
+                message, meta = chunk
+                # 只转发生成节点的 token，路由/实体抽取等内部 LLM 调用不下发
+                if meta.get("langgraph_node") != "generate":
+                    continue
+                token = message.content if isinstance(message.content, str) else ""
+                if not token:
+                    continue
+                if ttft is None:
+                    ttft = round(time.time() - start_time, 3)
+                    logger.info(f"[{req_id}] 首 token 耗时 (TTFT): {ttft}s")
+                answer_parts.append(token)
+                yield _sse("token", {"content": token})
+                continue
+
+            for node_name, update in chunk.items():
+                # 没有状态更新的节点不下发
+                if not update:
+                    continue
+                if node_name == "generate":
+                    final_answer = update.get("final_answer", "")
+                    continue
+
+                event: Dict[str, Any] = {"node": node_name}
+                if "routes" in update:
+                    routes = update["routes"]
+                    event["routes"] = routes
+                if update.get("sub_queries"):
+                    sub_queries = update["sub_queries"]
+                    event["sub_queries"] = sub_queries
+                if update.get("dropped_sources"):
+                    dropped_sources.extend(update["dropped_sources"])
+                    event["dropped_sources"] = update["dropped_sources"]
+                if "retrieved_contents" in update:
+                    contents = update["retrieved_contents"]
+                    raw_contents.extend(contents)
+                    event["sources"] = [doc.model_dump() for doc in _parse_sources(contents)]
+                yield _sse("node", event)
+
+        # 无检索结果时生成节点直接返回兜底文案，没有 token 流，这里补发一次
+        answer = final_answer or "".join(answer_parts) or "抱歉，未能生成回答。"
+        if not answer_parts:
+            if ttft is None:
+                ttft = round(time.time() - start_time, 3)
+            yield _sse("token", {"content": answer})
+
+        structured_sources = _parse_sources(raw_contents)
+        latency = round(time.time() - start_time, 3)
+        logger.info(f"[{req_id}] 流式请求完成: latency={latency}s, ttft={ttft}s")
+        REQUEST_LATENCY.observe(latency, endpoint="chat_stream")
+        if ttft is not None:
+            TTFT.observe(ttft)
+
+        yield _sse("done", {
+            "answer": answer,
+            "sources": [doc.model_dump() for doc in structured_sources],
+            "latency": latency,
+            "ttft": ttft,
+            "stage_latency": dict(stage_latency),
+            "dropped_sources": sorted(set(dropped_sources)),
+            "reasoning_trace": _build_trace(
+                body.query, sub_queries, structured_sources, routes, stage_latency, sorted(set(dropped_sources))
+            )
+        })
+
+    except Exception as e:
+        logger.error(f"[{req_id}] 流式处理异常: {str(e)}", exc_info=True)
+        yield _sse("error", {"detail": f"Internal Server Error: {str(e)}"})
+    finally:
+        if on_finish is not None:
+            on_finish()
+
+
 # --- 辅助函数 ---
 
+def _build_initial_state(body: ChatRequest, vector_prefetch: Dict[str, List[str]] | None = None) -> Dict[str, Any]:
+    """
+    构造图初始状态，必须与 app/core/gprah.py 中的 AgentState 对应
+    """
+    return {
+        "original_query": body.query,
+        "sub_queries": [],
+        "retrieved_contents": [],
+        "final_answer": "",
+        "vector_prefetch": vector_prefetch or {},
+        "dropped_sources": []
+    }
+
+def _build_run_config(req_id: str, body: ChatRequest) -> RunnableConfig:
+    """
+    构造运行时配置，请求级开关通过 metadata 传递给各个 Node。
+    设置了延迟预算时下发检索截止时间 (epoch 秒)：
+    各检索源共享预算的前 (1 - generation_budget_ratio)，余下留给答案生成。
+    """
+    metadata: Dict[str, Any] = {
+        "top_k": body.top_k,
+        "enable_vector": body.enable_vector,
+        "enable_graph": body.enable_graph,
+        "enable_web": body.enable_web,
+        "vector_options": body.vector_options()
+    }
+
+    budget_ms = body.budget_ms or settings.default_budget_ms
+    if budget_ms:
+        budget = budget_ms / 1000
+        metadata["retrieval_deadline"] = time.time() + budget * (1 - settings.generation_budget_ratio)
+
+    return {
+        "configurable": {"thread_id": req_id},
+        "metadata": metadata
+    }
+
+def _build_response(
+    body: ChatRequest,
+    final_state: Dict[str, Any],
+    start_time: float,
+    stage_latency: Dict[str, float] | None = None
+) -> ChatResponse:
+    """
+    从图的最终状态提取回答、解析证据来源、构建推理轨迹并计算耗时
+    """
+    answer = final_state.get("final_answer", "抱歉，未能生成回答。")
+    raw_contents = final_state.get("retrieved_contents", [])
+    sub_queries = final_state.get("sub_queries", [])
+    routes = final_state.get("routes", [])
+    dropped_sources = sorted(set(final_state.get("dropped_sources", [])))
+    stage_latency = stage_latency or {}
+
+    # 解析证据来源
+    structured_sources = _parse_sources(raw_contents)
+
+    # 构建推理轨迹 (Reasoning Trace)
+    # 这里我们将图谱执行过程中的关键中间状态可视化给前端
+    trace = _build_trace(body.query, sub_queries, structured_sources, routes, stage_latency, dropped_sources)
+
+    latency = round(time.time() - start_time, 3)
+
+    return ChatResponse(
+        answer=answer,
+        sources=structured_sources,
+        latency=latency,
+        reasoning_trace=trace,
+        stage_latency=stage_latency,
+        dropped_sources=dropped_sources
+    )
+
+def _admitted(priority: str | None):
+    """
+    priority 为 None 时不经过准入控制 (脚本直接调用批量入口)
+    """
+    return chat_admission.slot(priority) if priority is not None else nullcontext()
+
+def _request_priority(request: Request, default: str = DEFAULT_PRIORITY) -> str:
+    """
+    从请求头 X-Request-Priority 读取优先级类别 (interactive / batch)
+    """
+    return request.headers.get("X-Request-Priority", default).strip().lower()
+
+async def _check_filters(bodies: List[ChatRequest]):
+    """
+    过滤条件无法在当前集合上执行时直接返回 400，而不是放宽为不过滤的检索。
+    其他错误 (如 Milvus 暂时不可用) 不在这里拦截，交给检索节点按检索失败处理
+    """
+    for body in bodies:
+        if not (body.enable_vector and body.filters):
+            continue
+        try:
+            await run_in_threadpool(VectorStoreService.check_filters, body.vector_options()["filters"])
+        except UnsupportedFilterError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.warning(f"过滤条件校验失败，交给检索节点处理: {e}")
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    按 Server-Sent Events 协议格式化一帧
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 def _parse_sources(raw_contents: List[str]) -> List[SourceDocument]:
     """
     将 LangGraph 返回的字符串列表解析为结构化的 SourceDocument 对象。
@@ -135,29 +488,55 @@ def _parse_sources(raw_contents: List[str]) -> List[SourceDocument]:
         
     return parsed_docs
 
-def _build_trace(original_query: str, sub_queries: List[str], sources: List[SourceDocument]) -> List[str]:
+def _build_trace(
+    original_query: str,
+    sub_queries: List[str],
+    sources: List[SourceDocument],
+    routes: List[str] | None = None,
+    stage_latency: Dict[str, float] | None = None,
+    dropped_sources: List[str] | None = None
+) -> List[str]:
     """
-    构建推理轨迹，告诉用户 Agent 做了什么
+    构建推理轨迹，告诉用户 Agent 做了什么 (附带各阶段实际耗时)
     """
+    routes = routes or []
+    stage_latency = stage_latency or {}
+
+    def _cost(stage: str) -> str:
+        return f" [{stage_latency[stage]:.2f}s]" if stage in stage_latency else ""
+
     trace = []
     trace.append(f"1. 接收问题: '{original_query}'")
-    
-    if sub_queries:
-        trace.append(f"2. 意图分解: 模型将其拆解为 {len(sub_queries)} 个子问题 -> {sub_queries}")
+
+    if routes:
+        trace.append(f"2. 路由决策: 选择数据源 {routes}{_cost('router_node')}")
     else:
-        trace.append("2. 意图分解: 保持原问题直接检索")
+        trace.append("2. 路由决策: 未获得路由结果")
+
+    if len(sub_queries) > 1:
+        trace.append(f"3. 意图分解: 模型将其拆解为 {len(sub_queries)} 个子问题 -> {sub_queries}")
+    else:
+        trace.append("3. 意图分解: 保持原问题直接检索")
         
-    # 统计来源分布
+    # 统计来源分布，并附上对应检索节点的耗时
     source_counts = {"vector": 0, "graph": 0, "web": 0, "unknown": 0}
     for s in sources:
         source_counts[s.source_type] = source_counts.get(s.source_type, 0) + 1
     
-    retrieval_summary = ", ".join([f"{k}={v}" for k, v in source_counts.items() if v > 0])
+    retrieval_summary = ", ".join([f"{k}={v}{_cost(f'{k}_search')}" for k, v in source_counts.items() if v > 0])
     if retrieval_summary:
-        trace.append(f"3. 多源检索: 执行并行检索，共获取 {len(sources)} 条证据 ({retrieval_summary})")
+        trace.append(f"4. 多源检索: 共获取 {len(sources)} 条证据 ({retrieval_summary})")
+    elif "generate" in routes:
+        trace.append("4. 多源检索: 闲聊问题，无需检索")
     else:
-        trace.append("3. 多源检索: 未找到相关信息")
-        
-    trace.append("4. 答案生成: 综合证据，生成最终回答")
+        trace.append("4. 多源检索: 未找到相关信息")
+
+    if dropped_sources:
+        trace.append(f"   ⚠️ 超出延迟预算，已放弃以下检索源: {dropped_sources}")
+
+    if "generate" in routes:
+        trace.append(f"5. 答案生成: 闲聊模式直接回答{_cost('generate')}")
+    else:
+        trace.append(f"5. 答案生成: 综合证据，生成最终回答{_cost('generate')}")
     
     return trace
\ No newline at end of file
@@ -0,0 +1,28 @@
+# app/api/routers/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.core.registry import get_registry
+
+router = APIRouter()
+
+@router.get("/healthz", summary="存活探针")
+async def healthz():
+    """
+    进程存活即返回 200，不检查下游依赖
+    """
+    return {"status": "ok"}
+
+@router.get("/readyz", summary="就绪探针")
+async def readyz():
+    """
+    必需组件 (Embedding / 向量库 / 重排序 / LLM) 全部预热成功才返回 200，否则 503；
+    关闭启动预热 (WARMUP_ON_STARTUP=false) 时组件懒加载，启动完成即返回 200；
+    可选组件 (Neo4j / 联网搜索) 的状态一并返回，失败时对应检索源降级
+    """
+    registry = get_registry()
+    body = {
+        "status": "ready" if registry.ready else "not_ready",
+        "components": registry.status,
+    }
+    return JSONResponse(body, status_code=200 if registry.ready else 503)
@@ -14,7 +14,12 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 # 3. 导入我们刚才写的向量库单例
-from app.core.vector import get_vector_store
+from app.core.vector import VectorStoreService
+# 入库近重复检测
+from app.core.dedup import get_dedup_index
+from app.core.config import settings
+# 新文档入库后语义答案缓存需要失效
+from app.core.answer_cache import invalidate_answer_cache
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +61,7 @@ def _process_and_insert(file_path: str, original_filename: str):
         # metadata 非常重要！以后我们可以根据 source 筛选特定的文件
         chunks = text_splitter.create_documents(
             [full_text], 
-            metadatas=[{"source": original_filename}]
+            metadatas=[{"source": original_filename, "doc_type": os.path.splitext(original_filename)[1].lstrip(".").lower()}]
         )
         
         logger.info(f"📦 切分完成，共生成 {len(chunks)} 个文本块。")
@@ -64,13 +69,24 @@ def _process_and_insert(file_path: str, original_filename: str):
         # --- 第三步：存入 Milvus ---
         logger.info(f"💾 [3/3] 正在写入 Milvus 数据库...")
         
-        vector_store = get_vector_store()
-        #这一步会自动调用 HuggingFace 模型把文本变成向量，然后存入 Milvus
-        vector_store.add_documents(chunks)
-        logger.info("向量入库成功")
+        # 同名文件重新上传时先删除旧版本的分块，避免重复证据
+        VectorStoreService.delete_by_source(original_filename)
+        try:
+            # 与判重范围内 (默认同一文件) 已入库内容或本文件前文近重复的分块不再编码、写入和抽取图谱
+            if settings.ingest_dedup_enabled:
+                chunks, _ = get_dedup_index().split(chunks)
+                if not chunks:
+                    logger.info(f"♻️ 文件 {original_filename} 的内容均已入库，跳过")
+                    return
+            # 多进程批量编码 (已编码过的分块直接读缓存)，然后一次写入 Milvus
+            VectorStoreService.add_documents_bulk(chunks)
+            logger.info("向量入库成功")
 
-        logger.info(f"⛏️ [4/4] 正在进行图谱抽取与存储...")
-        extract_and_store_graph(chunks)
+            logger.info(f"⛏️ [4/4] 正在进行图谱抽取与存储...")
+            extract_and_store_graph(chunks)
+        finally:
+            # 旧版本分块已删除 / 新分块已写入，无论图谱抽取是否成功，基于旧证据的缓存回答都需要失效
+            invalidate_answer_cache()
         
         logger.info(f"🎉 文件 {original_filename} 全部处理完成！")
 
@@ -0,0 +1,14 @@
+# app/api/routers/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Prometheus 指标")
+async def metrics_endpoint():
+    """
+    导出节点/后端耗时直方图、队列深度、缓存命中等指标 (Prometheus 文本格式)
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
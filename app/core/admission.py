@@ -0,0 +1,140 @@
+# app/core/admission.py
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import QUEUE_DEPTH, ACTIVE_REQUESTS, ADMISSION_REJECTED, track
+
+logger = logging.getLogger(__name__)
+
+# 优先级数值越小越先出队：交互式 (web_ui) 优先于批量评测脚本
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "batch": 1,
+}
+DEFAULT_PRIORITY = "interactive"
+
+
+class AdmissionRejected(Exception):
+    """
+    准入失败：等待队列已满 (429) 或排队超时 (503)，retry_after 为建议的重试间隔 (秒)
+    """
+    def __init__(self, status_code: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def to_http_exception(self) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail=self.reason,
+            headers={"Retry-After": str(self.retry_after)}
+        )
+
+
+class AdmissionController:
+    """
+    并发准入控制：最多 max_concurrency 个请求同时占用下游 (Ollama / 重排序模型)，
+    其余请求按优先级进入有界等待队列；队列满或排队超时直接拒绝，而不是无限堆积。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        # (优先级, 入队序号, future)；同优先级内先到先得
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        # 单个请求占用时长的指数滑动平均，用于估算 Retry-After
+        self._avg_service_time = 5.0
+
+        QUEUE_DEPTH.set_function(lambda: self.queue_depth, controller=name)
+        ACTIVE_REQUESTS.set_function(lambda: self._active, controller=name)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = DEFAULT_PRIORITY) -> AsyncIterator[None]:
+        with track("admission_wait"):
+            await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    async def acquire(self, priority: str = DEFAULT_PRIORITY):
+        """
+        获取一个执行名额，必要时排队。失败抛出 AdmissionRejected
+        """
+        if self._active < self.max_concurrency and self.queue_depth == 0:
+            self._active += 1
+            return
+
+        if self.queue_depth >= self.max_queue:
+            logger.warning(f"🚧 [{self.name}] 等待队列已满 ({self.max_queue})，拒绝请求")
+            ADMISSION_REJECTED.inc(controller=self.name, status="429")
+            raise AdmissionRejected(429, self._retry_after(), "服务繁忙，等待队列已满")
+
+        fut = asyncio.get_running_loop().create_future()
+        rank = PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES[DEFAULT_PRIORITY])
+        heapq.heappush(self._waiters, (rank, next(self._seq), fut))
+
+        try:
+            await asyncio.wait_for(fut, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # 超时与被唤醒可能同时发生：名额已经转交过来时要还回去
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"⏳ [{self.name}] 排队超过 {self.queue_timeout}s，拒绝请求")
+                ADMISSION_REJECTED.inc(controller=self.name, status="503")
+                raise AdmissionRejected(503, self._retry_after(), "服务繁忙，排队超时")
+            raise
+
+    def release(self, service_time: float | None = None):
+        """
+        归还名额：优先直接转交给队首等待者，没有等待者时才减少占用数
+        """
+        if service_time is not None:
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active = max(0, self._active - 1)
+
+    def _retry_after(self) -> int:
+        backlog = self.queue_depth + 1
+        return max(1, math.ceil(self._avg_service_time * backlog / self.max_concurrency))
+
+
+# 问答接口共用的准入控制器
+chat_admission = AdmissionController(
+    "ChatAdmission",
+    max_concurrency=settings.admission_max_concurrency,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout
+)
@@ -0,0 +1,249 @@
+# app/core/answer_cache.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+def _version_path() -> str:
+    return os.path.join(settings.working_dir, "knowledge_version")
+
+
+def knowledge_version() -> int:
+    """
+    知识库版本：版本文件的修改时间 (ns)，文件不存在时为 0。
+    入库进程 (服务本身或 tools/ingest_hotpotqa.py) 写入后，所有进程的缓存都能看到变化
+    """
+    try:
+        return os.stat(_version_path()).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def invalidate_answer_cache():
+    """
+    知识库 (向量 + 图谱) 发生变化时调用：更新版本文件，使所有进程中基于旧证据的缓存回答失效
+    """
+    path = _version_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, path)
+    if SemanticAnswerCache._instance is not None:
+        SemanticAnswerCache._instance.clear()
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：以 query 的 embedding 为键，余弦相似度超过阈值且请求选项一致时直接复用 ChatResponse。
+    - LRU：超过 max_entries 时淘汰最久未命中的条目
+    - TTL：条目写入超过 ttl 秒后视为过期
+    - 失效：条目属于写入时的知识库版本 (knowledge_version)，版本变化后整体清空
+    - 持久化：可选，向量以 float16 存入 .npz，其余字段以 JSON 存放；
+      写入后延迟 save_interval 秒在后台线程落盘，期间的多次写入合并为一次
+    """
+    _instance = None
+
+    def __init__(
+        self,
+        threshold: float,
+        max_entries: int,
+        ttl: float,
+        persist_path: Optional[str] = None,
+        save_interval: float = 5.0
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+        # entry_id -> {"vector": np.ndarray, "options": str, "query": str, "response": dict, "created_at": float}
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._version = knowledge_version()
+        # 入库任务在线程池里调用 clear()，需要加锁
+        self._lock = threading.Lock()
+        # 落盘：_save_lock 保证同一时刻只有一个写文件的线程，_save_timer 为待执行的延迟落盘
+        self._save_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+
+        if self.persist_path:
+            self._load()
+
+    @classmethod
+    def get_instance(cls) -> "SemanticAnswerCache":
+        if cls._instance is None:
+            cls._instance = cls(
+                threshold=settings.answer_cache_threshold,
+                max_entries=settings.answer_cache_max_entries,
+                ttl=settings.answer_cache_ttl,
+                persist_path=settings.answer_cache_path or None,
+                save_interval=settings.answer_cache_save_interval
+            )
+        return cls._instance
+
+    def lookup(self, vector: List[float], options: str) -> Optional[Dict[str, Any]]:
+        """
+        查找与 vector 最相似且 options 相同的缓存回答，未命中返回 None
+        """
+        query_vec = self._normalize(vector)
+        now = time.time()
+
+        with self._lock:
+            self._check_version()
+            self._evict_expired(now)
+            candidates = [(eid, e) for eid, e in self._entries.items() if e["options"] == options]
+            if not candidates:
+                CACHE_EVENTS.inc(cache="answer", result="miss")
+                return None
+
+            matrix = np.stack([e["vector"] for _, e in candidates]).astype(np.float32)
+            sims = matrix @ query_vec
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                CACHE_EVENTS.inc(cache="answer", result="miss")
+                return None
+
+            entry_id, entry = candidates[best]
+            self._entries.move_to_end(entry_id)
+            CACHE_EVENTS.inc(cache="answer", result="hit")
+            logger.info(f"🎯 [AnswerCache] 命中缓存 (sim={float(sims[best]):.3f}): {entry['query']}")
+            return entry["response"]
+
+    def store(
+        self, vector: List[float], options: str, query: str, response: Dict[str, Any], version: Optional[int] = None
+    ):
+        """
+        version 为生成回答前读取的 knowledge_version()：期间有新文档入库时，回答基于旧证据，不写入
+        """
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                return
+            self._entries[self._next_id] = {
+                "vector": self._normalize(vector).astype(np.float16),
+                "options": options,
+                "query": query,
+                "response": response,
+                "created_at": time.time()
+            }
+            self._next_id += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._schedule_save()
+
+    def clear(self):
+        """
+        知识库发生变化 (新文档入库) 时调用，避免返回基于旧证据的回答
+        """
+        with self._lock:
+            self._entries.clear()
+            self._version = knowledge_version()
+            self._schedule_save()
+        logger.info("🧹 [AnswerCache] 缓存已清空")
+
+    def flush(self):
+        """
+        立即落盘待写入的变更 (服务关闭时调用)
+        """
+        with self._lock:
+            if self._save_timer is None:
+                return
+            self._save_timer.cancel()
+        self._save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- 内部方法 ---
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _check_version(self):
+        # 调用方持有 self._lock
+        version = knowledge_version()
+        if version != self._version:
+            if self._entries:
+                logger.info("🧹 [AnswerCache] 知识库已更新，清空缓存")
+            self._entries.clear()
+            self._version = version
+            self._schedule_save()
+
+    def _schedule_save(self):
+        # 调用方持有 self._lock
+        if not self.persist_path or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(self.save_interval, self._save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _evict_expired(self, now: float):
+        if self.ttl <= 0:
+            return
+        expired = [eid for eid, e in self._entries.items() if now - e["created_at"] > self.ttl]
+        for eid in expired:
+            del self._entries[eid]
+
+    def _save(self):
+        # 锁内只取快照，序列化与写文件在锁外进行，不阻塞 lookup / store
+        with self._lock:
+            self._save_timer = None
+            entries = list(self._entries.values())
+            version = self._version
+        meta = [{k: v for k, v in e.items() if k != "vector"} for e in entries]
+        vectors = np.stack([e["vector"] for e in entries]) if entries else np.zeros((0, 0), dtype=np.float16)
+
+        try:
+            with self._save_lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True) # type: ignore
+                # 先写临时文件再替换，防止进程中断留下半截文件
+                tmp_path = f"{self.persist_path}.tmp.npz"
+                np.savez(
+                    tmp_path, vectors=vectors, version=np.array(version),
+                    meta=np.array(json.dumps(meta, ensure_ascii=False))
+                )
+                os.replace(tmp_path, self.persist_path) # type: ignore
+        except Exception as e:
+            logger.warning(f"⚠️ [AnswerCache] 缓存落盘失败: {e}")
+
+    def _load(self):
+        if not os.path.exists(self.persist_path): # type: ignore
+            return
+        try:
+            with np.load(self.persist_path) as data: # type: ignore
+                vectors = data["vectors"]
+                meta = json.loads(str(data["meta"]))
+                version = int(data["version"]) if "version" in data else None
+            if version != self._version:
+                # 缓存写入后知识库已更新 (或是未记录版本的旧文件)
+                logger.info("🧹 [AnswerCache] 磁盘缓存早于当前知识库版本，忽略")
+                return
+            for vec, e in zip(vectors, meta):
+                e["vector"] = vec
+                self._entries[self._next_id] = e
+                self._next_id += 1
+            self._evict_expired(time.time())
+            logger.info(f"📂 [AnswerCache] 已从磁盘加载 {len(self._entries)} 条缓存")
+        except Exception as e:
+            logger.warning(f"⚠️ [AnswerCache] 缓存文件加载失败，忽略: {e}")
+
+
+# 工厂函数
+def get_answer_cache() -> SemanticAnswerCache:
+    return SemanticAnswerCache.get_instance()
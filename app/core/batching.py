@@ -0,0 +1,26 @@
+# app/core/batching.py
+from typing import List, Sequence
+
+
+def plan_length_batches(lengths: Sequence[int], max_batch_tokens: int, max_batch_size: int) -> List[List[int]]:
+    """
+    按长度分桶装批：下标按长度降序排列后依次装箱，同一批内长度接近，padding 浪费最小。
+    每批的 (批内最长长度 x 批大小) 不超过 max_batch_tokens，批大小不超过 max_batch_size；
+    长序列批小、短序列批大，单批的 padding 后张量大小有上界。
+    返回每批在原序列中的下标
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    longest = 0
+    for idx in order:
+        if current and (len(current) + 1 > max_batch_size or longest * (len(current) + 1) > max_batch_tokens):
+            batches.append(current)
+            current = []
+        if not current:
+            # 降序排列，批内第一条就是最长的
+            longest = max(lengths[idx], 1)
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import Field
+from pydantic import Field, model_validator
 import os
 
 class Settings(BaseSettings):
@@ -22,6 +22,50 @@ class Settings(BaseSettings):
     debug_dump_dir: str = "outputs/debug_runs"
 
     embedding_model: str = "BAAI/bge-m3"
+    # 向量库后端：milvus (docker-compose 中的 Milvus 服务) / local (进程内索引，数据保存在 working_dir/local_vectors/<milvus_collection>)
+    vector_backend: str = Field("milvus", description="向量库后端: milvus / local")
+    local_vector_index: str = Field("flat", description="本地向量库索引类型: flat / hnsw (需要 hnswlib)")
+    local_vector_dtype: str = Field("float16", description="本地向量库的向量存储精度: float16 / float32")
+    # 二值量化初筛 (仅本地向量库)：常驻内存的只有 1 bit/维 的二值码，全精度向量留在磁盘上只为候选重打分读取。
+    # Milvus 集合没有二值向量字段，该组合在启动时直接报错，而不是悄悄按全精度检索
+    vector_quantization: str = Field("none", description="向量初筛方式: none (全精度) / binary (二值码 Hamming 初筛 + 全精度重打分)")
+    binary_rescore_factor: int = Field(4, description="二值初筛保留 search_k * factor 个候选交给全精度重打分")
+    # Milvus 连接与索引：索引参数只在集合首次创建时生效，修改索引类型需要重建集合 (见 tools/sweep_milvus_index.py)
+    milvus_uri: str = Field("http://localhost:19530", description="Milvus 地址 (也可以是 Milvus Lite 的本地 .db 文件路径)")
+    milvus_collection: str = Field("mineral_rag_collection", description="Milvus 集合名 (本地向量库、BM25 词法索引、去重索引也按它分目录)")
+    milvus_index_type: str = Field("HNSW", description="Milvus 索引类型: HNSW / IVF_FLAT / IVF_PQ / DISKANN / AUTOINDEX")
+    milvus_metric_type: str = Field("L2", description="Milvus 距离度量 (与已有集合保持一致，向量已归一化时 L2 与 IP 排序等价)")
+    milvus_index_params: Optional[Dict[str, Any]] = Field(None, description="索引构建参数，为空使用该索引类型的默认值 (如 HNSW 的 M / efConstruction)")
+    milvus_search_preset: str = Field("balanced", description="默认搜索档位: fast / balanced / accurate，请求可单独覆盖")
+    # 词法索引 (BM25)：入库时与向量库同步写入；hybrid_search 开启后向量与 BM25 候选经 RRF 融合再重排序，
+    # 矿物名、化学式等精确词更容易召回，粗排数量可以从 top_k * 10 降到 top_k * hybrid_search_k_factor
+    lexical_index_enabled: bool = True
+    hybrid_search: bool = Field(False, description="是否启用向量 + BM25 混合检索")
+    hybrid_search_k_factor: int = Field(5, description="混合检索时每路召回 top_k * factor 条候选")
+    rrf_k: int = Field(60, description="RRF 融合常数，越大各路排名差异的影响越平缓")
+    bm25_k1: float = Field(1.2, description="BM25 词频饱和参数")
+    bm25_b: float = Field(0.75, description="BM25 文档长度归一化参数")
+    # 入库近重复检测 (MinHash + LSH)：与已入库内容估计 Jaccard 相似度达到阈值的分块跳过编码、写入与图谱抽取
+    ingest_dedup_enabled: bool = True
+    dedup_threshold: float = Field(0.85, description="判为近重复的最小估计 Jaccard 相似度 (字符 5-gram)")
+    dedup_num_perm: int = Field(128, description="MinHash 签名长度")
+    dedup_bands: int = Field(16, description="LSH 分段数 (num_perm 需能被整除)，段越多候选召回越高")
+    # 被判为重复的分块不会入库：与原件的可过滤字段不同时，按这些字段过滤的检索会漏掉它。
+    # 默认只在可过滤字段都相同的分块之间判重；不使用过滤条件的部署可设为 [] 以全库判重
+    dedup_scope_fields: List[str] = Field(["source", "question_id", "doc_type"], description="只在这些字段取值相同的分块之间判重")
+
+    # Embedding 推理后端：torch (fp32) / int8 (torch 动态量化) / onnx (ONNX Runtime)
+    embedding_backend: str = Field("torch", description="Embedding 推理后端: torch / int8 / onnx")
+    embedding_onnx_file: Optional[str] = Field(None, description="onnx 后端加载的模型文件 (如 onnx/model_qint8_avx512_vnni.onnx)，为空使用默认导出")
+    embedding_threads: Optional[int] = Field(None, description="Embedding 推理的 intra-op 线程数，为空使用库默认值")
+    embedding_batch_size: int = Field(32, description="Embedding 编码批大小")
+    # 批量入库的多进程编码：进程数为空时取 CPU 核数 / 4；每批 (最长文本字符数 x 批大小) 不超过 batch_chars
+    ingest_embed_workers: Optional[int] = Field(None, description="入库编码进程数")
+    ingest_embed_batch_chars: int = Field(16000, description="入库编码单批的字符预算 (自适应批大小)")
+    ingest_embed_min_parallel: int = Field(64, description="少于该数量的文本不启用多进程，直接在当前进程编码")
+    # Embedding 缓存：文档向量按 (模型, 归一化, 文本哈希) 持久化到 working_dir/embedding_cache，查询向量走内存 LRU
+    embedding_cache_enabled: bool = True
+    embedding_query_cache_size: int = Field(1024, description="查询向量 LRU 条目上限")
     
     # =========================================================
     # 检索开关与参数 (对应 MRetrievalAgent 初始化逻辑)
@@ -34,6 +78,67 @@ class Settings(BaseSettings):
     top_k: int = 4            # 对应 config.top_k
     mode: str = "mix"         # 对应 config.mode (VectorRetrieval 使用)
     
+    # 批量问答 (/v1/chat/batch)：重排序每个前向的 (query, doc) 对数量、同时执行的图数量。
+    # 重排序的批大小只由两处决定：每次前向受 rerank_batch_size 与 rerank_batch_token_budget (分词后的真实 token) 约束；
+    # 批处理 worker 合并多个请求时的上限是 rerank_batch_max_forwards 倍的前向预算，按字符数估算 token
+    rerank_batch_size: int = Field(32, description="重排序模型单次前向的 pair 数量上限")
+    rerank_batch_token_budget: int = Field(8192, description="重排序单次前向的 token 预算 (批内最长序列 x 批大小)，<=0 时按 rerank_batch_size 顺序切批")
+    rerank_model: str = Field("BAAI/bge-reranker-base", description="重排序 (cross-encoder) 模型")
+    # 重排序分数缓存：热门问题、重叠的子问题会反复对同一批候选打分，键为 (模型, 归一化 query 哈希, 文档哈希)
+    rerank_cache_enabled: bool = True
+    rerank_cache_size: int = Field(20000, description="重排序分数 LRU 条目上限")
+    # 重排序批处理 worker：并发请求的 (query, doc) 对在时间窗内合并成一次打分调用
+    rerank_batching: bool = True
+    rerank_batch_window_ms: float = Field(5, description="收到第一个请求后等待其他请求加入的时间窗 (毫秒)")
+    rerank_batch_max_forwards: int = Field(2, description="单次合并的 token 上限，以 rerank_batch_token_budget 的倍数计 (合并后再按预算切成各次前向)")
+    batch_graph_concurrency: int = Field(4, description="批量接口同时执行的 LangGraph 数量")
+
+    # 语义答案缓存：相似问题 (余弦相似度 >= 阈值) 且请求选项一致时直接复用回答
+    answer_cache_enabled: bool = True
+    answer_cache_threshold: float = Field(0.95, description="命中缓存所需的最小余弦相似度")
+    answer_cache_max_entries: int = Field(512, description="缓存条目上限 (LRU 淘汰)")
+    answer_cache_ttl: float = Field(3600, description="缓存条目有效期 (秒)，<=0 表示不过期")
+    answer_cache_path: Optional[str] = Field(None, description="缓存持久化文件 (.npz)，为空则仅保存在内存")
+    answer_cache_save_interval: float = Field(5.0, description="缓存写入后延迟落盘的秒数，期间的多次写入合并为一次")
+
+    # 准入控制：同时执行的问答请求数上限、等待队列长度与排队超时 (秒)
+    admission_max_concurrency: int = Field(4, description="同时执行的问答请求数上限")
+    admission_max_queue: int = Field(32, description="等待队列长度上限，超出返回 429")
+    admission_queue_timeout: float = Field(60, description="排队超时 (秒)，超时返回 503")
+
+    # 端到端延迟预算：请求未指定 budget_ms 时使用 default_budget_ms (为空表示不限时)
+    default_budget_ms: Optional[int] = Field(None, description="默认延迟预算 (毫秒)")
+    generation_budget_ratio: float = Field(0.4, description="预算中预留给答案生成的比例，其余为检索时间片")
+    blocking_workers: int = Field(16, description="阻塞调用 (重排序 / Embedding / Neo4j) 线程池大小")
+    web_search_workers: int = Field(4, description="联网搜索专用线程池大小")
+    web_search_timeout: float = Field(5.0, description="DuckDuckGo 单次请求超时 (秒)")
+
+    # 问题分解：多跳问题拆成子问题并发检索
+    decompose_enabled: bool = Field(True, description="是否启用问题分解")
+    decompose_min_chars: int = Field(8, description="短于该长度的问题不分解")
+    max_sub_queries: int = Field(3, description="单个问题最多分解出的子问题数 (不含原问题)")
+    subquery_concurrency: int = Field(4, description="单个检索节点内同时检索的子问题数上限")
+
+    # 检索编排：fanout 同时启动所有路由选中的检索源；cascade 先做向量检索 + 重排序，
+    # 证据不足 (最高重排序分低于阈值或问题关键词覆盖率不足) 时才升级到图谱 / 联网检索
+    retrieval_mode: str = Field("fanout", description="检索编排模式: fanout / cascade")
+    cascade_score_threshold: float = Field(0.0, description="向量证据最高 rerank_score (logit) 达到该值才视为足够")
+    cascade_min_coverage: float = Field(0.6, description="问题关键词被向量证据覆盖的最小比例")
+
+    # 快速路由层：关键词规则 + Embedding 原型相似度，置信度不足时才调用路由 LLM。
+    # 阈值与间隔默认取 tools/calibrate_router.py 写入原型文件的推荐值；未校准时只启用关键词规则
+    router_fast_tier: bool = Field(True, description="是否启用快速路由层")
+    router_confidence_threshold: Optional[float] = Field(None, description="最相似数据源的原型相似度下限，为空则使用校准推荐值")
+    router_confidence_margin: Optional[float] = Field(None, description="最相似与次相似数据源的最小相似度差，为空则使用校准推荐值")
+    router_prototypes_path: Optional[str] = Field(None, description="校准后的路由原型文件 (.npz)，为空则使用内置示例")
+
+    # 投机检索：路由 LLM 决策期间提前启动这些检索源，路由未选中的结果丢弃并取消
+    speculative_retrieval: bool = Field(False, description="是否在路由决策的同时提前启动检索")
+    speculative_sources: List[str] = Field(["vector"], description="提前启动的检索源 (vector / graph)")
+
+    # 启动时构建并预热模型与连接 (关闭后首个请求会触发懒加载)
+    warmup_on_startup: bool = True
+
     # 选项列表 (SummaryAgent 需要 config.options)
     options: List[str] = ["A", "B", "C", "D", "E"]
     
@@ -48,6 +153,8 @@ class Settings(BaseSettings):
     neo4j_user: str = "neo4j"
     neo4j_password: str = "12345678"
     neo4j_db: str = "neo4j"
+    neo4j_timeout: float = Field(5.0, description="Neo4j 单个事务超时 (秒)，由服务端终止超时的查询")
+    neo4j_connection_timeout: float = Field(5.0, description="Neo4j 建立连接 / 从连接池获取连接的超时 (秒)")
     
     # 词表映射路径 (GraphRetrieval 可能用到)
     term_map_path: Optional[str] = None
@@ -63,5 +170,16 @@ class Settings(BaseSettings):
         extra="ignore"
     )
 
+    @model_validator(mode="after")
+    def _check_vector_quantization(self) -> "Settings":
+        if self.vector_quantization not in ("none", "binary"):
+            raise ValueError(f"不支持的 vector_quantization: {self.vector_quantization} (可选 none / binary)")
+        if self.vector_quantization == "binary" and self.vector_backend != "local":
+            raise ValueError(
+                f"vector_quantization=binary 只支持 local 向量库后端 (当前 vector_backend={self.vector_backend})，"
+                f"Milvus 集合没有二值向量字段，无法节省内存"
+            )
+        return self
+
 # 实例化单例
 settings = Settings() # type: ignore
\ No newline at end of file
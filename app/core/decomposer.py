@@ -0,0 +1,136 @@
+# app/core/decomposer.py
+import logging
+import re
+from typing import List
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_ollama import ChatOllama
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+from app.core.metrics import track
+from app.core.singleflight import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# 多跳问题的信号：比较 / 并列提问 / 桥接 (HotpotQA 以英文为主)。
+# 只用强信号：单独的 和 / 与 / and / or 在普通问题和闲聊里太常见，不作为信号。
+# 英文桥接只认名词后的关系从句 ("the woman who ...")；句首疑问词和介词后的 which ("in which year") 不算
+MULTI_HOP_PATTERN = re.compile(
+    r"哪个更|哪一个更|哪种更|相比|比较|区别|异同|分别|是否都|都是|同一"
+    r"|\b(both|either|neither|same|compare|compared|comparison|difference|than)\b"
+    r"|\b(?!(?:in|of|at|on|for|from|by|to|with|and|or)\b)[a-z]+\s+(who|whose|which|where)\s",
+    re.IGNORECASE
+)
+
+
+class SubQueries(BaseModel):
+    """
+    问题分解结果
+    """
+    sub_queries: List[str] = Field(
+        ...,
+        description="Self-contained sub-questions that together answer the original question, in the order they should be resolved."
+    )
+
+
+class QueryDecomposer:
+    """
+    多跳问题分解器：
+    1. 启发式门控：短的单跳问题直接返回原问题，不调用 LLM
+    2. 结构化输出：LLM 把问题拆成若干可独立检索的子问题
+    3. 去重：归一化后相同或高度重叠的子问题只保留一个；原问题始终排在第一位
+    """
+
+    def __init__(self):
+        self.llm = ChatOllama(
+            base_url="http://localhost:11434",
+            model=settings.llm_model_name,
+            temperature=0,
+        )
+        self.structured_llm = self.llm.with_structured_output(SubQueries)
+
+    def _build_chain(self):
+        system_prompt = """你是一个检索问题分解器。把用户的多跳问题拆成 2-{max_n} 个可以独立检索的子问题。
+
+        要求：
+        - 每个子问题必须自包含，不能出现"它"、"该矿物"这类指代，要写出具体名称。
+        - 桥接问题 (先找到 A，再问 A 的属性) 按解决顺序排列。
+        - 比较问题 (A 和 B 哪个更...) 为每个比较对象各生成一个子问题。
+        - 使用与原问题相同的语言。
+        - 如果问题本身就是单跳问题，只返回原问题。
+        """
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", system_prompt),
+            ("human", "{question}"),
+        ])
+        return prompt | self.structured_llm
+
+    @staticmethod
+    def needs_decomposition(query: str) -> bool:
+        """
+        启发式门控：过短的问题或没有多跳信号的问题不分解
+        """
+        if len(query) < settings.decompose_min_chars:
+            return False
+        return bool(MULTI_HOP_PATTERN.search(query))
+
+    def _finalize(self, query: str, sub_queries: List[str]) -> List[str]:
+        return dedupe_queries([query] + sub_queries)[: settings.max_sub_queries + 1]
+
+    def decompose(self, query: str) -> List[str]:
+        if not self.needs_decomposition(query):
+            return [query]
+        try:
+            with track("llm.decompose"):
+                result = self._build_chain().invoke({"question": query, "max_n": settings.max_sub_queries})
+            return self._finalize(query, result.sub_queries) # type: ignore
+        except Exception as e:
+            logger.error(f"问题分解失败，使用原问题: {e}")
+            return [query]
+
+    async def adecompose(self, query: str) -> List[str]:
+        """
+        decompose 的异步版本
+        """
+        if not self.needs_decomposition(query):
+            return [query]
+        try:
+            with track("llm.decompose"):
+                result = await self._build_chain().ainvoke({"question": query, "max_n": settings.max_sub_queries})
+            return self._finalize(query, result.sub_queries) # type: ignore
+        except Exception as e:
+            logger.error(f"问题分解失败，使用原问题: {e}")
+            return [query]
+
+
+def _terms(query: str) -> set:
+    normalized = normalize_query(query)
+    words = set(re.findall(r"[a-z0-9]+", normalized))
+    for run in re.findall(r"[\u4e00-\u9fff]+", normalized):
+        words.update(run[i:i + 2] for i in range(len(run) - 1))
+    return words
+
+
+def dedupe_queries(queries: List[str], overlap: float = 0.8) -> List[str]:
+    """
+    去掉归一化后相同、或与已保留问题词项 Jaccard 重叠 >= overlap 的子问题，保持原顺序
+    """
+    kept: List[str] = []
+    kept_terms: List[set] = []
+    for q in queries:
+        if not q.strip():
+            continue
+        terms = _terms(q)
+        duplicate = any(
+            (terms == t) or (terms and t and len(terms & t) / len(terms | t) >= overlap)
+            for t in kept_terms
+        )
+        if not duplicate:
+            kept.append(q)
+            kept_terms.append(terms)
+    return kept
+
+
+# 单例
+decomposer = QueryDecomposer()
@@ -0,0 +1,282 @@
+# app/core/dedup.py
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.core.search_filter import FILTER_FIELD_DEFAULTS
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_MASK32 = np.uint64(0xFFFFFFFF)
+# 签名行 meta 中记录的可过滤字段 (判重范围只能取自这些字段)
+_SCOPE_FIELDS = ("source", "question_id", "doc_type")
+
+
+def _normalize(text: str) -> str:
+    # 全角 / 半角、大小写、空白差异不影响判重
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+
+
+class MinHasher:
+    """
+    字符 n-gram 的 MinHash 签名：shingle 先用 crc32 映射到 32 位整数，
+    再用 num_perm 个 (a * x + b) mod 2^32 (a 为奇数，是 32 位整数上的置换) 取最小值。
+    两段文本签名相等位置的比例是其 shingle 集合 Jaccard 相似度的无偏估计。
+    字符级 shingle 对中英文都适用，不依赖分词
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = (rng.integers(0, 2 ** 31, size=(num_perm, 1), dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        text = _normalize(text)
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # uint64 乘法溢出只影响高 32 位，取低 32 位即 mod 2^32 的结果
+        return ((self._a * hashes + self._b) & _MASK32).min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    入库前的近重复检测 (MinHash + LSH)：与已入库内容或同批前文的估计 Jaccard 相似度
+    达到阈值的分块直接跳过，不再编码、写入 Milvus 或做图谱抽取。
+    签名分成 bands 段，任意一段完全相同即为候选，再用完整签名估计相似度确认。
+    scope_fields 非空时只在这些字段取值都相同的分块之间判重：被跳过的分块不会入库，
+    若它与原件的 source / question_id 不同，按这些字段过滤的检索就会漏掉这段证据
+    (例如 HotpotQA 不同问题共用同一段落时，只有第一个问题能检索到它)。
+    - signatures.bin：按行追加的 uint32 签名
+    - meta.jsonl：与签名行号对应的 {source, question_id, text_hash}，用于指明重复分块的原件
+    - deleted.json / manifest.json：墓碑与已提交行数，约定同 LocalVectorStore
+    """
+    _instance = None
+
+    def __init__(
+        self,
+        persist_dir: str,
+        threshold: float = 0.85,
+        num_perm: int = 128,
+        bands: int = 16,
+        scope_fields: Sequence[str] = ()
+    ):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须能被 bands ({bands}) 整除")
+        unknown = set(scope_fields) - set(_SCOPE_FIELDS)
+        if unknown:
+            raise ValueError(f"判重范围只能取 {list(_SCOPE_FIELDS)}，不支持 {sorted(unknown)}")
+        self.persist_dir = persist_dir
+        self.threshold = threshold
+        self.bands = bands
+        self.scope_fields = tuple(scope_fields)
+        self.hasher = MinHasher(num_perm)
+
+        self._signatures_path = os.path.join(persist_dir, "signatures.bin")
+        self._meta_path = os.path.join(persist_dir, "meta.jsonl")
+        self._deleted_path = os.path.join(persist_dir, "deleted.json")
+        self._manifest_path = os.path.join(persist_dir, "manifest.json")
+
+        self._signatures: List[np.ndarray] = []
+        self._meta: List[Dict[str, Any]] = []
+        # (段号, 段内容) -> [行号]
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self._deleted: set = set()
+        self._lock = threading.RLock()
+
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def get_instance(cls) -> "NearDuplicateIndex":
+        if cls._instance is None:
+            cls._instance = cls(
+                os.path.join(settings.working_dir, "dedup", settings.milvus_collection),
+                threshold=settings.dedup_threshold,
+                num_perm=settings.dedup_num_perm,
+                bands=settings.dedup_bands,
+                scope_fields=settings.dedup_scope_fields
+            )
+        return cls._instance
+
+    def __len__(self) -> int:
+        return len(self._meta) - len(self._deleted)
+
+    # --- 判重 ---
+
+    def split(self, documents: List[Document]) -> Tuple[List[Document], List[Tuple[Document, Dict[str, Any]]]]:
+        """
+        把分块分为 (需要入库的, [(重复分块, 原件 meta)])。同一批内后出现的近重复也会被剔除。
+        只做判断不写入：确认入库成功后再调用 add 登记，避免失败的入库让后续重试误判为重复
+        """
+        kept: List[Document] = []
+        duplicates: List[Tuple[Document, Dict[str, Any]]] = []
+        batch_buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        batch_signatures: List[np.ndarray] = []
+        batch_meta: List[Dict[str, Any]] = []
+
+        with self._lock:
+            for doc in documents:
+                signature = self.hasher.signature(doc.page_content)
+                keys = self._band_keys(signature)
+                row = self._describe(doc)
+                scope = self._scope(row)
+
+                original = self._match(signature, keys, scope, self._buckets, self._signatures, self._meta, self._deleted)
+                if original is not None:
+                    duplicates.append((doc, self._meta[original]))
+                    continue
+                original = self._match(signature, keys, scope, batch_buckets, batch_signatures, batch_meta, set())
+                if original is not None:
+                    duplicates.append((doc, batch_meta[original]))
+                    continue
+
+                for key in keys:
+                    batch_buckets.setdefault(key, []).append(len(kept))
+                batch_signatures.append(signature)
+                batch_meta.append(row)
+                kept.append(doc)
+
+        if duplicates:
+            logger.info(f"♻️ [Dedup] {len(documents)} 个分块中有 {len(duplicates)} 个近重复，已跳过")
+        return kept, duplicates
+
+    # --- 写入 ---
+
+    def add(self, documents: List[Document]):
+        """
+        登记已入库分块的签名
+        """
+        if not documents:
+            return
+        signatures = np.stack([self.hasher.signature(doc.page_content) for doc in documents])
+        rows = [self._describe(doc) for doc in documents]
+        with self._lock:
+            with open(self._signatures_path, "ab") as f:
+                f.write(signatures.tobytes())
+            with open(self._meta_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+            for signature, row in zip(signatures, rows):
+                self._index(signature, row)
+            self._write_manifest()
+
+    def delete_by_source(self, source: str) -> int:
+        """
+        删除某个源文件的签名 (重新上传同一文件时，旧版本不应让新版本被判为重复)
+        """
+        with self._lock:
+            rows = [
+                row for row, m in enumerate(self._meta)
+                if row not in self._deleted and m.get("source") == source
+            ]
+            if rows:
+                self._deleted.update(rows)
+                with open(self._deleted_path, "w", encoding="utf-8") as f:
+                    json.dump(sorted(self._deleted), f)
+        return len(rows)
+
+    # --- 内部方法 ---
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(i, band.tobytes()) for i, band in enumerate(np.split(signature, self.bands))]
+
+    def _scope(self, row: Dict[str, Any]) -> tuple:
+        # 早期登记的行缺少字段或记为 None，按缺省值比较
+        return tuple(
+            FILTER_FIELD_DEFAULTS[field] if row.get(field) is None else row[field]
+            for field in self.scope_fields
+        )
+
+    def _match(
+        self,
+        signature: np.ndarray,
+        keys: List[Tuple[int, bytes]],
+        scope: tuple,
+        buckets: Dict[Tuple[int, bytes], List[int]],
+        signatures: List[np.ndarray],
+        meta: List[Dict[str, Any]],
+        deleted: set
+    ) -> Optional[int]:
+        """
+        返回同一判重范围内估计 Jaccard 相似度最高且达到阈值的候选行号
+        """
+        candidates = {
+            row for key in keys for row in buckets.get(key, ())
+            if row not in deleted and self._scope(meta[row]) == scope
+        }
+        best, best_score = None, self.threshold
+        for row in candidates:
+            score = float(np.mean(signatures[row] == signature))
+            if score >= best_score:
+                best, best_score = row, score
+        return best
+
+    @staticmethod
+    def _describe(doc: Document) -> Dict[str, Any]:
+        # 缺省值与入库时 normalize_metadata 补齐的一致，判重范围才能与库中的字段对上
+        row = {field: doc.metadata.get(field, FILTER_FIELD_DEFAULTS[field]) for field in _SCOPE_FIELDS}
+        row["text_hash"] = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+        return row
+
+    def _index(self, signature: np.ndarray, row: Dict[str, Any]):
+        idx = len(self._meta)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(idx)
+        self._signatures.append(signature)
+        self._meta.append(row)
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"num_perm": self.hasher.num_perm, "count": len(self._meta)}, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path):
+            return
+        with open(self._manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        count = manifest["count"]
+        if manifest["num_perm"] != self.hasher.num_perm:
+            # 签名长度变化后旧签名无法比较，从空索引开始
+            logger.warning(f"⚠️ [Dedup] 签名长度由 {manifest['num_perm']} 变为 {self.hasher.num_perm}，忽略已有签名")
+            return
+        if not count:
+            return
+
+        with open(self._meta_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for _, line in zip(range(count), f)]
+            uncommitted = bool(f.readline())
+        # 截掉 manifest 之后未提交的半截写入，保证后续追加的行号对齐
+        with open(self._signatures_path, "r+b") as f:
+            f.truncate(count * self.hasher.num_perm * 4)
+        if uncommitted:
+            tmp_path = f"{self._meta_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+            os.replace(tmp_path, self._meta_path)
+        signatures = np.fromfile(self._signatures_path, dtype=np.uint32, count=count * self.hasher.num_perm)
+        for signature, row in zip(signatures.reshape(count, self.hasher.num_perm), rows):
+            self._index(signature, row)
+        if os.path.exists(self._deleted_path):
+            with open(self._deleted_path, encoding="utf-8") as f:
+                self._deleted = set(json.load(f))
+        logger.info(f"📂 [Dedup] 已加载 {len(self)} 条分块签名")
+
+
+# 工厂函数
+def get_dedup_index() -> NearDuplicateIndex:
+    return NearDuplicateIndex.get_instance()
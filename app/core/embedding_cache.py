@@ -0,0 +1,240 @@
+# app/core/embedding_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有 flock，只支持单进程写入
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+_DIGEST_SIZE = 20  # sha1
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    内容寻址的 Embedding 缓存，包裹任意 LangChain Embeddings：
+    - 键：sha1(命名空间 + 文本)，命名空间由模型名、是否归一化等决定，换模型不会串用旧向量
+    - 文档向量持久化：vectors.f16 (float16 追加写，读取时 mmap) + keys.bin (与行号一一对应的 sha1 摘要)
+    - 查询向量：进程内 LRU，不落盘
+    重新入库同一文件或重跑 HotpotQA 入库时，已编码过的分块直接从磁盘读取。
+    多进程共享：服务与 tools/ingest_hotpotqa.py 可能同时读写同一目录。写入持有 lock 文件的排他 flock，
+    读取前持共享锁增量加载其他进程追加的键；行号始终以文件中已有的行数为准，而不是本进程的计数
+    """
+
+    def __init__(self, inner: Embeddings, namespace: str, cache_dir: str, query_cache_size: int = 1024):
+        self.inner = inner
+        self.namespace = namespace
+        self.query_cache_size = query_cache_size
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha1(namespace.encode("utf-8")).hexdigest()[:16])
+
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.f16")
+        self._keys_path = os.path.join(self.cache_dir, "keys.bin")
+        self._meta_path = os.path.join(self.cache_dir, "meta.json")
+        self._lock_path = os.path.join(self.cache_dir, "lock")
+
+        self._dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._mmap: Optional[np.memmap] = None
+        # keys.bin 中已加载到 _index 的行数 (含本进程与其他进程写入的)
+        self._rows = 0
+        self._query_lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        # 入库线程与检索线程会同时访问
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    # --- LangChain Embeddings 接口 ---
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with(texts, self.inner.embed_documents)
+
+    def embed_documents_with(
+        self, texts: List[str], encode: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        与 embed_documents 相同，但未命中的文本交给 encode 编码 (例如多进程批量入库编码器)。
+        encode 必须与被包裹的模型产生相同的向量。
+        """
+        if not texts:
+            return []
+
+        keys = [self._key(t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+
+        # 1. 命中磁盘缓存的直接读取 (先加载其他进程新追加的键)
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._refresh()
+            for i, key in enumerate(keys):
+                row = self._index.get(key)
+                if row is not None:
+                    results[i] = self._read_row(row)
+
+        # 2. 未命中的文本去重后一次性编码
+        missing: Dict[bytes, str] = {}
+        for key, text, vec in zip(keys, texts, results):
+            if vec is None and key not in missing:
+                missing[key] = text
+        CACHE_EVENTS.inc(len(texts) - sum(1 for v in results if v is None), cache="embedding", result="hit")
+        CACHE_EVENTS.inc(sum(1 for v in results if v is None), cache="embedding", result="miss")
+
+        if missing:
+            fresh = encode(list(missing.values()))
+            fresh_by_key = dict(zip(missing.keys(), fresh))
+            self._append(fresh_by_key)
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = list(fresh_by_key[key])
+
+        return results # type: ignore
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vec = self._query_lru.get(text)
+            if vec is not None:
+                self._query_lru.move_to_end(text)
+                CACHE_EVENTS.inc(cache="query_embedding", result="hit")
+                return vec
+
+        CACHE_EVENTS.inc(cache="query_embedding", result="miss")
+        vec = self.inner.embed_query(text)
+        with self._lock:
+            self._query_lru[text] = vec
+            while len(self._query_lru) > self.query_cache_size:
+                self._query_lru.popitem(last=False)
+        return vec
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量查询编码：走查询 LRU，未命中的一次批量编码，不写入磁盘文档缓存
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            for i, text in enumerate(texts):
+                vec = self._query_lru.get(text)
+                if vec is not None:
+                    self._query_lru.move_to_end(text)
+                    results[i] = vec
+        missing = list(dict.fromkeys(t for t, v in zip(texts, results) if v is None))
+        CACHE_EVENTS.inc(len(texts) - sum(1 for v in results if v is None), cache="query_embedding", result="hit")
+        CACHE_EVENTS.inc(sum(1 for v in results if v is None), cache="query_embedding", result="miss")
+
+        if missing:
+            fresh = dict(zip(missing, self.inner.embed_documents(missing)))
+            with self._lock:
+                for text, vec in fresh.items():
+                    self._query_lru[text] = vec
+                while len(self._query_lru) > self.query_cache_size:
+                    self._query_lru.popitem(last=False)
+            results = [v if v is not None else fresh[t] for t, v in zip(texts, results)]
+        return results # type: ignore
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # --- 内部方法 ---
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha1(f"{self.namespace}\x00{text}".encode("utf-8")).digest()
+
+    def _read_row(self, row: int) -> List[float]:
+        # 调用方持有 self._lock；映射只覆盖已加载的行，行数增加后重新映射
+        if self._mmap is None or self._mmap.shape[0] < self._rows:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(self._rows, self._dim))
+        return self._mmap[row].astype(np.float32).tolist()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """
+        跨进程文件锁 (flock)。同一进程内的线程由 self._lock 互斥，这里只处理进程之间
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """
+        增量加载其他进程追加的键。调用方持有 self._lock 与文件锁 (写入方持排他锁，读到的都是完整行)
+        """
+        if self._dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+        if not (os.path.exists(self._keys_path) and os.path.exists(self._vectors_path)):
+            return
+        row_bytes = self._dim * np.dtype(np.float16).itemsize # type: ignore
+        rows = min(os.path.getsize(self._keys_path) // _DIGEST_SIZE, os.path.getsize(self._vectors_path) // row_bytes)
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * _DIGEST_SIZE)
+            raw = f.read((rows - self._rows) * _DIGEST_SIZE)
+        for offset in range(rows - self._rows):
+            self._index.setdefault(raw[offset * _DIGEST_SIZE:(offset + 1) * _DIGEST_SIZE], self._rows + offset)
+        self._rows = rows
+
+    def _append(self, vectors: Dict[bytes, List[float]]):
+        with self._lock, self._file_lock(exclusive=True):
+            # 先加载其他进程在此期间追加的键：既避免重复写入，也让新行的行号接在文件末尾
+            self._refresh()
+            new = {k: v for k, v in vectors.items() if k not in self._index}
+            if not new:
+                return
+            matrix = np.asarray(list(new.values()), dtype=np.float16)
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"namespace": self.namespace, "dim": self._dim}, f, ensure_ascii=False)
+
+            # 先写向量再写键：进程中断时多出的向量行没有对应的键，加载时会被截掉
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new.keys()))
+
+            for offset, key in enumerate(new.keys()):
+                self._index[key] = self._rows + offset
+            self._rows += len(new)
+
+    def _load(self):
+        if not (os.path.exists(self._meta_path) and os.path.exists(self._keys_path)):
+            return
+        # 排他锁：截断时不能有其他进程正在追加
+        with self._file_lock(exclusive=True):
+            try:
+                self._refresh()
+
+                # 截掉中断写入留下的不完整部分，保证后续追加的行号对齐
+                row_bytes = self._dim * np.dtype(np.float16).itemsize # type: ignore
+                with open(self._keys_path, "r+b") as f:
+                    f.truncate(self._rows * _DIGEST_SIZE)
+                with open(self._vectors_path, "r+b") as f:
+                    f.truncate(self._rows * row_bytes)
+                logger.info(f"📂 [EmbeddingCache] 已加载 {self._rows} 条缓存向量 ({self.namespace})")
+            except Exception as e:
+                logger.warning(f"⚠️ [EmbeddingCache] 缓存加载失败，已重建: {e}")
+                self._dim, self._index, self._rows = None, {}, 0
+                for path in (self._vectors_path, self._keys_path, self._meta_path):
+                    if os.path.exists(path):
+                        os.remove(path)
@@ -0,0 +1,46 @@
+# app/core/executor.py
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# 有界线程池：承载没有异步客户端的阻塞调用 (重排序、Embedding、Neo4jGraph)，
+# 避免占满默认执行器或阻塞事件循环
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.blocking_workers,
+    thread_name_prefix="blocking"
+)
+
+# 联网搜索单独的小线程池：asyncio 侧超时只是放弃等待，线程里的 HTTP 请求仍会跑到客户端超时为止，
+# 卡住的 DuckDuckGo 请求只占用这里的线程，不会挤占 Embedding / 重排序 / Neo4j 的名额
+_web_executor = ThreadPoolExecutor(
+    max_workers=settings.web_search_workers,
+    thread_name_prefix="web"
+)
+
+
+async def _run_in(executor: Executor, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在有界线程池中执行阻塞函数并等待结果。
+    复制当前上下文，保证 LangGraph 回调与请求级耗时明细在线程中仍然可见。
+    注意: 等待方被取消 (预算超时) 后线程里的调用不会中断，调用方需要给客户端设置自身的超时。
+    """
+    return await _run_in(_blocking_executor, fn, *args, **kwargs)
+
+
+async def run_web(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    同 run_blocking，但在联网搜索专用线程池中执行
+    """
+    return await _run_in(_web_executor, fn, *args, **kwargs)
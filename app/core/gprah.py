@@ -1,17 +1,20 @@
 # app/core/graph.py
+import asyncio
 import operator
 import logging
-from typing import Annotated, List, TypedDict, Dict, Any
-from app.modules.retrieval.graph_retrieval import MineralGraphRetriever
+import re
+import time
+from typing import Annotated, List, TypedDict, Dict, Any, Optional, Awaitable, Callable, Tuple
 from langchain_core.runnables import RunnableConfig
-from langgraph.graph import StateGraph, END
-from app.modules.retrieval.vector_retrieval import MineralVectorRetriever
+from langgraph.graph import StateGraph, START, END
 # 导入配置单例
 from app.core.config import settings
-from app.modules.retrieval.web_retrieval import MineralWebRetriever
 # 导入现有的业务组件
 from app.modules.generation.answer_generator import generator
 from app.core.router import router
+from app.core.decomposer import decomposer, dedupe_queries
+from app.core.metrics import timed_node, SPECULATIVE_RETRIEVAL, CASCADE_DECISIONS
+from app.core.registry import get_registry
 # from legacy.vector_retrieval import VectorRetrieval
 # from legacy.graph_retrieval import GraphRetrieval
 
@@ -27,114 +30,288 @@ class AgentState(TypedDict):
     retrieved_contents: Annotated[List[str], operator.add]
     final_answer: str
     routes: List[str]
+    # 批量接口预先算好的向量证据: {query: [格式化后的证据, ...]}，命中的 query 不再重复检索
+    vector_prefetch: Dict[str, List[str]]
+    # 超出延迟预算而被放弃的检索源 (vector / graph / web)
+    dropped_sources: Annotated[List[str], operator.add]
+    # 级联模式：向量证据是否足以回答 (由 vector_search 写入)
+    evidence_sufficient: bool
 
-# --- 2. 初始化工具实例 ---
-# 我们利用全局 settings 初始化单例，避免每次请求都重新加载模型
-try:
-    logger.info("正在初始化 Graph 组件...")
-    _decompose_agent = DecomposeAgent(settings)
-    _summary_agent = SummaryAgent(settings)
-    
-    # 根据配置决定是否初始化检索器 (虽然这里初始化了，但在 Node 中我们会再次检查请求级开关)
-    # _vector_retriever = VectorRetrieval(settings)
-    # _graph_retriever = GraphRetrieval(settings)
-    logger.info("Graph 组件初始化完成")
-except Exception as e:
-    logger.error(f"Graph 组件初始化失败: {e}")
-    # 这里不抛出异常，允许服务启动，但在调用时可能会报错
-    _decompose_agent = None
-    _summary_agent = None
-    _vector_retriever = None
-    _graph_retriever = None
+def _retrieval_time_left(config: RunnableConfig) -> Optional[float]:
+    """
+    当前请求检索时间片的剩余秒数，未设置预算时返回 None
+    """
+    deadline = config.get("metadata", {}).get("retrieval_deadline")
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+async def _gather_within_budget(coros: List[Awaitable[Any]], config: RunnableConfig) -> Tuple[List[Any], bool]:
+    """
+    并发执行多个检索协程，受检索时间片约束。
+    返回 (与输入顺序一致的结果列表，未完成或出错的位置为 None, 是否发生超时)。
+    超时未完成的任务会被取消，已完成的结果照常保留。
+    注意: 取消只作用于协程；放进线程池的阻塞调用 (Neo4j / DuckDuckGo) 会继续运行到客户端超时。
+    """
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    if not tasks:
+        return [], False
+
+    remaining = _retrieval_time_left(config)
+    if remaining is not None and remaining <= 0:
+        for t in tasks:
+            t.cancel()
+        return [None] * len(tasks), True
+
+    done, pending = await asyncio.wait(tasks, timeout=remaining)
+    for t in pending:
+        t.cancel()
+
+    results = []
+    for t in tasks:
+        # 投机任务可能已在别处被取消，对已取消的任务调用 exception() 会抛出 CancelledError
+        if t in done and not t.cancelled() and t.exception() is None:
+            results.append(t.result())
+        else:
+            if t in done and not t.cancelled():
+                logger.error(f"检索出错: {t.exception()}")
+            results.append(None)
+    return results, bool(pending)
+
+# 投机检索任务: {thread_id: {"vector": Task, "graph": Task}}
+# node_router 在等待路由 LLM 的同时启动，对应检索节点直接等待其结果
+_speculative_tasks: Dict[str, Dict[str, "asyncio.Task"]] = {}
+
+def _thread_id(config: RunnableConfig) -> str:
+    return config.get("configurable", {}).get("thread_id", "N/A")
+
+def _start_speculative(state: AgentState, config: RunnableConfig) -> Dict[str, "asyncio.Task"]:
+    """
+    按 settings.speculative_sources 提前检索原问题 (跳过请求已关闭的检索源，
+    以及批量接口已预取过向量证据的原问题)
+    """
+    if not settings.speculative_retrieval:
+        return {}
+
+    meta = config.get("metadata", {})
+    query = state["original_query"]
+    prefetched = query in (state.get("vector_prefetch") or {})
+    tasks = {}
+    if ("vector" in settings.speculative_sources and not prefetched
+            and meta.get("enable_vector", True) is not False):
+        tasks["vector"] = asyncio.ensure_future(_vector_query(query, config))
+    if "graph" in settings.speculative_sources and meta.get("enable_graph", True) is not False:
+        tasks["graph"] = asyncio.ensure_future(_graph_query(query))
+    return tasks
+
+def _settle_speculative(tasks: Dict[str, "asyncio.Task"], next_nodes: List[str], config: RunnableConfig):
+    """
+    路由决策完成后：取消未被选中检索源的任务，其余登记给对应节点领取
+    """
+    accepted = {}
+    for source, task in tasks.items():
+        if f"{source}_search" in next_nodes:
+            accepted[source] = task
+        else:
+            task.cancel()
+            SPECULATIVE_RETRIEVAL.inc(source=source, result="discarded")
+    if accepted:
+        _speculative_tasks[_thread_id(config)] = accepted
+
+def _claim_speculative(source: str, config: RunnableConfig) -> Optional["asyncio.Task"]:
+    pending = _speculative_tasks.get(_thread_id(config))
+    if not pending or source not in pending:
+        return None
+    task = pending.pop(source)
+    if not pending:
+        _speculative_tasks.pop(_thread_id(config), None)
+    SPECULATIVE_RETRIEVAL.inc(source=source, result="used")
+    return task
+
+def _discard_speculative(config: RunnableConfig):
+    """
+    兜底清理：检索节点未领取的任务 (例如图执行中途出错) 在生成阶段取消
+    """
+    for source, task in _speculative_tasks.pop(_thread_id(config), {}).items():
+        task.cancel()
+        SPECULATIVE_RETRIEVAL.inc(source=source, result="discarded")
 
 # --- 3. 定义节点 (Nodes) ---
 
-def node_decompose(state: AgentState, config: RunnableConfig):
+async def _vector_query(query: str, config: RunnableConfig) -> List[str]:
+    """
+    单个问题的向量检索，返回格式化后的证据
+    """
+    metadata = config.get("metadata", {})
+    # 复用注册表中的检索器 (共享 Milvus 连接)，只按请求覆盖 top_k、ANN 搜索参数与过滤条件，粗排数量见 ComponentRegistry._search_k
+    retriever = get_registry().vector_retriever(metadata.get("top_k", 3), **metadata.get("vector_options", {}))
+    return _format_vector_docs(await retriever.ainvoke(query))
+
+async def _graph_query(query: str) -> List[str]:
+    """
+    单个问题的图谱检索，返回格式化后的证据
+    """
+    # 复用注册表中的检索器，不再每个请求新建 ChatOllama
+    retriever = get_registry().graph_retriever()
+    results = []
+    for doc in await retriever.ainvoke(query):
+        # 加上 [Graph Source] 标记
+        results.append(f"[Graph Source] (Entities: {doc.metadata.get('entities')})\nContent: {doc.page_content}")
+    return results
+
+async def _fan_out(
+    queries: List[str],
+    query_fn: Callable[[str], Awaitable[List[str]]],
+    config: RunnableConfig,
+    known: Dict[str, Any]
+) -> Tuple[List[str], bool]:
     """
-    节点：问题分解
+    子问题并发检索：
+    - known 中已有的问题 (批量预取的证据或投机检索任务) 直接复用
+    - 其余问题受 subquery_concurrency 限流，整体受检索时间片约束
+    - 不同子问题召回的相同证据只保留一份
+    返回 (证据列表, 是否超时)
+    """
+    semaphore = asyncio.Semaphore(settings.subquery_concurrency)
+
+    async def bounded(q: str) -> List[str]:
+        async with semaphore:
+            return await query_fn(q)
+
+    async def reuse(value: Any) -> List[str]:
+        return (await value) if isinstance(value, asyncio.Future) else value
+
+    coros = [reuse(known[q]) if q in known else bounded(q) for q in queries]
+    per_query, timed_out = await _gather_within_budget(coros, config)
+    return list(dict.fromkeys(e for evidence in per_query for e in evidence or [])), timed_out
+
+# --- 3. 定义节点 (Nodes) ---
+
+@timed_node("decompose")
+async def node_decompose(state: AgentState, config: RunnableConfig):
+    """
+    节点：问题分解 (在路由之后执行)。
+    路由没有选中任何检索源 (闲聊) 或单跳问题 (启发式门控) 直接放行，不调用 LLM；
+    不与路由 LLM 并行，避免在同一个 Ollama 实例上抢占、拖慢简单问题。子问题第一项始终是原问题
     """
     query = state["original_query"]
-    # 从 metadata 获取可能的 trace_id 用于日志
-    tid = config.get("configurable", {}).get("thread_id", "N/A")
-    logger.info(f"[{tid}] [Node: Decompose] 处理: {query}")
-    
-    if not _decompose_agent:
-        return {"sub_queries": [query]}
+    logger.info(f"[{_thread_id(config)}] [Node: Decompose] 处理: {query}")
 
-    try:
-        # 调用原有逻辑
-        sub_queries = _decompose_agent.decompose(query)
-        # 归一化为列表
-        if isinstance(sub_queries, str):
-            sub_queries = [sub_queries]
-        return {"sub_queries": sub_queries}
-    except Exception as e:
-        logger.error(f"分解失败: {e}")
+    if not settings.decompose_enabled or not any(r in ("vector", "graph", "web") for r in state.get("routes", [])):
         return {"sub_queries": [query]}
+    return {"sub_queries": await decomposer.adecompose(query)}
 
-def node_vector_search(state: AgentState, config: RunnableConfig):
+@timed_node("vector_search")
+async def node_vector_search(state: AgentState, config: RunnableConfig):
     """
-    节点：向量检索
+    节点：向量检索 (各子问题并发执行)
     """
     # 1. 获取运行时配置 (来自 API 请求)
     meta = config.get("metadata", {})
     # 默认为 True，除非显式设为 False
     if meta.get("enable_vector", True) is False: 
         return {"retrieved_contents": []}
-    # 获取动态参数
-    top_k = meta.get("top_k", 3)
-    # [修改点 2]: 实例化你的新检索器
-    # 思考：这里需要传哪些参数？提示：看你在 MineralVectorRetriever 里定义的 Field
-    retriever = MineralVectorRetriever(
-        top_k=top_k,
-        use_rerank=True,      # 默认开启重排序
-        search_k=top_k * 10   # 自动设定粗排数量
-    )
-
-    queries = state["sub_queries"]    
-    results = []
 
-    for q in queries:
-        docs = retriever.invoke(q)
-        for i, doc in enumerate(docs):
-            score = doc.metadata.get("rerank_score", 0)
-            # 构造字符串
-            formatted = f"[Vector Source] (Score:{score:.2f})\n Content:{doc.page_content}"
-            results.append(formatted)
-    return {"retrieved_contents": results}
+    queries = dedupe_queries(state["sub_queries"] or [state["original_query"]])
+    known: Dict[str, Any] = dict(state.get("vector_prefetch") or {})
+    # 路由阶段已投机启动的原问题检索直接等待其结果；批量预取的证据优先，不被覆盖
+    task = _claim_speculative("vector", config)
+    if task is not None:
+        if state["original_query"] in known:
+            task.cancel()
+        else:
+            known[state["original_query"]] = task
+
+    results, timed_out = await _fan_out(queries, lambda q: _vector_query(q, config), config, known)
 
+    # 超时：保留已完成子问题的证据，放弃剩余部分
+    dropped = ["vector"] if timed_out else []
+    if timed_out:
+        logger.warning("向量检索超出预算，未完成的子问题已丢弃")
+    update = {"retrieved_contents": results, "dropped_sources": dropped}
+    if settings.retrieval_mode == "cascade":
+        update["evidence_sufficient"] = _vector_evidence_sufficient(state["original_query"], results)
+    return update
 
-def node_graph_search(state: AgentState, config: RunnableConfig):
+
+def prefetch_vector_evidence(
+    queries: List[str],
+    top_k: int,
+    vector_options: Optional[Dict[str, Any]] = None
+) -> List[List[str]]:
+    """
+    批量接口使用：把多个 query 的向量检索合并为一次编码、一次 Milvus 搜索和共享的重排序微批，
+    结果放入各自的 state["vector_prefetch"]，node_vector_search 会直接复用。
+    vector_options 为这批请求共同的检索器覆盖项 (见 ChatRequest.vector_options)
+    """
+    retriever = get_registry().vector_retriever(top_k, **(vector_options or {}))
+    return [_format_vector_docs(docs) for docs in retriever.batch_retrieve(queries)]
+
+
+# 级联模式的证据评估
+_VECTOR_SCORE_PATTERN = re.compile(r"^\[Vector Source\] \(Score:(-?[\d.]+)\)")
+# 疑问词不计入关键词覆盖率
+_QUESTION_BIGRAMS = {"什么", "哪些", "哪个", "多少", "如何", "怎么", "怎样", "是否", "为什", "么是", "是什", "有哪", "有什", "请问"}
+
+def _query_terms(query: str) -> set:
     """
-    节点：图谱检索 (升级版)
+    问题关键词：英文单词 / 化学式 (>=2 字符) 与中文连续片段的二元组
+    """
+    terms = {w for w in re.findall(r"[A-Za-z0-9]+", query.lower()) if len(w) >= 2}
+    for run in re.findall(r"[\u4e00-\u9fff]+", query):
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms - _QUESTION_BIGRAMS
+
+def _vector_evidence_sufficient(query: str, results: List[str]) -> bool:
+    """
+    最高 rerank_score 达到阈值，且问题关键词被证据覆盖的比例达到 cascade_min_coverage
+    """
+    scores = [float(m.group(1)) for m in map(_VECTOR_SCORE_PATTERN.match, results) if m]
+    if not scores or max(scores) < settings.cascade_score_threshold:
+        return False
+
+    terms = _query_terms(query)
+    if not terms:
+        return True
+    evidence = "\n".join(results).lower()
+    coverage = sum(1 for t in terms if t in evidence) / len(terms)
+    return coverage >= settings.cascade_min_coverage
+
+def _format_vector_docs(docs) -> List[str]:
+    results = []
+    for doc in docs:
+        score = doc.metadata.get("rerank_score", 0)
+        # 构造字符串
+        formatted = f"[Vector Source] (Score:{score:.2f})\n Content:{doc.page_content}"
+        results.append(formatted)
+    return results
+
+
+@timed_node("graph_search")
+async def node_graph_search(state: AgentState, config: RunnableConfig):
+    """
+    节点：图谱检索 (升级版，各子问题并发执行)
     """
     #根据前端传入参数（通过RunnableConfig），决定是否启动图谱检索
     meta = config.get("metadata", {})
     if meta.get("enable_graph", True) is False:
         return {"retrieved_contents": []}
 
-    # 实例化检索器
-    retriever = MineralGraphRetriever(level=1)
-    
-    queries = state["sub_queries"]
-    results = []
-    
-    for q in queries:
-        try:
-            # 调用 invoke
-            docs = retriever.invoke(q)
-            
-            for doc in docs:
-                # 加上 [Graph Source] 标记
-                formatted = f"[Graph Source] (Entities: {doc.metadata.get('entities')})\nContent: {doc.page_content}"
-                results.append(formatted)
-                
-        except Exception as e:
-            logger.error(f"图谱检索出错: {e}")
-            
-    return {"retrieved_contents": results}
-
-def node_web_search(state: AgentState, config: RunnableConfig):
+    queries = dedupe_queries(state["sub_queries"] or [state["original_query"]])
+    known: Dict[str, Any] = {}
+    task = _claim_speculative("graph", config)
+    if task is not None:
+        known[state["original_query"]] = task
+
+    results, timed_out = await _fan_out(queries, _graph_query, config, known)
+
+    dropped = ["graph"] if timed_out else []
+    if timed_out:
+        logger.warning("图谱检索超出预算，已放弃等待 (后台查询由 neo4j_timeout 终止)")
+    return {"retrieved_contents": results, "dropped_sources": dropped}
+
+@timed_node("web_search")
+async def node_web_search(state: AgentState, config: RunnableConfig):
     """
     节点：联网检索
     """
@@ -143,8 +320,7 @@ def node_web_search(state: AgentState, config: RunnableConfig):
     if meta.get("enable_web", False) is False:
         return {"retrieved_contents": []}
 
-    # 实例化检索器
-    retriever = MineralWebRetriever(top_k=3)
+    retriever = get_registry().web_retriever()
     
     queries = state["sub_queries"]
     results = []
@@ -152,27 +328,29 @@ def node_web_search(state: AgentState, config: RunnableConfig):
     # 通常联网搜索只需要搜原始问题，或者第一个子问题
     # 搜太多会被封 IP，所以这里我们只搜第一个 query
     target_query = queries[0] if queries else state["original_query"]
-    
-    try:
-        # 调用 invoke
-        docs = retriever.invoke(target_query)
-        
-        for doc in docs:
-            # 格式化输出
-            formatted = f"[Web Source] ({doc.metadata.get('source')})\nContent: {doc.page_content}"
-            results.append(formatted)
-            
-    except Exception as e:
-        print(f"联网检索失败: {e}")
-            
-    return {"retrieved_contents": results}
+
+    # 带检索时间片，DuckDuckGo 偶尔会卡住几分钟
+    (docs,), timed_out = await _gather_within_budget([retriever.ainvoke(target_query)], config)
+    for doc in docs or []:
+        # 格式化输出
+        formatted = f"[Web Source] ({doc.metadata.get('source')})\nContent: {doc.page_content}"
+        results.append(formatted)
+
+    dropped = ["web"] if timed_out else []
+    if timed_out:
+        logger.warning("联网检索超出预算，已放弃等待 (后台请求由 web_search_timeout 终止)")
+    return {"retrieved_contents": results, "dropped_sources": dropped}
 
 # app/core/graph.py
 
-def node_generate(state: AgentState):
+@timed_node("generate")
+async def node_generate(state: AgentState, config: RunnableConfig):
     """
     节点：生成回答 (Final Synthesis)
+    config 会透传给生成链，/v1/chat/stream 依赖它实现逐 token 推送
     """
+    _discard_speculative(config)
+
     query = state["original_query"]
     contexts = state["retrieved_contents"]
     routes = state.get("routes", []) # 获取路由结果
@@ -181,7 +359,7 @@ def node_generate(state: AgentState):
     
     # 情况 1: 如果路由器明确说是 'generate' (闲聊)，直接走闲聊模式
     if "generate" in routes:
-        answer = generator.chitchat(query)
+        answer = await generator.achitchat(query, config=config)
         return {"final_answer": answer}
 
     # 情况 2: 如果路由器想查，但没查到东西 (Context 为空)
@@ -190,34 +368,51 @@ def node_generate(state: AgentState):
 
     # 情况 3: 有上下文，走 RAG 模式
     try:
-        answer = generator.generate(query, contexts)
+        answer = await generator.agenerate(query, contexts, config=config)
         return {"final_answer": answer}
         
     except Exception as e:
         return {"final_answer": f"生成过程中发生错误: {e}"}
     
-def node_router(state: AgentState):
+@timed_node("router_node")
+async def node_router(state: AgentState, config: RunnableConfig):
     """
-    第一站：分析用户意图
+    第一站：分析用户意图 (与问题分解并行)。
+    开启投机检索时，路由 LLM 决策期间向量 (及图谱) 检索已在并行执行
     """
     question = state["original_query"]
+    speculative = _start_speculative(state, config)
     # 调用路由器
-    decision = router.route(question)
+    try:
+        decision = await router.aroute(question)
+    except BaseException:
+        # 请求被取消等情况下不留下孤儿任务
+        for task in speculative.values():
+            task.cancel()
+        raise
+    if speculative:
+        # 级联模式下 route_decision 只给出向量检索，但升级时仍可能用到路由选中的图谱检索：
+        # 按路由选中的全部检索源登记，级联未升级时由生成阶段的 _discard_speculative 取消
+        if settings.retrieval_mode == "cascade":
+            next_nodes = [f"{r}_search" for r in decision]
+        else:
+            next_nodes = route_decision({"routes": decision}) # type: ignore
+        _settle_speculative(speculative, next_nodes, config)
     
-    # 这里的 sub_queries 暂时直接用原问题
-    # (如果保留之前的 Decompose 逻辑，可以把 Decompose 放在 Router 之后)
-    return {
-        "routes": decision, 
-        "sub_queries": [question] 
-    }
+    # 子问题由随后的 decompose 节点给出
+    return {"routes": decision}
 
 def route_decision(state: AgentState):
     """
     交通指挥官：根据 State 中的 routes 决定下一步去哪里
-    返回的是一个 list，LangGraph 会并发执行这些节点
+    返回的是一个 list，LangGraph 会并发执行这些节点。
+    级联模式下路由选中了向量检索时先只走向量检索，其余检索源由 cascade_decision 决定是否启动
     """
     routes = state["routes"]
     next_nodes = []
+
+    if settings.retrieval_mode == "cascade" and "vector" in routes:
+        return ["vector_search"]
     
     if "vector" in routes:
         next_nodes.append("vector_search")
@@ -232,6 +427,22 @@ def route_decision(state: AgentState):
         
     return next_nodes
 
+def cascade_decision(state: AgentState):
+    """
+    向量检索之后：fanout 模式直接汇聚到生成；
+    cascade 模式下证据足够、预算已耗尽或没有其他检索源时去生成，否则升级到路由选中的图谱 / 联网检索
+    """
+    if settings.retrieval_mode != "cascade":
+        return ["generate"]
+
+    escalate = [f"{r}_search" for r in ("graph", "web") if r in state.get("routes", [])]
+    if state.get("evidence_sufficient") or "vector" in state.get("dropped_sources", []) or not escalate:
+        CASCADE_DECISIONS.inc(result="stopped")
+        return ["generate"]
+
+    CASCADE_DECISIONS.inc(result="escalated")
+    return escalate
+
 # --- 4. 构建工作流 (Graph Construction) ---
 
 workflow = StateGraph(AgentState)
@@ -245,11 +456,12 @@ workflow.add_node("web_search", node_web_search) # 需要时取消注释
 workflow.add_node("generate", node_generate)
 
 # 定义流程
-# 1. 设置起点
-workflow.set_entry_point("router_node")
+# 1. 设置起点：先路由 (期间投机检索已在进行)，选中检索源时再做问题分解
+workflow.add_edge(START, "router_node")
+workflow.add_edge("router_node", "decompose")
 # 2. 设置条件边
 workflow.add_conditional_edges(
-    "router_node",
+    "decompose",
     route_decision,
     # 映射字典 (可选，但写上更规范)
     {
@@ -260,8 +472,18 @@ workflow.add_conditional_edges(
     }
 )
 
+# 3. 向量检索之后：汇聚到生成，或在级联模式下按证据质量升级到图谱 / 联网检索
+workflow.add_conditional_edges(
+    "vector_search",
+    cascade_decision,
+    {
+        "graph_search": "graph_search",
+        "web_search": "web_search",
+        "generate": "generate"
+    }
+)
+
 # 4. 汇聚 (检索节点 -> 生成节点)
-workflow.add_edge("vector_search", "generate")
 workflow.add_edge("graph_search", "generate")
 workflow.add_edge("web_search", "generate")
 
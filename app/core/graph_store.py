@@ -7,6 +7,7 @@ logger = logging.getLogger(__name__)
 
 class GraphStoreService:
     _instance = None
+    _query_instance = None
 
     @classmethod
     def get_instance(cls) -> Neo4jGraph:
@@ -26,11 +27,39 @@ class GraphStoreService:
             except Exception as e:
                 logger.error(f"Neo4j连接失败:{e}")
                 raise e
-            
+
         return cls._instance
-    
+
+    @classmethod
+    def get_query_instance(cls) -> Neo4jGraph:
+        """
+        检索专用连接：在线程池中执行，预算超时后线程不会被中断，
+        靠事务超时 (服务端终止查询) 与连接超时保证卡住的查询最终释放线程。
+        图谱抽取的批量写入可能超过该超时，继续使用 get_instance
+        """
+        if cls._query_instance is None:
+            try:
+                cls._query_instance = Neo4jGraph(
+                    url=settings.neo4j_uri,
+                    username=settings.neo4j_user,
+                    password=settings.neo4j_password,
+                    timeout=settings.neo4j_timeout,
+                    refresh_schema=False,
+                    driver_config={
+                        "connection_timeout": settings.neo4j_connection_timeout,
+                        "connection_acquisition_timeout": settings.neo4j_connection_timeout,
+                    }
+                )
+            except Exception as e:
+                logger.error(f"Neo4j连接失败:{e}")
+                raise e
+
+        return cls._query_instance
+
 # 工厂函数
 def get_graph_store() -> Neo4jGraph:
     return GraphStoreService.get_instance()
 
-    
\ No newline at end of file
+def get_graph_query_store() -> Neo4jGraph:
+    return GraphStoreService.get_query_instance()
+
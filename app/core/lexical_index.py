@@ -0,0 +1,267 @@
+# app/core/lexical_index.py
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 英文单词 / 化学式 (SiO2、FeS2 作为整体)、数字、连续中文片段
+_TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9]*|\d+(?:\.\d+)?|[\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 分词：NFKC 归一化 (FeS₂ -> FeS2、全角 -> 半角) 后，英文与化学式按整词小写，
+    中文切成重叠二元组 (单字片段保留单字)，不依赖中文分词词典
+    """
+    tokens: List[str] = []
+    for piece in _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text)):
+        if "\u4e00" <= piece[0] <= "\u9fff":
+            if len(piece) == 1:
+                tokens.append(piece)
+            else:
+                tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+        else:
+            tokens.append(piece.lower())
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引，入库时与向量库同步写入，用于混合检索的词法召回：
+    矿物名、化学式这类需要精确匹配的词，稠密向量经常召回不到。
+    - docs.jsonl：按行追加的 {text, metadata}，行号即文档号
+    - deleted.json：已删除文档号 (墓碑)
+    - manifest.json：已提交行数，中断写入时以它为准
+    倒排表只在内存中，启动时由 docs.jsonl 重建。
+    """
+    _instance = None
+
+    def __init__(self, persist_dir: str, k1: float = 1.2, b: float = 0.75):
+        self.persist_dir = persist_dir
+        self.k1 = k1
+        self.b = b
+
+        self._docs_path = os.path.join(persist_dir, "docs.jsonl")
+        self._deleted_path = os.path.join(persist_dir, "deleted.json")
+        self._manifest_path = os.path.join(persist_dir, "manifest.json")
+
+        self._docs: List[Dict[str, Any]] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        # 词 -> ([文档号], [词频])；检索时转成 numpy 数组并缓存，写入时失效
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._length_array: Optional[np.ndarray] = None
+        self._deleted: set = set()
+        self._lock = threading.RLock()
+
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def get_instance(cls) -> "LexicalIndex":
+        if cls._instance is None:
+            persist_dir = os.path.join(settings.working_dir, "lexical_index", settings.milvus_collection)
+            cls._instance = cls(persist_dir, k1=settings.bm25_k1, b=settings.bm25_b)
+        return cls._instance
+
+    def __len__(self) -> int:
+        return len(self._docs) - len(self._deleted)
+
+    # --- 写入 ---
+
+    def add(self, texts: List[str], metadatas: Optional[List[dict]] = None):
+        if not texts:
+            return
+        metadatas = metadatas or [{} for _ in texts]
+        rows = [{"text": t, "metadata": m} for t, m in zip(texts, metadatas)]
+        with self._lock:
+            with open(self._docs_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows)
+            for row in rows:
+                self._index(row)
+            self._write_manifest()
+
+    def delete_by_source(self, source: str) -> int:
+        """
+        删除某个源文件的全部分块 (标记墓碑)，返回删除数量
+        """
+        with self._lock:
+            rows = [
+                doc_id for doc_id, d in enumerate(self._docs)
+                if doc_id not in self._deleted and d["metadata"].get("source") == source
+            ]
+            if rows:
+                self._deleted.update(rows)
+                with open(self._deleted_path, "w", encoding="utf-8") as f:
+                    json.dump(sorted(self._deleted), f)
+                # 墓碑超过一半时压缩
+                if len(self._deleted) * 2 > len(self._docs):
+                    self.compact()
+        return len(rows)
+
+    def compact(self):
+        """
+        重写 docs.jsonl，物理删除墓碑并重建倒排表
+        """
+        with self._lock:
+            rows = [d for doc_id, d in enumerate(self._docs) if doc_id not in self._deleted]
+            tmp_path = f"{self._docs_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows)
+            os.replace(tmp_path, self._docs_path)
+            if os.path.exists(self._deleted_path):
+                os.remove(self._deleted_path)
+
+            self._reset()
+            for row in rows:
+                self._index(row)
+            self._write_manifest()
+            logger.info(f"🗜️ [Lexical] 压缩完成，剩余 {len(self._docs)} 条")
+
+    # --- 检索 ---
+
+    def search(
+        self, query: str, k: int, predicate: Optional[Callable[[dict], bool]] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        返回 BM25 得分最高的 k 个 (文档, 得分)；predicate 作用于文档 metadata，只对有得分的候选求值
+        """
+        terms = set(tokenize(query))
+        # 锁内只取快照，打分在锁外进行，入库写入与并发检索不会排在整个打分过程后面：
+        # 倒排 / 长度数组在写入时整体重建而不是原地修改，文档列表只追加 (compact 换成新列表)，墓碑复制一份
+        with self._lock:
+            n = len(self._docs)
+            if not terms or n == len(self._deleted):
+                return []
+            docs = self._docs
+            avg_length = self._total_length / n
+            lengths = self._lengths_array()
+            postings = [arrays for arrays in (self._term_arrays(term) for term in terms) if arrays is not None]
+            deleted = list(self._deleted)
+
+        scores = np.zeros(n, dtype=np.float32)
+        for doc_ids, tfs in postings:
+            idf = math.log(1 + (n - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[doc_ids] / avg_length)
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        if deleted:
+            scores[deleted] = 0
+
+        candidates = np.flatnonzero(scores)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        results = []
+        for doc_id in candidates:
+            d = docs[doc_id]
+            if predicate is not None and not predicate(d["metadata"]):
+                continue
+            results.append((Document(page_content=d["text"], metadata=dict(d["metadata"])), float(scores[doc_id])))
+            if len(results) >= k:
+                break
+        return results
+
+    def batch_search(
+        self, queries: List[str], k: int, predicate: Optional[Callable[[dict], bool]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        return [self.search(query, k, predicate) for query in queries]
+
+    # --- 内部方法 ---
+
+    def _reset(self):
+        self._docs, self._lengths, self._total_length = [], [], 0
+        self._postings, self._arrays, self._length_array = {}, {}, None
+        self._deleted = set()
+
+    def _index(self, row: Dict[str, Any]):
+        doc_id = len(self._docs)
+        counts = Counter(tokenize(row["text"]))
+        for term, tf in counts.items():
+            posting = self._postings.setdefault(term, ([], []))
+            posting[0].append(doc_id)
+            posting[1].append(tf)
+            self._arrays.pop(term, None)
+        length = sum(counts.values())
+        self._docs.append(row)
+        self._lengths.append(length)
+        self._total_length += length
+        self._length_array = None
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self._postings.get(term)
+            if posting is None:
+                return None
+            arrays = (np.asarray(posting[0], dtype=np.int64), np.asarray(posting[1], dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def _lengths_array(self) -> np.ndarray:
+        if self._length_array is None:
+            self._length_array = np.asarray(self._lengths, dtype=np.float32)
+        return self._length_array
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"count": len(self._docs)}, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path):
+            return
+        with open(self._manifest_path, encoding="utf-8") as f:
+            count = json.load(f)["count"]
+        if not count:
+            return
+
+        start = time.perf_counter()
+        with open(self._docs_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for _, line in zip(range(count), f)]
+            uncommitted = bool(f.readline())
+        if uncommitted:
+            # 截掉 manifest 之后未提交的半截写入
+            tmp_path = f"{self._docs_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows)
+            os.replace(tmp_path, self._docs_path)
+
+        for row in rows:
+            self._index(row)
+        if os.path.exists(self._deleted_path):
+            with open(self._deleted_path, encoding="utf-8") as f:
+                self._deleted = set(json.load(f))
+        logger.info(f"📂 [Lexical] 已加载 {len(self)} 条文档，{len(self._postings)} 个词项 ({time.perf_counter() - start:.1f}s)")
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int = 60) -> List[Document]:
+    """
+    RRF 融合多路召回：文档得分为各路排名 r 的 1 / (k + r) 之和，按正文去重。
+    同一文档在多路出现时保留第一路 (向量) 的 Document 对象
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.__getitem__, reverse=True)]
+
+
+# 工厂函数
+def get_lexical_index() -> LexicalIndex:
+    return LexicalIndex.get_instance()
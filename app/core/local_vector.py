@@ -0,0 +1,457 @@
+# app/core/local_vector.py
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib 是可选依赖，缺失时退化为暴力检索
+    hnswlib = None
+
+# 暴力检索时每次参与矩阵乘法的行数，控制 float16 -> float32 转换的临时内存
+_SCAN_CHUNK = 65536
+
+# 逐字节 popcount：numpy >= 2.0 自带 bitwise_count，否则查表
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    _popcount = _POPCOUNT_TABLE.__getitem__
+
+
+class LocalVectorStore(VectorStore):
+    """
+    进程内向量库，Milvus 的单机替代 (单节点部署、CI 不需要 etcd / minio / Milvus)：
+    - vectors.bin：按行追加的向量 (float16 或 float32)，检索时 np.memmap 映射
+    - meta.jsonl：与向量行号一一对应的 {id, text, metadata}
+    - deleted.json：已删除行号 (墓碑)，删除比例过高时自动压缩
+    - manifest.json：维度、精度与已提交行数；写入顺序为 向量 -> 元数据 -> manifest，中断时以 manifest 为准
+    - 索引：flat (精确内积) 或 hnsw (需要 hnswlib，索引文件 hnsw.bin)
+    - codes.bin：可选的二值码 (每维取符号位，1024 维 = 128 字节)，首次二值检索时构建，之后随写入维护。
+      二值检索先在常驻内存的二值码上按 Hamming 距离初筛，再从 memmap 读取候选的全精度向量重打分，
+      全精度向量不必常驻内存
+    向量在写入前归一化，内积即余弦相似度。
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        persist_dir: str,
+        index_type: str = "flat",
+        dtype: str = "float16",
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+    ):
+        self.embedding_function = embedding_function
+        self.persist_dir = persist_dir
+        self.dtype = np.dtype(dtype)
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+
+        if index_type == "hnsw" and hnswlib is None:
+            logger.warning("⚠️ [LocalVector] 未安装 hnswlib，退化为 flat 暴力检索")
+            index_type = "flat"
+        self.index_type = index_type
+
+        self._vectors_path = os.path.join(persist_dir, "vectors.bin")
+        self._meta_path = os.path.join(persist_dir, "meta.jsonl")
+        self._deleted_path = os.path.join(persist_dir, "deleted.json")
+        self._manifest_path = os.path.join(persist_dir, "manifest.json")
+        self._hnsw_path = os.path.join(persist_dir, "hnsw.bin")
+        self._codes_path = os.path.join(persist_dir, "codes.bin")
+
+        self._dim: Optional[int] = None
+        self._meta: List[Dict[str, Any]] = []
+        self._deleted: set = set()
+        self._mmap: Optional[np.memmap] = None
+        self._hnsw = None
+        self._codes: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def __len__(self) -> int:
+        return len(self._meta) - len(self._deleted)
+
+    # --- 写入 ---
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas)
+
+    def add_embeddings(
+        self, texts: List[str], embeddings: List[List[float]], metadatas: Optional[List[dict]] = None, **kwargs: Any
+    ) -> List[str]:
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        ids = [uuid.uuid4().hex for _ in texts]
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+            start = len(self._meta)
+
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.astype(self.dtype).tobytes())
+            rows = [{"id": i, "text": t, "metadata": m} for i, t, m in zip(ids, texts, metadatas)]
+            with open(self._meta_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+            self._meta.extend(rows)
+            self._write_manifest()
+            self._mmap = None
+
+            if self._hnsw is not None or self.index_type == "hnsw":
+                self._hnsw_add(matrix, np.arange(start, start + len(texts)))
+                self._hnsw.save_index(self._hnsw_path) # type: ignore
+            if self._codes is not None:
+                codes = self._binarize(matrix)
+                with open(self._codes_path, "ab") as f:
+                    f.write(codes.tobytes())
+                self._codes = np.concatenate([self._codes, codes])
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        按 id 删除 (标记墓碑)
+        """
+        if not ids:
+            return False
+        targets = set(ids)
+        return self._delete_rows([row for row, m in enumerate(self._meta) if m["id"] in targets])
+
+    def delete_by_source(self, source: str) -> int:
+        """
+        删除某个源文件的全部分块，返回删除数量 (重新入库同一文件前调用)
+        """
+        rows = [row for row, m in enumerate(self._meta) if m["metadata"].get("source") == source]
+        self._delete_rows(rows)
+        return len(rows)
+
+    # --- 检索 ---
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.batch_search_with_score([self.embedding_function.embed_query(query)], k, **kwargs)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.batch_search_with_score([embedding], k, **kwargs)[0]]
+
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        # 纯 CPU 计算，放入有界线程池
+        return await run_blocking(self.similarity_search_by_vector, embedding, k, **kwargs)
+
+    def batch_similarity_search(self, vectors: List[List[float]], k: int, **kwargs: Any) -> List[List[Document]]:
+        return [[doc for doc, _ in hits] for hits in self.batch_search_with_score(vectors, k, **kwargs)]
+
+    def batch_search_with_score(
+        self,
+        vectors: List[List[float]],
+        k: int,
+        predicate: Optional[Callable[[dict], bool]] = None,
+        param: Optional[dict] = None,
+        binary_rescore: Optional[int] = None,
+        **kwargs: Any
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        多个查询向量一次检索，返回与 vectors 一一对应的 [(文档, 相似度), ...]。
+        predicate 作用于文档 metadata，为 False 的行不参与检索 (过滤下推，而不是检索后再过滤)；
+        param 与 Milvus 搜索参数同构，hnsw 索引只读取其中的 params.ef，其余参数忽略；
+        binary_rescore 非空时走二值码初筛 (保留 k * binary_rescore 个候选) + 全精度重打分
+        """
+        if not vectors or len(self) == 0:
+            return [[] for _ in vectors]
+
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            allowed = self._allowed_rows(predicate)
+            if binary_rescore:
+                rows, scores = self._binary_search(queries, k, allowed, binary_rescore)
+            elif self._hnsw is not None:
+                ef = ((param or {}).get("params") or {}).get("ef", self.hnsw_ef_search)
+                rows, scores = self._hnsw_search(queries, k, allowed, ef)
+            else:
+                rows, scores = self._flat_search(queries, k, allowed)
+
+            results = []
+            for q_rows, q_scores in zip(rows, scores):
+                results.append([(self._to_document(int(r)), float(s)) for r, s in zip(q_rows, q_scores) if r >= 0])
+        return results
+
+    @classmethod
+    def from_texts(
+        cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any
+    ) -> "LocalVectorStore":
+        store = cls(embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    # --- 内部方法 ---
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _vectors(self) -> np.ndarray:
+        if self._mmap is None:
+            self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(len(self._meta), self._dim))
+        return self._mmap
+
+    def _allowed_rows(self, predicate: Optional[Callable[[dict], bool]]) -> Optional[np.ndarray]:
+        """
+        可参与检索的行号掩码；没有删除也没有过滤条件时返回 None (全部可用)
+        """
+        if predicate is None and not self._deleted:
+            return None
+        mask = np.ones(len(self._meta), dtype=bool)
+        if self._deleted:
+            mask[list(self._deleted)] = False
+        if predicate is not None:
+            mask &= np.fromiter((predicate(m["metadata"]) for m in self._meta), dtype=bool, count=len(self._meta))
+        return mask
+
+    def _flat_search(self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = self._vectors()
+        n = len(self._meta)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+
+        for start in range(0, n, _SCAN_CHUNK):
+            chunk = np.asarray(vectors[start:start + _SCAN_CHUNK], dtype=np.float32)
+            scores = queries @ chunk.T
+            if allowed is not None:
+                scores[:, ~allowed[start:start + _SCAN_CHUNK]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(chunk)), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            # 只保留当前 top-k，避免拼接矩阵无限增长
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[~np.isfinite(best_scores)] = -1
+        return best_rows, best_scores
+
+    @staticmethod
+    def _binarize(matrix: np.ndarray) -> np.ndarray:
+        # 每维取符号位并按位打包：(n, dim) float -> (n, dim / 8) uint8
+        return np.packbits(matrix > 0, axis=1)
+
+    def _ensure_codes(self) -> np.ndarray:
+        """
+        加载或构建二值码 (常驻内存，大小为全精度 float16 向量的 1/16)
+        """
+        if self._codes is None:
+            count = len(self._meta)
+            width = (self._dim + 7) // 8 # type: ignore
+            if os.path.exists(self._codes_path) and os.path.getsize(self._codes_path) >= count * width:
+                codes = np.fromfile(self._codes_path, dtype=np.uint8, count=count * width).reshape(count, width)
+            else:
+                logger.info("🔨 [LocalVector] 正在构建二值码...")
+                vectors = self._vectors()
+                codes = np.concatenate([
+                    self._binarize(np.asarray(vectors[start:start + _SCAN_CHUNK], dtype=np.float32))
+                    for start in range(0, count, _SCAN_CHUNK)
+                ]) if count else np.zeros((0, width), dtype=np.uint8)
+            # 截掉中断写入留下的多余字节，保证之后追加的行对齐
+            codes.tofile(self._codes_path)
+            self._codes = codes
+        return self._codes
+
+    def _binary_search(
+        self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray], rescore: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Hamming 距离初筛 k * rescore 个候选，再用全精度内积重排取 top-k
+        """
+        codes = self._ensure_codes()
+        vectors = self._vectors()
+        query_codes = self._binarize(queries)
+        live = int(allowed.sum()) if allowed is not None else len(self)
+        shortlist = min(k * rescore, live)
+        k = min(k, shortlist)
+
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if k == 0:
+            return all_rows, all_scores
+        worst = codes.shape[1] * 8 + 1
+        for i, (query, query_code) in enumerate(zip(queries, query_codes)):
+            distances = np.empty(len(codes), dtype=np.int32)
+            for start in range(0, len(codes), _SCAN_CHUNK):
+                chunk = codes[start:start + _SCAN_CHUNK]
+                distances[start:start + len(chunk)] = _popcount(chunk ^ query_code).sum(axis=1, dtype=np.int32)
+            if allowed is not None:
+                distances[~allowed] = worst
+            candidates = np.argpartition(distances, shortlist - 1)[:shortlist]
+            # 按行号排序后再读 memmap，顺序访问磁盘页
+            candidates.sort()
+            scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+            top = np.argsort(-scores)[:k]
+            all_rows[i], all_scores[i] = candidates[top], scores[top]
+        return all_rows, all_scores
+
+    def _hnsw_add(self, matrix: np.ndarray, rows: np.ndarray):
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space="ip", dim=self._dim) # type: ignore
+            self._hnsw.init_index(max_elements=max(1024, len(rows) * 2), ef_construction=self.hnsw_ef_construction, M=self.hnsw_m)
+            self._hnsw.set_ef(self.hnsw_ef_search)
+        needed = self._hnsw.get_current_count() + len(rows)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(max(needed, self._hnsw.get_max_elements() * 2))
+        self._hnsw.add_items(matrix, rows)
+
+    def _hnsw_search(
+        self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray], ef: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        live = int(allowed.sum()) if allowed is not None else len(self)
+        k = min(k, live)
+        if k == 0:
+            return np.full((len(queries), 0), -1), np.zeros((len(queries), 0))
+        # 过滤条件较严格时 HNSW 图遍历很难凑够 k 个结果，直接在候选子集上暴力检索更快也更准
+        if allowed is not None and live < 10 * k:
+            return self._flat_search(queries, k, allowed)
+
+        row_filter = (lambda label: bool(allowed[label])) if allowed is not None else None
+        self._hnsw.set_ef(max(ef, k)) # type: ignore
+        try:
+            labels, distances = self._hnsw.knn_query(queries, k=k, filter=row_filter) # type: ignore
+        except RuntimeError:
+            # 图遍历凑不够 k 个结果 (大量墓碑时可能发生)
+            return self._flat_search(queries, k, allowed)
+        # ip 空间的距离为 1 - 内积
+        return labels.astype(np.int64), 1.0 - distances
+
+    def _delete_rows(self, rows: List[int]) -> bool:
+        if not rows:
+            return False
+        with self._lock:
+            self._deleted.update(rows)
+            if self._hnsw is not None:
+                for row in rows:
+                    try:
+                        self._hnsw.mark_deleted(row)
+                    except RuntimeError:
+                        pass  # 已经标记过
+            with open(self._deleted_path, "w", encoding="utf-8") as f:
+                json.dump(sorted(self._deleted), f)
+            # 墓碑超过一半时压缩，回收磁盘与扫描开销
+            if len(self._deleted) * 2 > len(self._meta):
+                self.compact()
+        return True
+
+    def compact(self):
+        """
+        重写存储文件，物理删除墓碑行并重建索引
+        """
+        with self._lock:
+            keep = [row for row in range(len(self._meta)) if row not in self._deleted]
+            vectors = np.asarray(self._vectors()[keep], dtype=np.float32) if keep else None
+            meta = [self._meta[row] for row in keep]
+            self._mmap = None
+
+            rebuild_codes = self._codes is not None
+            for path in (self._vectors_path, self._meta_path, self._deleted_path, self._hnsw_path, self._codes_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._meta, self._deleted, self._hnsw, self._codes = [], set(), None, None
+            if rebuild_codes:
+                # 空的二值码，随下面的 add_embeddings 重新写入
+                self._codes = np.zeros((0, (self._dim + 7) // 8), dtype=np.uint8) # type: ignore
+            if vectors is not None:
+                self.add_embeddings([m["text"] for m in meta], vectors.tolist(), [m["metadata"] for m in meta])
+                # add_embeddings 会生成新 id，这里恢复原 id
+                for row, m in enumerate(meta):
+                    self._meta[row]["id"] = m["id"]
+                self._rewrite_meta()
+            else:
+                self._write_manifest()
+            logger.info(f"🗜️ [LocalVector] 压缩完成，剩余 {len(self._meta)} 条")
+
+    def _rewrite_meta(self):
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in self._meta)
+        os.replace(tmp_path, self._meta_path)
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "dtype": self.dtype.name, "count": len(self._meta)}, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _to_document(self, row: int) -> Document:
+        m = self._meta[row]
+        return Document(page_content=m["text"], metadata={**m["metadata"], "pk": m["id"]})
+
+    def _load(self):
+        if not os.path.exists(self._manifest_path):
+            return
+        with open(self._manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._dim, count = manifest["dim"], manifest["count"]
+        self.dtype = np.dtype(manifest.get("dtype", self.dtype.name))
+        if not count:
+            return
+
+        with open(self._meta_path, encoding="utf-8") as f:
+            self._meta = [json.loads(line) for _, line in zip(range(count), f)]
+            uncommitted = bool(f.readline())
+        # 截掉 manifest 之后未提交的半截写入
+        with open(self._vectors_path, "r+b") as f:
+            f.truncate(count * self._dim * self.dtype.itemsize)
+        if uncommitted:
+            self._rewrite_meta()
+        if os.path.exists(self._deleted_path):
+            with open(self._deleted_path, encoding="utf-8") as f:
+                self._deleted = set(json.load(f))
+
+        if self.index_type == "hnsw":
+            self._load_hnsw()
+        logger.info(f"📂 [LocalVector] 已加载 {len(self)} 条向量 ({self.index_type}, {self.dtype.name})")
+
+    def _load_hnsw(self):
+        count = len(self._meta)
+        if os.path.exists(self._hnsw_path):
+            index = hnswlib.Index(space="ip", dim=self._dim) # type: ignore
+            index.load_index(self._hnsw_path, max_elements=max(1024, count * 2))
+            if index.get_current_count() == count:
+                index.set_ef(self.hnsw_ef_search)
+                self._hnsw = index
+                return
+        # 索引文件缺失或与数据不一致时从向量重建
+        logger.info("🔨 [LocalVector] 正在重建 HNSW 索引...")
+        self._hnsw = None
+        vectors = np.asarray(self._vectors(), dtype=np.float32)
+        self._hnsw_add(vectors, np.arange(count))
+        for row in self._deleted:
+            self._hnsw.mark_deleted(row) # type: ignore
+        self._hnsw.save_index(self._hnsw_path) # type: ignore
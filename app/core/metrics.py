@@ -0,0 +1,260 @@
+# app/core/metrics.py
+"""
+轻量级指标模块：Histogram / Counter / Gauge + Prometheus 文本格式导出 (/metrics)。
+
+除全局指标外，还维护一份"请求级耗时明细"：track() 记录的每个阶段耗时会累加到
+当前上下文 (contextvars) 的字典里，ChatResponse.stage_latency 即来源于此。
+LangGraph 执行节点时会复制上下文，复制后仍指向同一个字典，因此并行分支的耗时也能汇总回来。
+"""
+import asyncio
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 默认分桶 (秒)：覆盖毫秒级的向量检索到分钟级的 7B 生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(k, "")) for k in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels: str):
+        """
+        导出时才调用 fn 取值，适合队列深度这类随时变化的量
+        """
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, fn in functions.items():
+            values[key] = float(fn())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (各桶计数, 总和, 总数)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        lines = []
+        for key, (counts, total, n) in items:
+            for upper, count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % upper)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    以 Prometheus 文本格式 (0.0.4) 导出全部指标
+    """
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# =========================================================
+# 指标定义
+# =========================================================
+NODE_LATENCY = Histogram(
+    "mineralrag_node_latency_seconds", "LangGraph 节点耗时", ["node"]
+)
+BACKEND_LATENCY = Histogram(
+    "mineralrag_backend_latency_seconds", "后端调用耗时 (Milvus / 重排序 / Neo4j / LLM / Embedding)", ["backend"]
+)
+REQUEST_LATENCY = Histogram(
+    "mineralrag_request_latency_seconds", "接口端到端耗时", ["endpoint"]
+)
+TTFT = Histogram(
+    "mineralrag_ttft_seconds", "流式接口首 token 耗时"
+)
+CACHE_EVENTS = Counter(
+    "mineralrag_cache_events_total", "缓存命中/未命中次数", ["cache", "result"]
+)
+QUEUE_DEPTH = Gauge(
+    "mineralrag_admission_queue_depth", "准入控制等待队列长度", ["controller"]
+)
+ACTIVE_REQUESTS = Gauge(
+    "mineralrag_admission_active", "正在执行的请求数", ["controller"]
+)
+ADMISSION_REJECTED = Counter(
+    "mineralrag_admission_rejected_total", "准入控制拒绝次数", ["controller", "status"]
+)
+COALESCED_REQUESTS = Counter(
+    "mineralrag_coalesced_requests_total", "合并到进行中相同请求的次数", ["flight"]
+)
+ROUTER_DECISIONS = Counter(
+    "mineralrag_router_decisions_total", "各路由层 (keyword / embedding / llm / fallback) 做出的决策次数", ["tier"]
+)
+CASCADE_DECISIONS = Counter(
+    "mineralrag_cascade_decisions_total", "级联检索在向量检索后停止 (stopped) 或升级到图谱/联网 (escalated) 的次数", ["result"]
+)
+RERANK_BATCH_REQUESTS = Histogram(
+    "mineralrag_rerank_batch_requests", "重排序 worker 每次前向合并的调用数", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+SPECULATIVE_RETRIEVAL = Counter(
+    "mineralrag_speculative_retrieval_total", "投机检索结果被采用 (used) 或丢弃 (discarded) 的次数", ["source", "result"]
+)
+
+
+# =========================================================
+# 请求级耗时明细
+# =========================================================
+_stage_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_breakdown", default=None)
+# 并行分支可能在不同线程里同时累加同一份明细
+_breakdown_lock = threading.Lock()
+
+
+def start_stage_breakdown() -> Dict[str, float]:
+    """
+    在当前上下文开启一份新的耗时明细并返回它
+    """
+    breakdown: Dict[str, float] = {}
+    _stage_breakdown.set(breakdown)
+    return breakdown
+
+
+def _record(histogram: Histogram, label: str, name: str, elapsed: float):
+    histogram.observe(elapsed, **{label: name})
+    breakdown = _stage_breakdown.get()
+    if breakdown is not None:
+        # 同一阶段多次调用 (例如多个子问题各做一次重排序) 累加
+        with _breakdown_lock:
+            breakdown[name] = round(breakdown.get(name, 0.0) + elapsed, 4)
+
+
+@contextmanager
+def track(backend: str) -> Iterator[None]:
+    """
+    记录一次后端调用的耗时：with track("milvus_search"): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(BACKEND_LATENCY, "backend", backend, time.perf_counter() - start)
+
+
+def timed_node(node: str):
+    """
+    LangGraph 节点耗时装饰器，兼容同步与异步节点。
+    functools.wraps 保留原函数签名，LangGraph 仍能识别 config 参数。
+    """
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _record(NODE_LATENCY, "node", node, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(NODE_LATENCY, "node", node, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,122 @@
+# app/core/parallel_embed.py
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from app.core.batching import plan_length_batches
+from app.core.config import settings
+from app.core.metrics import track
+
+logger = logging.getLogger(__name__)
+
+# 子进程内的模型副本 (每个 worker 加载一份)
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    """
+    子进程初始化：限制 intra-op 线程数后加载模型，避免多个进程争抢同一批 CPU 核
+    """
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+
+    from app.core.vector import build_embeddings
+    _worker_model = build_embeddings(model_name, backend)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_model.embed_documents(texts) # type: ignore
+
+
+def plan_batches(texts: List[str], max_batch_chars: int, max_batch_size: int) -> List[List[int]]:
+    """
+    自适应分批：按字符长度分桶 (见 plan_length_batches)，每批的 (最长文本长度 x 批大小) 不超过 max_batch_chars。
+    返回每批在 texts 中的下标
+    """
+    return plan_length_batches([len(t) for t in texts], max_batch_chars, max_batch_size)
+
+
+class ParallelEmbedder:
+    """
+    批量入库用的多进程编码器：spawn 出 num_workers 个进程，各自持有一份模型，
+    批次按长度排序并自适应大小后并行编码，结果按原顺序返回。
+    单进程的 HuggingFaceEmbeddings 只能用到少数几个核，入库大批 PDF 时大部分 CPU 闲置。
+    """
+    _instance = None
+
+    def __init__(self, model_name: str, backend: str, num_workers: int, max_batch_chars: int, max_batch_size: int):
+        self.model_name = model_name
+        self.backend = backend
+        self.num_workers = num_workers
+        self.max_batch_chars = max_batch_chars
+        self.max_batch_size = max_batch_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def get_instance(cls) -> "ParallelEmbedder":
+        if cls._instance is None:
+            cls._instance = cls(
+                model_name=settings.embedding_model,
+                backend=settings.embedding_backend,
+                num_workers=settings.ingest_embed_workers or max(1, (os.cpu_count() or 2) // 4),
+                max_batch_chars=settings.ingest_embed_batch_chars,
+                max_batch_size=settings.embedding_batch_size * 4
+            )
+        return cls._instance
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+            logger.info(f"🏭 [ParallelEmbedder] 启动 {self.num_workers} 个编码进程 (每个 {threads} 线程)...")
+            # spawn：不继承父进程的 torch 线程池与 Milvus / Neo4j 连接
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, threads)
+            )
+        return self._pool
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        # 文本太少时起进程池得不偿失，直接用进程内模型
+        if len(texts) < settings.ingest_embed_min_parallel or self.num_workers <= 1:
+            from app.core.vector import get_embeddings
+            embeddings = get_embeddings()
+            # 作为缓存的未命中编码器被调用时，绕过缓存层直接用底层模型
+            inner = getattr(embeddings, "inner", embeddings)
+            return inner.embed_documents(texts)
+
+        batches = plan_batches(texts, self.max_batch_chars, self.max_batch_size)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with track("embedding.bulk"):
+            outputs = self._get_pool().map(_embed_batch, [[texts[i] for i in batch] for batch in batches])
+            for batch, vectors in zip(batches, outputs):
+                for idx, vec in zip(batch, vectors):
+                    results[idx] = vec
+        logger.info(f"🏭 [ParallelEmbedder] 已编码 {len(texts)} 条文本 ({len(batches)} 批)")
+        return results # type: ignore
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def embed_documents_bulk(texts: List[str]) -> List[List[float]]:
+    """
+    入库专用的批量编码：先查 Embedding 缓存，未命中的文本交给多进程编码器
+    """
+    from app.core.vector import get_embeddings
+    from app.core.embedding_cache import CachedEmbeddings
+
+    embedder = ParallelEmbedder.get_instance()
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.embed_documents_with(texts, embedder.embed)
+    return embedder.embed(texts)
@@ -0,0 +1,164 @@
+# app/core/registry.py
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# 缺失即不可服务的组件；其余组件失败只降级对应检索源
+REQUIRED_COMPONENTS = ("embedding", "vector_store", "reranker", "llm")
+
+
+class ComponentRegistry:
+    """
+    组件注册表：在 lifespan 中一次性构建检索器、LLM 客户端、重排序 / Embedding 模型和
+    Milvus / Neo4j 连接，并对每个组件做一次预热推理，避免部署后的首个请求承担几十秒的加载耗时。
+    节点从这里取检索器，不再每个请求重新实例化。
+    """
+    _instance = None
+
+    def __init__(self):
+        self._vector_retriever = None
+        self._graph_retriever = None
+        self._web_retriever = None
+        # 组件名 -> {"ready": bool, "latency_ms": float, "error": str}
+        self.status: Dict[str, Dict[str, Any]] = {}
+        self.started = False
+        # 跳过预热：组件在首个请求中懒加载
+        self.lazy = False
+
+    @classmethod
+    def get_instance(cls) -> "ComponentRegistry":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    # --- 检索器 ---
+
+    def vector_retriever(self, top_k: int = 3, **overrides: Any):
+        """
+        返回共享同一向量库连接的向量检索器，仅按请求覆盖 top_k / search_k，
+        以及 overrides 中非空的检索器字段 (search_preset / ann_params / filters)
+        """
+        if self._vector_retriever is None:
+            from app.modules.retrieval.vector_retrieval import MineralVectorRetriever
+            self._vector_retriever = MineralVectorRetriever(
+                top_k=3, use_rerank=True, search_k=self._search_k(3), hybrid=settings.hybrid_search,
+                binary_rescore=settings.binary_rescore_factor if settings.vector_quantization == "binary" else None
+            )
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+        if top_k == self._vector_retriever.top_k and not overrides:
+            return self._vector_retriever
+        return self._vector_retriever.model_copy(update={"top_k": top_k, "search_k": self._search_k(top_k), **overrides})
+
+    @staticmethod
+    def _search_k(top_k: int) -> int:
+        """
+        粗排召回数量：纯向量检索为 top_k * 10；混合检索的词法召回补上了精确词，每路 top_k * hybrid_search_k_factor 即可
+        """
+        return top_k * (settings.hybrid_search_k_factor if settings.hybrid_search else 10)
+
+    def graph_retriever(self):
+        if self._graph_retriever is None:
+            from app.modules.retrieval.graph_retrieval import MineralGraphRetriever
+            self._graph_retriever = MineralGraphRetriever(level=1)
+        return self._graph_retriever
+
+    def web_retriever(self):
+        if self._web_retriever is None:
+            from app.modules.retrieval.web_retrieval import MineralWebRetriever
+            self._web_retriever = MineralWebRetriever(top_k=3)
+        return self._web_retriever
+
+    # --- 启动与预热 ---
+
+    async def start(self, warm: bool = True):
+        """
+        并发构建并预热全部组件。单个组件失败只记录状态，不阻止服务启动，由 /readyz 反映。
+        warm=False 时不预热，只标记为已启动，组件在首次使用时懒加载
+        """
+        if not warm:
+            self.lazy = True
+            self.started = True
+            logger.info("💤 [Registry] 已跳过预热，组件将在首个请求中懒加载")
+            return
+
+        logger.info("🔥 [Registry] 正在构建并预热组件...")
+        await asyncio.gather(
+            self._warm("embedding", self._warm_embedding),
+            self._warm("reranker", self._warm_reranker),
+            self._warm("vector_store", self._warm_vector_store),
+            self._warm("neo4j", self._warm_neo4j),
+            self._warm("llm", self._warm_llm),
+            self._warm("router", self._warm_router),
+            self._warm("web", self.web_retriever),
+        )
+        self.started = True
+        failed = [name for name, s in self.status.items() if not s["ready"]]
+        if failed:
+            logger.warning(f"⚠️ [Registry] 以下组件未就绪: {failed}")
+        else:
+            logger.info("✅ [Registry] 全部组件预热完成")
+
+    @property
+    def ready(self) -> bool:
+        """
+        已启动且必需组件均就绪；懒加载模式下尚未预热过的组件不计为未就绪
+        """
+        return self.started and all(
+            self.status.get(name, {}).get("ready", self.lazy) for name in REQUIRED_COMPONENTS
+        )
+
+    async def _warm(self, name: str, fn: Callable[[], Any]):
+        start = time.perf_counter()
+        try:
+            await run_blocking(fn)
+            self.status[name] = {"ready": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+            logger.info(f"  ✔ {name} 预热完成 ({self.status[name]['latency_ms']} ms)")
+        except Exception as e:
+            self.status[name] = {"ready": False, "error": str(e)}
+            logger.error(f"  ✘ {name} 预热失败: {e}")
+
+    @staticmethod
+    def _warm_embedding():
+        from app.core.vector import get_embeddings
+        get_embeddings().embed_query("预热")
+
+    @staticmethod
+    def _warm_reranker():
+        from app.core.rerank import RerankService
+        RerankService.compute_score("预热", ["预热"])
+
+    def _warm_vector_store(self):
+        from app.core.vector import get_embeddings
+        from app.core.local_vector import LocalVectorStore
+        retriever = self.vector_retriever()
+        store = retriever._vector_store
+        # 集合存在时搜一次，触发 Milvus 把集合加载进内存 (本地向量库则是预热 mmap 页缓存)
+        if isinstance(store, LocalVectorStore) or store.col is not None:
+            store.similarity_search_by_vector(get_embeddings().embed_query("预热"), k=1)
+
+    def _warm_neo4j(self):
+        retriever = self.graph_retriever()
+        retriever._graph.query("RETURN 1")
+
+    @staticmethod
+    def _warm_router():
+        # 快速路由层的原型由全部内置示例编码得到，放在启动阶段构建
+        from app.core.router import router
+        router.warm()
+
+    @staticmethod
+    def _warm_llm():
+        # 只生成 1 个 token，让 Ollama 把模型权重载入内存
+        from app.core.router import router
+        router.llm.model_copy(update={"num_predict": 1}).invoke("你好")
+
+
+# 工厂函数
+def get_registry() -> ComponentRegistry:
+    return ComponentRegistry.get_instance()
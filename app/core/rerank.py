@@ -1,4 +1,15 @@
 from app.core.config import settings
+from app.core.metrics import track, CACHE_EVENTS, RERANK_BATCH_REQUESTS
+from app.core.singleflight import normalize_query
+from app.core.executor import run_blocking
+from app.core.batching import plan_length_batches
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 import torch
 import logging
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
@@ -9,6 +20,9 @@ class RerankService:
     _instance = None
     _tokenizer = None
     _model = None
+    # 分数 LRU：(模型, 归一化 query 的 sha1, 文档的 sha1) -> logit
+    _score_cache: "OrderedDict[tuple, float]" = OrderedDict()
+    _cache_lock = threading.Lock()
 
     @classmethod
     def get_instance(cls):
@@ -18,7 +32,7 @@ class RerankService:
 
     @classmethod
     def init_model(cls):
-        model_name = "BAAI/bge-reranker-base"
+        model_name = settings.rerank_model
         logger.info(f"⚖️ 正在加载 Rerank 模型: {model_name} ...")
 
         try:
@@ -46,44 +60,252 @@ class RerankService:
         """
         if not documents:
             return []
-        
+
+        return cls.compute_pair_scores([(query, doc) for doc in documents])
+
+    @classmethod
+    def compute_pair_scores(cls, pairs: list[tuple[str, str]], batch_size: int | None = None) -> list[float]:
+        """
+        对任意 (query, doc) 对列表打分，按长度分桶切成微批依次前向 (见 _forward)。
+        批量问答会把多个 query 的候选拼在一起调用，摊薄单次调用的开销。
+        已缓存的对直接取分数，只有未命中 (且去重后) 的对送进模型。
+        返回: 与 pairs 一一对应的分数列表
+        """
+        if not pairs:
+            return []
+        if not settings.rerank_cache_enabled:
+            return cls._forward(pairs, batch_size)
+
+        keys = [cls._cache_key(q, d) for q, d in pairs]
+        scores: list[float | None] = [None] * len(pairs)
+        with cls._cache_lock:
+            for i, key in enumerate(keys):
+                if key in cls._score_cache:
+                    cls._score_cache.move_to_end(key)
+                    scores[i] = cls._score_cache[key]
+
+        # 未命中的对按键去重 (重叠子问题的同一批候选只算一次)
+        pending: dict[tuple, list[int]] = {}
+        for i, key in enumerate(keys):
+            if scores[i] is None:
+                pending.setdefault(key, []).append(i)
+        hits = len(pairs) - sum(len(idx) for idx in pending.values())
+        CACHE_EVENTS.inc(hits, cache="rerank", result="hit")
+        CACHE_EVENTS.inc(len(pairs) - hits, cache="rerank", result="miss")
+
+        if pending:
+            computed = cls._forward([pairs[idx[0]] for idx in pending.values()], batch_size)
+            with cls._cache_lock:
+                for (key, idx), score in zip(pending.items(), computed):
+                    for i in idx:
+                        scores[i] = score
+                    cls._score_cache[key] = score
+                    cls._score_cache.move_to_end(key)
+                while len(cls._score_cache) > settings.rerank_cache_size:
+                    cls._score_cache.popitem(last=False)
+        return scores # type: ignore
+
+    @staticmethod
+    def _cache_key(query: str, doc: str) -> tuple:
+        return (
+            settings.rerank_model,
+            hashlib.sha1(normalize_query(query).encode("utf-8")).digest(),
+            hashlib.sha1(doc.encode("utf-8")).digest(),
+        )
+
+    @classmethod
+    def _forward(cls, pairs: list[tuple[str, str]], batch_size: int | None = None) -> list[float]:
+        """
+        模型前向：先整体分词 (截断到 512、不 padding) 得到每对的 token 长度，按长度分桶装批，
+        每批 (最长序列 x 批大小) 不超过 rerank_batch_token_budget、批大小不超过 batch_size，
+        再逐批 padding 前向。一条长文档不会把整批都 pad 到 512，大 search_k 时单批张量也有上界。
+        分数按原顺序返回
+        """
         cls.get_instance()
+        batch_size = batch_size or settings.rerank_batch_size
 
-        pairs = [[query,doc] for doc in documents]
+        with track("rerank"), torch.no_grad():
+            if settings.rerank_batch_token_budget <= 0:
+                return cls._forward_fixed(pairs, batch_size)
+
+            encoded = cls._tokenizer(
+                [[q, d] for q, d in pairs],
+                padding=False,
+                truncation=True,
+                max_length=512
+            ) # type: ignore
+            lengths = [len(ids) for ids in encoded["input_ids"]]
+            scores: list[float] = [0.0] * len(pairs)
+            for batch in plan_length_batches(lengths, settings.rerank_batch_token_budget, batch_size):
+                features = {key: [values[i] for i in batch] for key, values in encoded.items()}
+                inputs = cls._tokenizer.pad(features, padding=True, return_tensors='pt') # type: ignore
+                for i, score in zip(batch, cls._logits(inputs)):
+                    scores[i] = score
+        return scores
 
-        with torch.no_grad():
+    @classmethod
+    def _forward_fixed(cls, pairs: list[tuple[str, str]], batch_size: int) -> list[float]:
+        """
+        按原顺序每 batch_size 对切一批 (不分桶)，批内统一 pad 到最长序列
+        """
+        scores: list[float] = []
+        for start in range(0, len(pairs), batch_size):
+            batch = [[q, d] for q, d in pairs[start:start + batch_size]]
             inputs = cls._tokenizer(
-                pairs, 
-                padding=True, 
-                truncation=True, 
-                return_tensors='pt', 
+                batch,
+                padding=True,
+                truncation=True,
+                return_tensors='pt',
                 max_length=512
             ) # type: ignore
-            
-            # 移动数据到设备
-            if cls._model.device.type != 'cpu': # type: ignore
-                inputs = {k: v.to(cls._model.device) for k, v in inputs.items()}
-                
-            scores = cls._model(**inputs, return_dict=True).logits.flatten().float() # type: ignore
-            
-            # 归一化分数 (可选，sigmoid 让分数在 0-1 之间)
-            # scores = torch.sigmoid(scores) 
-            
-            return scores.cpu().tolist()
-        
+            scores.extend(cls._logits(inputs))
+        return scores
+
+    @classmethod
+    def _logits(cls, inputs) -> list[float]:
+        # 移动数据到设备
+        if cls._model.device.type != 'cpu': # type: ignore
+            inputs = {k: v.to(cls._model.device) for k, v in inputs.items()}
+
+        logits = cls._model(**inputs, return_dict=True).logits.flatten().float() # type: ignore
+
+        # 归一化分数 (可选，sigmoid 让分数在 0-1 之间)
+        # logits = torch.sigmoid(logits)
+
+        return logits.cpu().tolist()
+
+class RerankBatcher:
+    """
+    重排序批处理 worker：各请求的 (query, doc) 对放入队列，后台线程取到第一个后
+    在 rerank_batch_window_ms 时间窗内继续收集 (合计不超过 merge_limit() 估算 token)，
+    合并成一次 compute_pair_scores 调用 (其中再按 rerank_batch_token_budget 切成各次前向)，再把分数按各自的切片返回。
+    此前每个请求各自调用模型，并发请求在重排序上串行排队，每次前向的批又很小，CPU 利用率低
+    """
+    _instance = None
+
+    def __init__(self, window_ms: float, max_batch_tokens: int):
+        self.window = window_ms / 1000
+        self.max_batch_tokens = max_batch_tokens
+        # (pairs, future, 估算 token 数)
+        self._queue: "queue.Queue[tuple[list[tuple[str, str]], Future, int]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "RerankBatcher":
+        if cls._instance is None:
+            cls._instance = cls(settings.rerank_batch_window_ms, cls.merge_limit())
+        return cls._instance
+
+    @staticmethod
+    def merge_limit() -> int:
+        """
+        单次合并的 token 上限：rerank_batch_max_forwards 次前向的 token 预算，调整预算时随之缩放。
+        顺序切批模式 (预算 <= 0) 下每次前向按 rerank_batch_size 对、每对最多 512 token 折算
+        """
+        per_forward = settings.rerank_batch_token_budget
+        if per_forward <= 0:
+            per_forward = settings.rerank_batch_size * 512
+        return per_forward * settings.rerank_batch_max_forwards
+
+    def submit(self, pairs: list[tuple[str, str]]) -> Future:
+        """
+        提交一组 (query, doc) 对，返回结果为分数列表的 Future
+        """
+        future: Future = Future()
+        if not pairs:
+            future.set_result([])
+            return future
+        self._ensure_started()
+        self._queue.put((pairs, future, self._estimate_tokens(pairs)))
+        return future
+
+    @staticmethod
+    def _estimate_tokens(pairs: list[tuple[str, str]]) -> int:
+        # 中文约 1 字 1 token，超过 max_length 的部分会被截断
+        return sum(min(len(q) + len(d), 512) for q, d in pairs)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+                    self._thread.start()
+                    logger.info("⚖️ [RerankBatcher] 批处理 worker 已启动")
+
+    def _run(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            batch, tokens = [first], first[2]
+            deadline = time.monotonic() + self.window
+            while tokens < self.max_batch_tokens:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if tokens + item[2] > self.max_batch_tokens:
+                    # 放不下的留到下一批打头，单个超大请求也会独占一批
+                    carry = item
+                    break
+                batch.append(item)
+                tokens += item[2]
+            self._execute(batch)
+
+    @staticmethod
+    def _execute(batch: list[tuple[list[tuple[str, str]], Future, int]]):
+        # 调用方已取消 (如超出延迟预算) 的请求不再计算
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        RERANK_BATCH_REQUESTS.observe(len(batch))
+        try:
+            scores = RerankService.compute_pair_scores([pair for pairs, _, _ in batch for pair in pairs])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for pairs, future, _ in batch:
+            future.set_result(scores[offset:offset + len(pairs)])
+            offset += len(pairs)
+
+
 # 方便调用的函数
+def _top_k(scores: list[float], top_k: int):
+    # 将 (index, score) 结合并按分数降序排列，返回前 k 个结果: [(original_index, score), ...]
+    combined = list(enumerate(scores))
+    combined.sort(key=lambda x: x[1], reverse=True)
+    return combined[:top_k]
+
 def rerank_documents(query: str, documents: list[str], top_k: int = 3):
     """
     输入查询和文档内容列表，返回重排序后的 Top-K 文档索引和分数
     """
     if not documents:
-            return []
-            
-    scores = RerankService.compute_score(query, documents)
-    # 将 (index, score) 结合并排序
-    combined = list(enumerate(scores))
-    # 按分数降序排列
-    combined.sort(key=lambda x: x[1], reverse=True)
-    
-    # 返回前 k 个结果: [(original_index, score), ...]
-    return combined[:top_k]
\ No newline at end of file
+        return []
+
+    if settings.rerank_batching:
+        with track("rerank_wait"):
+            scores = RerankBatcher.get_instance().submit([(query, doc) for doc in documents]).result()
+    else:
+        scores = RerankService.compute_score(query, documents)
+    return _top_k(scores, top_k)
+
+async def arerank_documents(query: str, documents: list[str], top_k: int = 3):
+    """
+    rerank_documents 的异步版本：批处理模式下等待 worker 的 Future，不占用线程池
+    """
+    if not documents:
+        return []
+
+    if settings.rerank_batching:
+        with track("rerank_wait"):
+            scores = await asyncio.wrap_future(RerankBatcher.get_instance().submit([(query, doc) for doc in documents]))
+    else:
+        scores = await run_blocking(RerankService.compute_score, query, documents)
+    return _top_k(scores, top_k)
@@ -1,12 +1,62 @@
-from typing import Literal, List
+import logging
+import os
+import re
+import threading
+from typing import Dict, Literal, List, Optional, Tuple
+import numpy as np
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain_ollama import ChatOllama
 from app.core.config import settings
+from app.core.executor import run_blocking
+from app.core.metrics import track, ROUTER_DECISIONS
+from app.core.vector import get_embeddings, embed_queries
 
+logger = logging.getLogger(__name__)
 
 RouteTarget = Literal["vector", "graph", "web", "generate"]
 
+# 快速路由层：关键词规则
+# 纯问候 / 感谢直接闲聊；时间敏感词强制追加联网检索 (与路由 prompt 的指导原则一致)
+GREETING_PATTERN = re.compile(r"^\s*(你好|您好|嗨|哈喽|hi|hello|hey|谢谢|多谢|感谢|再见|拜拜)[\s!！。.~～?？]*$", re.IGNORECASE)
+TIME_SENSITIVE_PATTERN = re.compile(r"最新|最近|近期|今年|去年|本月|20[2-3][0-9]年?|价格|行情|新闻|产量排名")
+
+# 各数据源的内置示例问题，均值向量作为该数据源的原型；可用 tools/calibrate_router.py 基于真实流量重新校准
+# (同时给出置信度阈值与间隔，未校准时原型相似度这一层不启用)
+ROUTE_EXAMPLES: Dict[str, List[str]] = {
+    "vector": [
+        "石英的化学成分是什么？",
+        "黄铁矿的硬度和比重是多少？",
+        "方解石遇稀盐酸会有什么反应？",
+        "斑岩铜矿的成矿机制是什么？",
+        "磁铁矿的浮选工艺流程",
+        "What is the chemical formula of hematite?",
+    ],
+    "graph": [
+        "石膏通常与哪些矿物共生？",
+        "黄铜矿属于哪一类矿物？",
+        "哪些矿物属于六方晶系？",
+        "锂辉石和哪些矿物有关联？",
+        "辉钼矿的伴生矿物有哪些？",
+        "Which minerals are associated with cassiterite?",
+    ],
+    "web": [
+        "最近锂矿的市场价格是多少？",
+        "2024年全球铜产量排名",
+        "今年稀土行业有什么新闻？",
+        "近期黄金价格走势如何？",
+        "What is the current price of cobalt?",
+    ],
+    "generate": [
+        "你好",
+        "谢谢你的帮助",
+        "你是谁？",
+        "今天心情不错",
+        "讲个笑话吧",
+        "Hello, how are you?",
+    ],
+}
+
 class RouteQuery(BaseModel):
     """
     路由决策模型：决定将问题分发到哪些数据源。
@@ -27,8 +77,14 @@ class SemanticRouter:
         )
         # 绑定结构化输出
         self.structured_llm = self.llm.with_structured_output(RouteQuery)
+        # 快速路由层的原型矩阵 (首次使用时构建)
+        self._route_names: List[str] = []
+        self._prototypes: Optional[np.ndarray] = None
+        # 校准文件中的推荐 (阈值, 间隔)
+        self._calibration: Tuple[Optional[float], Optional[float]] = (None, None)
+        self._proto_lock = threading.Lock()
 
-    def route(self, question:str)-> List[str]: # type: ignore
+    def _build_chain(self):
         system_prompt = """你是一个智能的语义路由器。你的任务是将用户的问题分发到最合适的数据源。
         
         可选数据源：
@@ -48,19 +104,190 @@ class SemanticRouter:
             ("human","{question}"),
         ])
 
-        router_chain = router_prompt | self.structured_llm 
+        return router_prompt | self.structured_llm 
+
+    # --- 快速路由层 ---
+
+    def _load_prototypes(self) -> Tuple[List[str], np.ndarray]:
+        """
+        加载路由原型：优先使用校准文件，否则由内置示例的 Embedding 均值构建
+        """
+        with self._proto_lock:
+            if self._prototypes is None:
+                path = settings.router_prototypes_path
+                if path and os.path.exists(path):
+                    with np.load(path) as data:
+                        names, matrix = [str(n) for n in data["routes"]], data["prototypes"].astype(np.float32)
+                        if "threshold" in data.files and "margin" in data.files:
+                            self._calibration = (float(data["threshold"]), float(data["margin"]))
+                    logger.info(f"📂 [Router] 已加载校准路由原型: {path}")
+                else:
+                    names, matrix = build_prototypes(
+                        [(q, [route]) for route, examples in ROUTE_EXAMPLES.items() for q in examples]
+                    )
+                self._route_names, self._prototypes = names, matrix
+        return self._route_names, self._prototypes
+
+    def confidence(self) -> Optional[Tuple[float, float]]:
+        """
+        快速路由层的 (阈值, 间隔)：配置优先，否则取校准文件中的推荐值。
+        两者缺一时返回 None，原型相似度这一层不启用 (只保留关键词规则)
+        """
+        threshold, margin = settings.router_confidence_threshold, settings.router_confidence_margin
+        path = settings.router_prototypes_path
+        if (threshold is None or margin is None) and path and os.path.exists(path):
+            self._load_prototypes()
+            threshold = threshold if threshold is not None else self._calibration[0]
+            margin = margin if margin is not None else self._calibration[1]
+        if threshold is None or margin is None:
+            return None
+        return threshold, margin
+
+    def warm(self):
+        """
+        预先构建路由原型 (需要为全部内置示例编码)，由组件注册表在启动预热时调用
+        """
+        if not settings.router_fast_tier:
+            return
+        if self.confidence() is None:
+            logger.info("💡 [Router] 未配置或校准置信度阈值，快速路由层仅使用关键词规则 (见 tools/calibrate_router.py)")
+            return
+        self._load_prototypes()
+
+    def similarities(self, query_vector: List[float]) -> Dict[str, float]:
+        """
+        query 与各数据源原型的余弦相似度
+        """
+        names, matrix = self._load_prototypes()
+        vec = np.asarray(query_vector, dtype=np.float32)
+        vec = vec / (np.linalg.norm(vec) or 1.0)
+        return dict(zip(names, (matrix @ vec).tolist()))
+
+    @staticmethod
+    def decide(sims: Dict[str, float], threshold: float, margin: float) -> Optional[List[str]]:
+        """
+        依据原型相似度做决策，置信度不足时返回 None (交给路由 LLM)：
+        - 最相似的数据源未达到阈值 -> 不确定
+        - 最相似与次相似数据源相差不到 margin -> 难以区分 (领域内问题往往同时接近多个原型)，不确定
+        - 否则只选中最相似的数据源；需要组合多个检索源的问题交给路由 LLM
+        """
+        ranked = sorted(sims.items(), key=lambda kv: -kv[1])
+        if not ranked or ranked[0][1] < threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < margin:
+            return None
+        return [ranked[0][0]]
+
+    def _fast_route(self, question: str, query_vector: Optional[List[float]]) -> Optional[List[str]]:
+        """
+        关键词规则 + 原型相似度。返回 None 表示需要回退到路由 LLM
+        """
+        if GREETING_PATTERN.match(question):
+            ROUTER_DECISIONS.inc(tier="keyword")
+            return ["generate"]
+        confidence = self.confidence()
+        if query_vector is None or confidence is None:
+            return None
+
+        decision = self.decide(self.similarities(query_vector), *confidence)
+        if decision is None:
+            return None
+        if TIME_SENSITIVE_PATTERN.search(question) and "web" not in decision:
+            decision = [r for r in decision if r != "generate"] + ["web"]
+        ROUTER_DECISIONS.inc(tier="embedding")
+        return decision
+
+    def _embed_for_routing(self, question: str) -> Optional[List[float]]:
+        try:
+            with track("embedding"):
+                return get_embeddings().embed_query(question)
+        except Exception as e:
+            logger.warning(f"⚠️ [Router] 快速路由编码失败，回退到 LLM: {e}")
+            return None
+
+    # --- 路由入口 ---
+
+    def route(self, question:str)-> List[str]: # type: ignore
+        if settings.router_fast_tier:
+            # 纯问候、或原型相似度层未启用时无需编码
+            query_vector = None
+            if not GREETING_PATTERN.match(question) and self.confidence() is not None:
+                query_vector = self._embed_for_routing(question)
+            decision = self._fast_route(question, query_vector)
+            if decision is not None:
+                logger.info(f"⚡ [Router] 快速路由: {decision}")
+                return decision
+        return self.llm_route(question)
+
+    async def aroute(self, question: str) -> List[str]:
+        """
+        route 的异步版本，等待 Ollama 时不阻塞事件循环
+        """
+        if settings.router_fast_tier:
+            query_vector = None
+            if not GREETING_PATTERN.match(question) and self.confidence() is not None:
+                query_vector = await run_blocking(self._embed_for_routing, question)
+                # 未经预热时首次构建原型要编码全部示例，放进线程池，不阻塞事件循环
+                if query_vector is not None and self._prototypes is None:
+                    await run_blocking(self._load_prototypes)
+            decision = self._fast_route(question, query_vector)
+            if decision is not None:
+                logger.info(f"⚡ [Router] 快速路由: {decision}")
+                return decision
+        return await self.allm_route(question)
+
+    def llm_route(self, question: str) -> List[str]:
+        """
+        结构化输出的路由 LLM (慢路径)
+        """
+        router_chain = self._build_chain()
         try:
             print(f"🚦 [Router] 正在分析意图: {question}")
-            result = router_chain.invoke({"question": question})
+            with track("llm.router"):
+                result = router_chain.invoke({"question": question})
             
             # 打印决策结果，方便调试
             print(f"👉 [Router] 决策结果: {result.datasources}") # type: ignore
+            ROUTER_DECISIONS.inc(tier="llm")
             return result.datasources # type: ignore
             
         except Exception as e:
             print(f"❌ [Router] 路由失败，默认回退到全量检索: {e}")
+            ROUTER_DECISIONS.inc(tier="fallback")
             # 兜底：如果出错，默认查本地文档和图谱
             return ["vector", "graph"]
 
+    async def allm_route(self, question: str) -> List[str]:
+        router_chain = self._build_chain()
+        try:
+            logger.info(f"🚦 [Router] 正在分析意图: {question}")
+            with track("llm.router"):
+                result = await router_chain.ainvoke({"question": question})
+
+            logger.info(f"👉 [Router] 决策结果: {result.datasources}") # type: ignore
+            ROUTER_DECISIONS.inc(tier="llm")
+            return result.datasources # type: ignore
+
+        except Exception as e:
+            logger.error(f"❌ [Router] 路由失败，默认回退到全量检索: {e}")
+            ROUTER_DECISIONS.inc(tier="fallback")
+            return ["vector", "graph"]
+
+
+def build_prototypes(labelled: List[Tuple[str, List[str]]]) -> Tuple[List[str], np.ndarray]:
+    """
+    由 (问题, [数据源, ...]) 标注构建原型：每个数据源取其所有示例 Embedding 的归一化均值
+    """
+    vectors = np.asarray(embed_queries([q for q, _ in labelled]), dtype=np.float32)
+    names, rows = [], []
+    for route in ROUTE_EXAMPLES:
+        idx = [i for i, (_, routes) in enumerate(labelled) if route in routes]
+        if not idx:
+            continue
+        centroid = vectors[idx].mean(axis=0)
+        names.append(route)
+        rows.append(centroid / (np.linalg.norm(centroid) or 1.0))
+    return names, np.stack(rows)
+
 # 单例
 router = SemanticRouter()
\ No newline at end of file
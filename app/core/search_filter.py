@@ -0,0 +1,108 @@
+# app/core/search_filter.py
+import json
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Collection, Dict, List, Optional, Union
+
+# 可过滤的标量字段及缺省值：入库时每个分块都补齐这些字段，
+# Milvus 集合按首批数据推断 schema，字段不齐的后续批次会写入失败
+FILTER_FIELD_DEFAULTS: Dict[str, Any] = {
+    "source": "",
+    "question_id": -1,
+    "ingested_at": 0,
+    "doc_type": "",
+}
+
+# 请求中的集合类过滤条件 -> 标量字段
+_IN_FILTERS = {
+    "sources": "source",
+    "question_ids": "question_id",
+    "doc_types": "doc_type",
+}
+
+
+class UnsupportedFilterError(ValueError):
+    """
+    过滤条件引用了集合中不存在的字段 (旧集合建于这些字段加入之前)。
+    不能静默去掉对应条件：那样检索会放宽为不过滤，返回调用方要求排除的文档
+    """
+    def __init__(self, fields: List[str]):
+        super().__init__(f"集合中没有字段 {fields}，无法按其过滤 (重新入库后可用)")
+        self.fields = fields
+
+
+def normalize_metadata(metadata: Dict[str, Any], ingested_at: Optional[int] = None) -> Dict[str, Any]:
+    """
+    补齐可过滤字段：ingested_at 缺省为当前时间 (epoch 秒)，其余字段取缺省值
+    """
+    normalized = {**FILTER_FIELD_DEFAULTS, **metadata}
+    if not normalized["ingested_at"]:
+        normalized["ingested_at"] = ingested_at or int(time.time())
+    return normalized
+
+
+def _epoch(value: Union[int, float, date, datetime]) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, date):
+        return int(datetime(value.year, value.month, value.day).timestamp())
+    return int(value)
+
+
+def to_milvus_expr(filters: Optional[Dict[str, Any]], fields: Optional[Collection[str]] = None) -> Optional[str]:
+    """
+    把过滤条件翻译成 Milvus 布尔表达式，例如
+    {"sources": ["a.pdf"], "ingested_after": ...} -> 'source in ["a.pdf"] and ingested_at >= 1700000000'。
+    fields 为集合实际拥有的字段，过滤条件引用了集合中不存在的字段时抛出 UnsupportedFilterError
+    """
+    if not filters:
+        return None
+
+    clauses: List[str] = []
+    skipped: List[str] = []
+
+    def _usable(field: str) -> bool:
+        if fields is not None and field not in fields:
+            skipped.append(field)
+            return False
+        return True
+
+    for key, field in _IN_FILTERS.items():
+        values = filters.get(key)
+        if values and _usable(field):
+            # json.dumps 生成带转义的双引号字符串，Milvus 表达式可直接使用
+            clauses.append(f"{field} in {json.dumps(list(values), ensure_ascii=False)}")
+    for key, op in (("ingested_after", ">="), ("ingested_before", "<")):
+        if filters.get(key) is not None and _usable("ingested_at"):
+            clauses.append(f"ingested_at {op} {_epoch(filters[key])}")
+
+    if skipped:
+        raise UnsupportedFilterError(sorted(set(skipped)))
+    return " and ".join(clauses) or None
+
+
+def to_predicate(filters: Optional[Dict[str, Any]]) -> Optional[Callable[[dict], bool]]:
+    """
+    把过滤条件翻译成作用于文档 metadata 的判定函数 (本地向量库与 BM25 词法索引使用)
+    """
+    if not filters:
+        return None
+
+    allowed = {field: set(filters[key]) for key, field in _IN_FILTERS.items() if filters.get(key)}
+    after = _epoch(filters["ingested_after"]) if filters.get("ingested_after") is not None else None
+    before = _epoch(filters["ingested_before"]) if filters.get("ingested_before") is not None else None
+    if not allowed and after is None and before is None:
+        return None
+
+    def predicate(metadata: dict) -> bool:
+        for field, values in allowed.items():
+            if metadata.get(field, FILTER_FIELD_DEFAULTS[field]) not in values:
+                return False
+        ingested_at = metadata.get("ingested_at", 0)
+        if after is not None and ingested_at < after:
+            return False
+        if before is not None and ingested_at >= before:
+            return False
+        return True
+
+    return predicate
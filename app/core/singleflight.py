@@ -0,0 +1,61 @@
+# app/core/singleflight.py
+import asyncio
+import logging
+import re
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.core.metrics import COALESCED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# 归一化时去掉的句末标点 (中英文)
+_TRAILING_PUNCT = "?？!！.。~～"
+
+
+def normalize_query(query: str) -> str:
+    """
+    请求合并使用的 query 归一化：全角转半角、小写、合并空白、去掉句末标点
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(_TRAILING_PUNCT).strip()
+
+
+class SingleFlight:
+    """
+    请求合并 (single-flight)：同一个 key 同时只执行一次，其余并发调用者等待并共享结果。
+    执行体以独立 Task 运行并被 shield 保护，发起者断开连接不会影响其他等待者。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 fn 或加入已在执行的同 key 任务。
+        返回: (结果, 是否为共享结果)
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            COALESCED_REQUESTS.inc(flight=self.name)
+            logger.info(f"🔗 [{self.name}] 合并到进行中的相同请求")
+
+        return await asyncio.shield(task), shared
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时，避免 "Task exception was never retrieved" 警告
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"[{self.name}] 合并任务失败: {task.exception()}")
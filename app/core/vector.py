@@ -1,68 +1,423 @@
 # app/core/vector.py
 import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
 from langchain_milvus import Milvus
 from langchain_huggingface import HuggingFaceEmbeddings
 from app.core.config import settings
+from app.core.embedding_cache import CachedEmbeddings
+from app.core.local_vector import LocalVectorStore
+from app.core.lexical_index import get_lexical_index
+from app.core.dedup import get_dedup_index
+from app.core.search_filter import normalize_metadata, to_milvus_expr, to_predicate
 
 logger = logging.getLogger(__name__)
 
+# 各索引类型的默认构建参数 (settings.milvus_index_params 非空时整体覆盖)
+INDEX_BUILD_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "DISKANN": {},
+    "AUTOINDEX": {},
+    "FLAT": {},
+}
+
+# 延迟 / 召回档位：同一索引类型下，参数越大召回越高、延迟越大
+SEARCH_PRESETS: Dict[str, Dict[str, Dict[str, int]]] = {
+    "HNSW": {"fast": {"ef": 32}, "balanced": {"ef": 64}, "accurate": {"ef": 256}},
+    "IVF_FLAT": {"fast": {"nprobe": 8}, "balanced": {"nprobe": 32}, "accurate": {"nprobe": 128}},
+    "IVF_PQ": {"fast": {"nprobe": 8}, "balanced": {"nprobe": 32}, "accurate": {"nprobe": 128}},
+    "DISKANN": {"fast": {"search_list": 32}, "balanced": {"search_list": 100}, "accurate": {"search_list": 300}},
+}
+
+# 可过滤标量字段的 Milvus 索引 (过滤在 ANN 搜索内部执行，不再扫描整个集合)
+SCALAR_INDEXES: Dict[str, str] = {
+    "source": "INVERTED",
+    "doc_type": "INVERTED",
+    "question_id": "STL_SORT",
+    "ingested_at": "STL_SORT",
+}
+
+# 这些参数是候选列表长度，Milvus 要求不小于 limit
+_CANDIDATE_LIST_PARAMS = ("ef", "search_list")
+
+# 集合的正文 / 向量字段名：显式传给 Milvus，批量搜索直接用 MilvusClient 时按这里解析结果，
+# 不依赖 langchain_milvus 的私有属性
+TEXT_FIELD = "text"
+VECTOR_FIELD = "vector"
+
+
+def milvus_index_params() -> Dict[str, Any]:
+    """
+    按配置生成 Milvus 建索引参数
+    """
+    index_type = settings.milvus_index_type.upper()
+    if index_type not in INDEX_BUILD_DEFAULTS:
+        raise ValueError(f"不支持的 Milvus 索引类型: {settings.milvus_index_type}")
+    params = settings.milvus_index_params
+    if params is None:
+        params = INDEX_BUILD_DEFAULTS[index_type]
+    return {"index_type": index_type, "metric_type": settings.milvus_metric_type, "params": dict(params)}
+
+
+def build_search_params(
+    preset: Optional[str] = None,
+    overrides: Optional[Dict[str, int]] = None,
+    k: Optional[int] = None,
+    index_type: Optional[str] = None,
+    metric_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    生成 Milvus 搜索参数 {"metric_type": ..., "params": {...}}：
+    先取档位 (preset 为空用 settings.milvus_search_preset) 对应的参数，再用 overrides (如 {"ef": 128}) 覆盖。
+    给出 k 时把 ef / search_list 抬到不小于 k，避免 Milvus 拒绝请求
+    """
+    index_type = (index_type or settings.milvus_index_type).upper()
+    preset = preset or settings.milvus_search_preset
+    presets = SEARCH_PRESETS.get(index_type, {})
+    if presets and preset not in presets:
+        raise ValueError(f"未知的搜索档位: {preset}")
+
+    params: Dict[str, Any] = dict(presets.get(preset, {}))
+    if overrides:
+        params.update(overrides)
+    if k is not None:
+        for name in _CANDIDATE_LIST_PARAMS:
+            if name in params:
+                params[name] = max(params[name], k)
+    return {"metric_type": metric_type or settings.milvus_metric_type, "params": params}
+
 class VectorStoreService:
     _instance = None
     _embeddings = None
+    # 已有集合的实际索引 {"index_type", "metric_type"}，为空时按配置
+    _index_param: Optional[Dict[str, str]] = None
+    _scalar_indexes_ready = False
 
     @classmethod
-    def get_embeddings(cls) -> HuggingFaceEmbeddings:
-        """获取 HuggingFace Embedding 模型单例"""
+    def get_embeddings(cls) -> Embeddings:
+        """获取 HuggingFace Embedding 模型单例 (默认包一层持久化缓存)"""
         if cls._embeddings is None:
             # 这里的 model_name 可以是 HuggingFace Hub ID (如 "BAAI/bge-m3")
             # 也可以是本地下载好的模型路径
             model_name = settings.embedding_model # 确保 config.py 里配的是 "BAAI/bge-m3" 或本地路径
-            
-            logger.info(f"⚡️ 正在加载 HuggingFace Embedding 模型: {model_name} ...")
-            
-            # encode_kwargs={'normalize_embeddings': True} 对于某些模型（如 BGE）很重要
-            cls._embeddings = HuggingFaceEmbeddings(
-                model_name=model_name,
-                model_kwargs={'device': 'cpu'}, # 如果有显卡改成 'cuda'
-                encode_kwargs={'normalize_embeddings': True} 
-            )
+            backend = settings.embedding_backend
+
+            logger.info(f"⚡️ 正在加载 HuggingFace Embedding 模型: {model_name} (backend={backend}) ...")
+            embeddings: Embeddings = build_embeddings(model_name, backend)
             logger.info("✅ Embedding 模型加载完成")
+
+            if settings.embedding_cache_enabled:
+                # 命名空间包含影响向量结果的所有参数 (模型、归一化、推理后端)，任何一项变化都会使用新的缓存目录
+                namespace = f"{model_name}|normalize=True|backend={backend}"
+                if backend == "onnx" and settings.embedding_onnx_file:
+                    namespace += f":{settings.embedding_onnx_file}"
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    namespace=namespace,
+                    cache_dir=os.path.join(settings.working_dir, "embedding_cache"),
+                    query_cache_size=settings.embedding_query_cache_size
+                )
+            cls._embeddings = embeddings
             
         return cls._embeddings
 
     @classmethod
-    def get_instance(cls) -> Milvus:
-        """获取 Milvus 向量库实例"""
+    def get_instance(cls) -> VectorStore:
+        """获取向量库实例 (Milvus 或进程内的 LocalVectorStore，由 settings.vector_backend 决定)"""
+        if cls._instance is None and settings.vector_backend == "local":
+            persist_dir = os.path.join(settings.working_dir, "local_vectors", settings.milvus_collection)
+            logger.info(f"📁 正在打开本地向量库: {persist_dir}")
+            cls._instance = LocalVectorStore(
+                embedding_function=cls.get_embeddings(),
+                persist_dir=persist_dir,
+                index_type=settings.local_vector_index,
+                dtype=settings.local_vector_dtype
+            )
+            logger.info("✅ 本地向量库就绪")
+
         if cls._instance is None:
-            logger.info("🔌 正在连接 Milvus 向量数据库...")
+            logger.info(f"🔌 正在连接 Milvus 向量数据库: {settings.milvus_uri} ({settings.milvus_collection})...")
             
             # 获取 Embedding 实例
             embeddings = cls.get_embeddings()
+            index_params = milvus_index_params()
             
             # 初始化 Milvus
             # 注意：collection_name 建议用英文，避免潜在的编码问题
             cls._instance = Milvus(
                 embedding_function=embeddings,
-                collection_name="mineral_rag_collection",
+                collection_name=settings.milvus_collection,
                 connection_args={
-                    "uri": "http://localhost:19530", # Milvus 默认端口
+                    "uri": settings.milvus_uri,
                     # 如果设置了用户名密码:
                     # "user": "root",
                     # "password": "..." 
                 },
+                # 索引参数只在集合首次创建时使用；默认搜索参数取 milvus_search_preset 档位，请求可单独覆盖
+                index_params=index_params,
+                search_params=build_search_params(),
+                text_field=TEXT_FIELD,
+                vector_field=VECTOR_FIELD,
                 # 启用自动 ID 生成 (这对 LangChain 来说通常比较方便)
                 auto_id=True,
                 # 确保持久化数据
                 drop_old=False 
             )
+            cls._check_existing_index(cls._instance, index_params["index_type"])
             
             logger.info("✅ Milvus 连接成功")
             
         return cls._instance
 
+    @classmethod
+    def _check_existing_index(cls, store: Milvus, index_type: str):
+        """
+        已有集合沿用建集合时的索引，与配置不一致时只提示，不自动重建；
+        之后的搜索参数按集合实际的索引类型和度量生成
+        """
+        if store.col is None:
+            return
+        names = store.client.list_indexes(store.collection_name, field_name=VECTOR_FIELD)
+        if not names:
+            return
+        existing = store.client.describe_index(store.collection_name, names[0])
+        if existing["index_type"] != index_type:
+            logger.warning(
+                f"⚠️ 集合 {store.collection_name} 已有 {existing['index_type']} 索引，与配置的 {index_type} 不一致，"
+                f"重建集合后新索引才会生效"
+            )
+        cls._index_param = {"index_type": existing["index_type"], "metric_type": existing["metric_type"]}
+        store.search_params = cls.search_params()
+
+    @classmethod
+    def search_params(
+        cls,
+        preset: Optional[str] = None,
+        overrides: Optional[Dict[str, int]] = None,
+        k: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        按当前集合的索引类型生成请求级搜索参数 (见 build_search_params)
+        """
+        index_param = cls._index_param or {}
+        return build_search_params(
+            preset, overrides, k,
+            index_type=index_param.get("index_type"),
+            metric_type=index_param.get("metric_type")
+        )
+
+    @classmethod
+    def add_documents_bulk(cls, documents: List[Document]) -> List[str]:
+        """
+        批量入库：文本先经多进程编码器 (带 Embedding 缓存) 编码，再用 add_embeddings 一次写入，
+        不走 Milvus.add_documents 内部的单进程 embed_documents；同时写入 BM25 词法索引
+        """
+        if not documents:
+            return []
+        from app.core.parallel_embed import embed_documents_bulk
+
+        texts = [doc.page_content for doc in documents]
+        # 同一批分块共享入库时间；补齐可过滤字段，保证 Milvus 按首批推断出的 schema 包含全部过滤字段
+        ingested_at = int(time.time())
+        metadatas = [normalize_metadata(doc.metadata, ingested_at) for doc in documents]
+        vectors = embed_documents_bulk(texts)
+        store = cls.get_instance()
+        ids = store.add_embeddings(texts, vectors, metadatas=metadatas)
+        if not isinstance(store, LocalVectorStore):
+            cls._ensure_scalar_indexes(store)
+        if settings.lexical_index_enabled:
+            # 向量写入成功后再写词法索引，两者保持同一批分块
+            get_lexical_index().add(texts, metadatas)
+        if settings.ingest_dedup_enabled:
+            # 登记签名，之后入库的近重复分块会被跳过
+            get_dedup_index().add(documents)
+        return ids
+
+    @classmethod
+    def _ensure_scalar_indexes(cls, store: Milvus):
+        """
+        为集合中存在的过滤字段建标量索引 (每个进程只检查一次)
+        """
+        if cls._scalar_indexes_ready or store.col is None:
+            return
+        existing = set(store.client.list_indexes(store.collection_name))
+        missing = [f for f in SCALAR_INDEXES if f in store.fields and f not in existing]
+        if missing:
+            index_params = store.client.prepare_index_params()
+            for field in missing:
+                index_params.add_index(field_name=field, index_type=SCALAR_INDEXES[field], index_name=field)
+            store.client.create_index(store.collection_name, index_params)
+            logger.info(f"🗂️ 已为过滤字段建立标量索引: {missing}")
+        cls._scalar_indexes_ready = True
+
+    @classmethod
+    def search_kwargs(
+        cls, filters: Optional[Dict[str, Any]] = None, binary_rescore: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        把检索选项转换为向量库检索参数：
+        - filters：Milvus 为 expr 表达式 (引用集合中不存在的字段时抛出 UnsupportedFilterError)，本地向量库为 metadata 判定函数
+        - binary_rescore：二值码初筛 + 全精度重打分，只有本地向量库支持 (Milvus 下的组合在加载配置时已被拒绝)
+        """
+        store = cls.get_instance()
+        kwargs: Dict[str, Any] = {}
+        if isinstance(store, LocalVectorStore):
+            predicate = to_predicate(filters)
+            if predicate:
+                kwargs["predicate"] = predicate
+            if binary_rescore:
+                kwargs["binary_rescore"] = binary_rescore
+            return kwargs
+
+        if filters:
+            expr = to_milvus_expr(filters, fields=store.fields if store.col is not None else None)
+            if expr:
+                kwargs["expr"] = expr
+        if binary_rescore:
+            raise ValueError("Milvus 后端不支持二值码初筛 (vector_quantization=binary 需要 vector_backend=local)")
+        return kwargs
+
+    @classmethod
+    def check_filters(cls, filters: Optional[Dict[str, Any]]):
+        """
+        请求入口处校验过滤条件能否在当前集合上执行，不能时抛出 UnsupportedFilterError
+        """
+        if filters:
+            cls.search_kwargs(filters)
+
+    @classmethod
+    def delete_by_source(cls, source: str):
+        """
+        删除某个源文件已入库的全部分块 (重新上传同一文件时先清掉旧版本)
+        """
+        if settings.lexical_index_enabled:
+            get_lexical_index().delete_by_source(source)
+        if settings.ingest_dedup_enabled:
+            get_dedup_index().delete_by_source(source)
+        store = cls.get_instance()
+        if isinstance(store, LocalVectorStore):
+            return store.delete_by_source(source)
+        if store.col is None:
+            return 0
+        escaped = source.replace("\\", "\\\\").replace('"', '\\"')
+        return store.delete(expr=f'source == "{escaped}"')
+
+    @classmethod
+    def batch_similarity_search(
+        cls,
+        vectors: List[List[float]],
+        k: int,
+        filters: Optional[Dict[str, Any]] = None,
+        param: Optional[Dict[str, Any]] = None,
+        binary_rescore: Optional[int] = None
+    ) -> List[List[Document]]:
+        """
+        一次 Milvus search 请求携带多个查询向量 (nq = len(vectors))，
+        返回与 vectors 一一对应的文档列表。param 为请求级搜索参数，为空使用向量库默认值；
+        filters / binary_rescore 见 search_kwargs
+        """
+        if not vectors:
+            return []
+
+        store = cls.get_instance()
+        search_kwargs = cls.search_kwargs(filters, binary_rescore)
+        if isinstance(store, LocalVectorStore):
+            return store.batch_similarity_search(vectors, k, param=param, **search_kwargs)
+        if store.col is None:
+            # 集合尚未创建 (还没有入库任何文档)
+            return [[] for _ in vectors]
+
+        # 只用 MilvusClient 的公开接口；结果解析与 Milvus.similarity_search 一致 (正文为 page_content，其余标量字段为 metadata)
+        search_results = store.client.search(
+            store.collection_name,
+            data=vectors,
+            anns_field=VECTOR_FIELD,
+            search_params=param or cls.search_params(k=k),
+            limit=k,
+            filter=search_kwargs.get("expr", ""),
+            output_fields=["*"],
+        )
+        return [[cls._hit_to_document(hit) for hit in hits] for hits in search_results]
+
+    @staticmethod
+    def _hit_to_document(hit: Dict[str, Any]) -> Document:
+        metadata = dict(hit.get("entity", {}))
+        text = metadata.pop(TEXT_FIELD, "")
+        metadata.pop(VECTOR_FIELD, None)
+        # auto_id 集合的主键字段为 pk
+        metadata.setdefault("pk", hit.get("id"))
+        return Document(page_content=text, metadata=metadata)
+
+def build_embeddings(model_name: str, backend: str = "torch") -> HuggingFaceEmbeddings:
+    """
+    按推理后端构建 HuggingFaceEmbeddings (CPU)：
+    - torch: 原始 fp32 推理
+    - int8: 对 Linear 层做 torch 动态量化，CPU 上通常快 1.5-2 倍，向量余弦偏差 < 1%
+    - onnx: sentence-transformers 的 ONNX Runtime 后端，可通过 embedding_onnx_file 加载量化后的导出文件
+      (需要可选依赖 onnx：uv sync --extra onnx)
+    """
+    if backend not in ("torch", "int8", "onnx"):
+        raise ValueError(f"不支持的 Embedding 后端: {backend}")
+
+    model_kwargs: dict = {'device': 'cpu'} # 如果有显卡改成 'cuda'
+    if backend == "onnx":
+        # 先检查可选依赖，否则要到模型构建深处才报 ImportError
+        try:
+            import onnxruntime
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                f"EMBEDDING_BACKEND=onnx 需要安装可选依赖 onnx (缺少 {e.name})："
+                f"uv sync --extra onnx 或 pip install 'mineralrag[onnx]'"
+            ) from e
+
+        model_kwargs["backend"] = "onnx"
+        ort_kwargs: dict = {}
+        if settings.embedding_onnx_file:
+            ort_kwargs["file_name"] = settings.embedding_onnx_file
+        if settings.embedding_threads:
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = settings.embedding_threads
+            ort_kwargs["session_options"] = session_options
+        if ort_kwargs:
+            model_kwargs["model_kwargs"] = ort_kwargs
+    elif settings.embedding_threads:
+        import torch
+        torch.set_num_threads(settings.embedding_threads)
+
+    # encode_kwargs={'normalize_embeddings': True} 对于某些模型（如 BGE）很重要
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={'normalize_embeddings': True, 'batch_size': settings.embedding_batch_size}
+    )
+
+    if backend == "int8":
+        import torch
+        # 动态量化只替换 Linear 层权重为 int8，激活在推理时按批量化，无需校准数据
+        embeddings._client = torch.quantization.quantize_dynamic(
+            embeddings._client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return embeddings
+
 # 工厂函数
-def get_vector_store() -> Milvus:
+def get_vector_store() -> VectorStore:
     return VectorStoreService.get_instance()
 
-def get_embeddings() -> HuggingFaceEmbeddings:
-    return VectorStoreService.get_embeddings()
\ No newline at end of file
+def get_embeddings() -> Embeddings:
+    return VectorStoreService.get_embeddings()
+
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """
+    批量编码查询：查询向量不写入磁盘上的文档向量缓存 (只走查询 LRU)
+    """
+    embeddings = get_embeddings()
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
\ No newline at end of file
@@ -3,9 +3,11 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import logging
 from app.core.config import settings
-from app.api.routers import chat,ingest  # 导入刚才写的路由模块
+from app.api.routers import chat,ingest,metrics,health  # 导入刚才写的路由模块
 #from agents.multi_retrieval_agents import MRetrievalAgent
 from app.core.gprah import app_graph
+from app.core.registry import get_registry
+from app.core.answer_cache import SemanticAnswerCache
 #from app.core.lightrag import LightRAGService
 # 配置日志
 logging.basicConfig(level=logging.INFO if not settings.debug_dump_dir else logging.DEBUG)
@@ -18,7 +20,8 @@ async def lifespan(app: FastAPI):
     logger.info(f"配置信息: Working Dir={settings.working_dir}, LLM={settings.llm_model_name}")
     
     try:
-
+        # 构建并预热模型与连接，首个请求不再承担加载耗时；关闭预热时组件懒加载，/readyz 仍可就绪
+        await get_registry().start(warm=settings.warmup_on_startup)
         logger.info("✅ 新架构 (Milvus + Neo4j + LangGraph) 就绪")
     except Exception as e:
         logger.error(f"❌ 引擎初始化失败: {e}")
@@ -29,6 +32,9 @@ async def lifespan(app: FastAPI):
     
     # --- 关闭阶段 ---
     logger.info("🛑 服务正在关闭...")
+    # 语义答案缓存延迟落盘，关闭前写出尚未落盘的变更
+    if SemanticAnswerCache._instance is not None:
+        SemanticAnswerCache._instance.flush()
     # 如果 agent 有 close() 方法，可以在这里调用
     # if app.state.agent:
     #     app.state.agent.close()
@@ -43,6 +49,9 @@ def create_app() -> FastAPI:
     # prefix="/v1" 意味着接口地址是 http://localhost:8000/v1/chat
     app.include_router(chat.router, prefix="/v1", tags=["Chat"])
     app.include_router(ingest.router,prefix="/v1", tags=["Ingest"])
+    # Prometheus 约定的抓取路径为 /metrics，不加版本前缀
+    app.include_router(metrics.router, tags=["Observability"])
+    app.include_router(health.router, tags=["Observability"])
     return app
 
 app = create_app()
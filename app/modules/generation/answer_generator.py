@@ -1,9 +1,11 @@
 import logging
-from typing import List
+from typing import List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableConfig
 from langchain_ollama import ChatOllama
 from app.core.config import settings
+from app.core.metrics import track
 
 logger = logging.getLogger(__name__)
 
@@ -26,11 +28,7 @@ class AnswerGenerator:
 
         return "\n\n".join(formatted_content)
     
-    def generate(self, query:str, retrieval_content: List[str]) -> str:
-
-        # 格式化上下文
-        context = self._format_context(retrieval_content)
-        
+    def _rag_chain(self):
         system_prompt = """你是一个专业、严谨的矿物地质学专家助手。你的任务是基于提供的【检索上下文】回答用户的【问题】。
 
         ### 来源优先级说明：
@@ -53,21 +51,9 @@ class AnswerGenerator:
             ("human","{question}")
         ])
 
-        chain = prompt | self.llm | StrOutputParser()
-        # 5. 执行
-        try:
-            return chain.invoke({"context": context, "question": query})
-        except Exception as e:
-            logger.error(f"生成回答失败: {e}")
-            return "抱歉，生成回答时发生系统错误。"
-        pass
-        
-    def chitchat(self, query: str) -> str:
-        """
-        闲聊模式：不依赖检索结果，直接用 LLM 自身知识回答
-        """
-        logger.info(f"🗣️ [Generate] 进入闲聊模式: {query}")
-        
+        return prompt | self.llm | StrOutputParser()
+
+    def _chitchat_chain(self):
         system_prompt = """你是一个友好、专业的矿物地质学专家助手。
         当前用户的问题不需要查阅资料，请直接用你自己的知识库，以自然、流畅的语气进行对话。
         如果用户是在问候（如“你好”），请礼貌回应并简要介绍自己（我是MineralRAG助手）。
@@ -78,11 +64,60 @@ class AnswerGenerator:
             ("human", "{question}"),
         ])
 
-        chain = prompt | self.llm | StrOutputParser()
+        return prompt | self.llm | StrOutputParser()
+    
+    def generate(self, query:str, retrieval_content: List[str], config: Optional[RunnableConfig] = None) -> str:
+        """
+        RAG 模式生成回答。
+        config 透传给 LLM 链，使 LangGraph 的 stream_mode="messages" 能逐 token 捕获输出
+        """
+        # 格式化上下文
+        context = self._format_context(retrieval_content)
+        chain = self._rag_chain()
+        try:
+            with track("llm.generate"):
+                return chain.invoke({"context": context, "question": query}, config=config)
+        except Exception as e:
+            logger.error(f"生成回答失败: {e}")
+            return "抱歉，生成回答时发生系统错误。"
+
+    async def agenerate(self, query: str, retrieval_content: List[str], config: Optional[RunnableConfig] = None) -> str:
+        """
+        generate 的异步版本，等待 Ollama 时不占用线程
+        """
+        context = self._format_context(retrieval_content)
+        chain = self._rag_chain()
+        try:
+            with track("llm.generate"):
+                return await chain.ainvoke({"context": context, "question": query}, config=config)
+        except Exception as e:
+            logger.error(f"生成回答失败: {e}")
+            return "抱歉，生成回答时发生系统错误。"
         
+    def chitchat(self, query: str, config: Optional[RunnableConfig] = None) -> str:
+        """
+        闲聊模式：不依赖检索结果，直接用 LLM 自身知识回答
+        """
+        logger.info(f"🗣️ [Generate] 进入闲聊模式: {query}")
+        chain = self._chitchat_chain()
         try:
-            return chain.invoke({"question": query})
+            with track("llm.chitchat"):
+                return chain.invoke({"question": query}, config=config)
         except Exception as e:
             logger.error(f"闲聊生成失败: {e}")
             return "你好！我是 MineralRAG 助手，很高兴为您服务。"
+
+    async def achitchat(self, query: str, config: Optional[RunnableConfig] = None) -> str:
+        """
+        chitchat 的异步版本
+        """
+        logger.info(f"🗣️ [Generate] 进入闲聊模式: {query}")
+        chain = self._chitchat_chain()
+        try:
+            with track("llm.chitchat"):
+                return await chain.ainvoke({"question": query}, config=config)
+        except Exception as e:
+            logger.error(f"闲聊生成失败: {e}")
+            return "你好！我是 MineralRAG 助手，很高兴为您服务。"
+
 generator = AnswerGenerator()
\ No newline at end of file
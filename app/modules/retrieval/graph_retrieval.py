@@ -1,15 +1,17 @@
 # app/modules/retrieval/graph_retrieval.py
 from typing import List, Any
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from pydantic import Field, PrivateAttr
 
 # 导入图数据库连接
-from app.core.graph_store import get_graph_store
+from app.core.graph_store import get_graph_query_store
 # 导入 LLM 用于提取实体
 from langchain_ollama import ChatOllama
 from app.core.config import settings
+from app.core.metrics import track
+from app.core.executor import run_blocking
 
 class MineralGraphRetriever(BaseRetriever):
     """
@@ -23,7 +25,8 @@ class MineralGraphRetriever(BaseRetriever):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._graph = get_graph_store()
+        # 检索专用连接带事务超时，线程池中的慢查询不会无限占用线程
+        self._graph = get_graph_query_store()
         # 初始化一个轻量级 LLM 用于提取实体 (可以用 1.5b 或 3b)
         self._llm = ChatOllama(
             base_url="http://localhost:11434",
@@ -31,40 +34,48 @@ class MineralGraphRetriever(BaseRetriever):
             temperature=0
         )
 
-    def _extract_entities(self, query: str) -> List[str]:
-        """
-        利用 LLM 从问题中提取关键实体名称
-        """
-        prompt = f"""
+    def _entity_prompt(self, query: str) -> str:
+        return f"""
         请从以下用户问题中提取关键实体（矿物名称、岩石名称、属性等）。
         只输出实体名称，用逗号分隔，不要有任何其他解释。
         
         问题: {query}
         实体:
         """
+
+    @staticmethod
+    def _parse_entities(content: str) -> List[str]:
+        content = content.strip()
+        # 处理分隔符 (中英文逗号)
+        return [e.strip() for e in content.replace("，", ",").split(",") if e.strip()]
+
+    def _extract_entities(self, query: str) -> List[str]:
+        """
+        利用 LLM 从问题中提取关键实体名称
+        """
         try:
-            response = self._llm.invoke(prompt)
-            content = response.content.strip()
-            # 处理分隔符 (中英文逗号)
-            entities = [e.strip() for e in content.replace("，", ",").split(",") if e.strip()]
-            return entities
+            with track("llm.entity_extract"):
+                response = self._llm.invoke(self._entity_prompt(query))
+            return self._parse_entities(response.content)
         except Exception:
             return []
 
-    def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
-    ) -> List[Document]:
+    async def _aextract_entities(self, query: str) -> List[str]:
         """
-        同步检索逻辑
+        异步版本：ChatOllama 原生支持 ainvoke，不占用线程
         """
-        # 1. 提取实体
-        entities = self._extract_entities(query)
-        if not entities:
+        try:
+            with track("llm.entity_extract"):
+                response = await self._llm.ainvoke(self._entity_prompt(query))
+            return self._parse_entities(response.content)
+        except Exception:
             return []
-        
-        # 2. 构造 Cypher 查询
-        # 逻辑：找到名字包含这些实体的节点，并返回它们周围 1 跳的关系
-        # (?i) 表示忽略大小写
+
+    def _query_subgraph(self, entities: List[str]) -> List[dict]:
+        """
+        构造并执行 Cypher 查询：
+        找到名字包含这些实体的节点，并返回它们周围 1 跳的关系
+        """
         cypher_query = f"""
         MATCH (n)
         WHERE any(e IN $entities WHERE n.id CONTAINS e)
@@ -72,20 +83,23 @@ class MineralGraphRetriever(BaseRetriever):
         RETURN n.id AS source, type(r) AS rel, m.id AS target
         LIMIT 100
         """
-        
-        # 3. 执行查询
         try:
-            results = self._graph.query(cypher_query, params={"entities": entities})
+            with track("neo4j_query"):
+                return self._graph.query(cypher_query, params={"entities": entities})
         except Exception as e:
             print(f"Graph query error: {e}")
             return []
 
+    @staticmethod
+    def _to_documents(results: List[dict], entities: List[str]) -> List[Document]:
+        """
+        格式化结果为 Document
+        我们把每一条关系变成一个文档，或者把所有关系合并成一个文档
+        这里选择合并成一个大文档，方便阅读
+        """
         if not results:
             return []
 
-        # 4. 格式化结果为 Document
-        # 我们把每一条关系变成一个文档，或者把所有关系合并成一个文档
-        # 这里选择合并成一个大文档，方便阅读
         triples = []
         for row in results:
             # 格式: 石膏 -[共生]-> 硬石膏
@@ -100,4 +114,33 @@ class MineralGraphRetriever(BaseRetriever):
         return [Document(
             page_content=full_text, 
             metadata={"source": "neo4j", "entities": entities}
-        )]
\ No newline at end of file
+        )]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """
+        同步检索逻辑
+        """
+        # 1. 提取实体
+        entities = self._extract_entities(query)
+        if not entities:
+            return []
+
+        # 2. 查询子图并格式化
+        results = self._query_subgraph(entities)
+        return self._to_documents(results, entities)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """
+        异步检索逻辑：实体抽取走 ChatOllama.ainvoke；
+        Neo4jGraph 只有同步接口，放入有界线程池执行 (预算超时后由 neo4j_timeout 终止查询、释放线程)
+        """
+        entities = await self._aextract_entities(query)
+        if not entities:
+            return []
+
+        results = await run_blocking(self._query_subgraph, entities)
+        return self._to_documents(results, entities)
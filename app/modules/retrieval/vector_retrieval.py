@@ -1,29 +1,40 @@
-from typing import List, Optional, Any
+import asyncio
+from typing import Any, Dict, List, Optional
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from pydantic import Field, PrivateAttr
-from langchain_milvus import Milvus
+from langchain_core.vectorstores import VectorStore
 
 # 导入你的基础设施单例
-from app.core.vector import get_vector_store
-from app.core.rerank import rerank_documents # 假设你之前写好了 rerank
+from app.core.vector import get_vector_store, get_embeddings, embed_queries, VectorStoreService
+from app.core.rerank import rerank_documents, arerank_documents, RerankService
+from app.core.metrics import track
+from app.core.executor import run_blocking
+from app.core.config import settings
+from app.core.lexical_index import get_lexical_index, reciprocal_rank_fusion
+from app.core.search_filter import to_predicate
 
 
 
 class MineralVectorRetriever(BaseRetriever):
     """
     基于 Milvus + BGE-Reranker 的企业级向量检索器。
-    实现了 LangChain 标准接口。
+    实现了 LangChain 标准接口。hybrid=True 时向量与 BM25 两路召回经 RRF 融合后再重排序。
     """
     # Pydantic 字段（对外暴露的配置参数）
     top_k: int = Field(3, description="最终返回给 LLM 的文档数量")
     search_k: int = Field(50, description="向量库初筛召回的数量")
     use_rerank: bool = Field(True, description="是否开启重排序")
+    search_preset: Optional[str] = Field(None, description="ANN 搜索档位 fast / balanced / accurate，为空使用配置默认值")
+    ann_params: Optional[Dict[str, int]] = Field(None, description="覆盖档位的 ANN 搜索参数，如 {\"ef\": 128} / {\"nprobe\": 64}")
+    hybrid: bool = Field(False, description="是否融合 BM25 词法召回 (RRF) 后再重排序")
+    binary_rescore: Optional[int] = Field(None, description="非空时先用二值码 Hamming 初筛 search_k * binary_rescore 个候选，再用全精度向量重打分")
+    filters: Optional[Dict[str, Any]] = Field(None, description="标量过滤条件 (sources / question_ids / doc_types / ingested_after / ingested_before)，下推到向量与词法检索内部")
 
     # --- 2. 声明内部私有属性 ---
     # 这告诉 Pydantic："_vector_store" 是我自己用的，你别管，也别尝试校验它
-    _vector_store: Milvus = PrivateAttr()
+    _vector_store: VectorStore = PrivateAttr()
 
     def __init__(self, **kwargs):
         """
@@ -44,18 +55,129 @@ class MineralVectorRetriever(BaseRetriever):
         else:
             initial_k = self.top_k
 
-        docs = self._vector_store.similarity_search(query=query, k=initial_k)
+        # 先单独编码 query，便于分别统计 Embedding 与 Milvus 的耗时
+        with track("embedding"):
+            query_vector = get_embeddings().embed_query(query)
+        with track("milvus_search"):
+            docs = self._vector_store.similarity_search_by_vector(
+                query_vector, k=initial_k, param=self._search_params(initial_k),
+                **VectorStoreService.search_kwargs(self.filters, self.binary_rescore)
+            )
+        if self.hybrid:
+            docs = self._fuse(docs, self._lexical_search(query, initial_k), initial_k)
 
         if not docs:
             return []
         
         doc_contents = [doc.page_content for doc in docs]
         ranked_results = rerank_documents(query, doc_contents, top_k=self.top_k)
+        return self._apply_ranking(docs, ranked_results)
 
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+        ) -> List[Document]:
+        """
+        异步检索逻辑：Embedding 是 CPU 计算，放入有界线程池；重排序交给批处理 worker 与并发请求合并前向；
+        Milvus 搜索走 AsyncMilvusClient，不占用线程。混合模式下 BM25 召回与向量召回并发执行
+        """
+        initial_k = self.search_k if self.use_rerank else self.top_k
+
+        async def _dense_search() -> List[Document]:
+            with track("embedding"):
+                query_vector = await run_blocking(get_embeddings().embed_query, query)
+            with track("milvus_search"):
+                return await self._vector_store.asimilarity_search_by_vector(
+                    query_vector, k=initial_k, param=self._search_params(initial_k),
+                    **VectorStoreService.search_kwargs(self.filters, self.binary_rescore)
+                )
+
+        if self.hybrid:
+            docs, lexical = await asyncio.gather(
+                _dense_search(), run_blocking(self._lexical_search, query, initial_k)
+            )
+            docs = self._fuse(docs, lexical, initial_k)
+        else:
+            docs = await _dense_search()
+
+        if not docs:
+            return []
+
+        doc_contents = [doc.page_content for doc in docs]
+        ranked_results = await arerank_documents(query, doc_contents, top_k=self.top_k)
+        return self._apply_ranking(docs, ranked_results)
+
+    def _search_params(self, k: int) -> Dict[str, Any]:
+        """
+        本次检索的 ANN 搜索参数 (按集合索引类型取档位，再叠加 ann_params)
+        """
+        return VectorStoreService.search_params(self.search_preset, self.ann_params, k=k)
+
+    def _lexical_search(self, query: str, k: int) -> List[Document]:
+        with track("lexical_search"):
+            return [doc for doc, _ in get_lexical_index().search(query, k, to_predicate(self.filters))]
+
+    @staticmethod
+    def _fuse(dense: List[Document], lexical: List[Document], limit: int) -> List[Document]:
+        """
+        RRF 融合向量与 BM25 两路候选，只把前 limit 条交给重排序
+        """
+        return reciprocal_rank_fusion([dense, lexical], k=settings.rrf_k)[:limit]
+
+    @staticmethod
+    def _apply_ranking(docs: List[Document], ranked_results) -> List[Document]:
+        """
+        按重排序结果 [(原始下标, 分数), ...] 取出文档并写入 rerank_score
+        """
         final_docs=[]
-        # 
         for index, score in ranked_results:
             target_doc = docs[index]
             target_doc.metadata["rerank_score"] = score
             final_docs.append(target_doc)
-        return final_docs
\ No newline at end of file
+        return final_docs
+
+    def batch_retrieve(self, queries: List[str]) -> List[List[Document]]:
+        """
+        批量检索：一次批量编码全部 query (不写入文档向量缓存) -> 一次 Milvus 批量 search
+        -> 所有 (query, doc) 对共享重排序微批。返回与 queries 一一对应的结果。
+        """
+        if not queries:
+            return []
+
+        initial_k = self.search_k if self.use_rerank else self.top_k
+
+        # 1. 一次性编码所有 query
+        with track("embedding"):
+            vectors = embed_queries(queries)
+        # 2. 一次 Milvus 请求完成所有 query 的粗排
+        with track("milvus_search"):
+            candidates = VectorStoreService.batch_similarity_search(
+                vectors, k=initial_k, filters=self.filters, param=self._search_params(initial_k),
+                binary_rescore=self.binary_rescore
+            )
+        if self.hybrid:
+            with track("lexical_search"):
+                lexical = get_lexical_index().batch_search(queries, initial_k, to_predicate(self.filters))
+            candidates = [
+                self._fuse(docs, [doc for doc, _ in hits], initial_k)
+                for docs, hits in zip(candidates, lexical)
+            ]
+
+        if not self.use_rerank:
+            return [docs[:self.top_k] for docs in candidates]
+
+        # 3. 拼接所有 query 的候选对，统一送进重排序模型
+        pairs = [(q, doc.page_content) for q, docs in zip(queries, candidates) for doc in docs]
+        scores = RerankService.compute_pair_scores(pairs)
+
+        results = []
+        offset = 0
+        for docs in candidates:
+            doc_scores = scores[offset:offset + len(docs)]
+            offset += len(docs)
+            ranked = sorted(zip(docs, doc_scores), key=lambda x: x[1], reverse=True)[:self.top_k]
+            final_docs = []
+            for doc, score in ranked:
+                doc.metadata["rerank_score"] = score
+                final_docs.append(doc)
+            results.append(final_docs)
+        return results
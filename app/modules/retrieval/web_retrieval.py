@@ -1,11 +1,13 @@
 from typing import List
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import CallbackManagerForRetrieverRun, AsyncCallbackManagerForRetrieverRun
 from langchain_core.documents import Document
 from pydantic import Field
-# 导入 DuckDuckGo 搜索工具
-from langchain_community.tools import DuckDuckGoSearchResults
-from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+# DuckDuckGo 搜索客户端 (直接使用以便设置请求超时)
+from ddgs import DDGS
+from app.core.config import settings
+from app.core.metrics import track
+from app.core.executor import run_web
 
 class MineralWebRetriever(BaseRetriever):
     """
@@ -13,15 +15,14 @@ class MineralWebRetriever(BaseRetriever):
     不需要 API Key，即插即用。
     """
     top_k: int = Field(5, description="搜索结果数量")
-    
-    # 私有属性
-    _search_tool: DuckDuckGoSearchResults = None
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # 初始化搜索包装器
-        wrapper = DuckDuckGoSearchAPIWrapper(max_results=self.top_k)
-        # backend="news" 可以搜新闻，默认搜网页
-        self._search_tool = DuckDuckGoSearchResults(api_wrapper=wrapper, output_format="list")
+
+    def _search(self, query: str) -> List[dict]:
+        """
+        执行搜索，返回 [{'snippet', 'title', 'link'}]。
+        客户端超时 (web_search_timeout) 保证卡住的请求最终释放线程
+        """
+        results = DDGS(timeout=settings.web_search_timeout).text(query, max_results=self.top_k)
+        return [{"snippet": r.get("body"), "title": r.get("title"), "link": r.get("href")} for r in results]
 
     def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
         """
@@ -29,21 +30,38 @@ class MineralWebRetriever(BaseRetriever):
         """
         try:
             #1. 执行搜索
-            # DuckDuckGoSearchResults 返回的是一个字典列表的字符串或者是对象列表
-            # 我们需要处理一下返回结果
-            raw_results = self._search_tool.invoke(query)
-
-            docs = []
-            if isinstance(raw_results, list):
-                for res in raw_results:
-                    # res 通常包含: {'snippet': '...', 'title': '...', 'link': '...'}
-                    content = f"Title: {res.get('title')}\nSnippet: {res.get('snippet')}"
-                    metadata = {"source": res.get('link'), "type": "web"}
-                    
-                    docs.append(Document(page_content=content, metadata=metadata))
-            
-            return docs
+            with track("web_search"):
+                raw_results = self._search(query)
+            return self._to_documents(raw_results)
         except Exception as e:
             # 联网搜索很容易超时或报错，一定要捕获异常，不要让整个系统崩溃
             print(f"Web search error: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """
+        异步执行搜索：DuckDuckGo 客户端只有同步实现，放入联网搜索专用线程池，
+        上层预算超时后立即放弃等待；线程中的请求由客户端超时结束，不占用共享的阻塞线程池
+        """
+        try:
+            with track("web_search"):
+                raw_results = await run_web(self._search, query)
+            return self._to_documents(raw_results)
+        except Exception as e:
+            print(f"Web search error: {e}")
+            return []
+
+    @staticmethod
+    def _to_documents(raw_results) -> List[Document]:
+        docs = []
+        if isinstance(raw_results, list):
+            for res in raw_results:
+                # res 通常包含: {'snippet': '...', 'title': '...', 'link': '...'}
+                content = f"Title: {res.get('title')}\nSnippet: {res.get('snippet')}"
+                metadata = {"source": res.get('link'), "type": "web"}
+                
+                docs.append(Document(page_content=content, metadata=metadata))
+        
+        return docs
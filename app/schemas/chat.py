@@ -1,6 +1,8 @@
 # app/schemas/chat.py
+import json
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 
 class SourceDocument(BaseModel):
     source_type: str = Field(..., description="来源类型: vector/graph/web")
@@ -8,15 +10,58 @@ class SourceDocument(BaseModel):
     score: Optional[float] = Field(None, description="相关性分数")
     metadata: Dict[str, Any] = Field(default_factory=dict, description="额外信息")
 
+class RetrievalFilter(BaseModel):
+    """
+    向量 / 词法检索的标量过滤条件，下推到 Milvus 搜索内部执行 (图谱与联网检索不受影响)
+    """
+    sources: Optional[List[str]] = Field(None, min_length=1, description="只检索这些源文件 (入库时的文件名)")
+    question_ids: Optional[List[int]] = Field(None, min_length=1, description="只检索这些 HotpotQA 问题的上下文")
+    doc_types: Optional[List[str]] = Field(None, min_length=1, description="文档类型，如 pdf / docx / md / txt / wikipedia")
+    ingested_after: Optional[datetime] = Field(None, description="只检索此时间 (含) 之后入库的分块")
+    ingested_before: Optional[datetime] = Field(None, description="只检索此时间之前入库的分块")
+
 class ChatRequest(BaseModel):
     query: str = Field(..., min_length=1, example="石膏的用途是什么？") # type: ignore
     top_k: int = Field(3, ge=1, le=10)
+    enable_vector: bool = True
     enable_graph: bool = True
     enable_web: bool = False
+    budget_ms: Optional[int] = Field(None, ge=100, description="端到端延迟预算 (毫秒)，超时的检索源会被丢弃")
+    search_preset: Optional[Literal["fast", "balanced", "accurate"]] = Field(None, description="向量检索的延迟 / 召回档位，为空使用服务默认档位")
+    ann_params: Optional[Dict[str, int]] = Field(None, description="直接指定 ANN 搜索参数 (如 {\"ef\": 128} 或 {\"nprobe\": 64})，覆盖档位中的同名参数")
+    filters: Optional[RetrievalFilter] = Field(None, description="向量检索过滤条件")
+
+    def options_key(self) -> str:
+        """
+        除 query 以外影响回答内容的请求选项，缓存与请求合并时用它判断两个请求是否等价。
+        budget_ms 不参与：完整回答对任何预算都成立，不完整的回答本身不会进缓存
+        """
+        return json.dumps(self.model_dump(exclude={"query", "budget_ms"}), sort_keys=True, default=str)
+
+    def vector_options(self) -> Dict[str, Any]:
+        """
+        覆盖向量检索器字段的请求选项，只包含非空项
+        """
+        options = {
+            "search_preset": self.search_preset,
+            "ann_params": self.ann_params,
+            "filters": self.filters.model_dump(exclude_none=True) if self.filters else None,
+        }
+        return {k: v for k, v in options.items() if v}
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceDocument] = []
     latency: float
     # 【修改点】添加 reasoning_trace，并给默认值 []
-    reasoning_trace: List[str] = Field(default_factory=list, description="Agent的中间思考过程")
\ No newline at end of file
+    reasoning_trace: List[str] = Field(default_factory=list, description="Agent的中间思考过程")
+    cached: bool = Field(False, description="是否命中语义答案缓存")
+    stage_latency: Dict[str, float] = Field(default_factory=dict, description="各节点/后端调用耗时明细 (秒)")
+    dropped_sources: List[str] = Field(default_factory=list, description="因超出延迟预算被丢弃的检索源")
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., min_length=1, max_length=500, description="批量问答请求列表")
+
+class ChatBatchResponse(BaseModel):
+    responses: List[ChatResponse] = Field(default_factory=list, description="与 requests 一一对应的回答")
+    latency: float = Field(..., description="整批耗时 (秒)")
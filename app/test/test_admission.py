@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from app.core.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(max_concurrency=1, max_queue=10, queue_timeout=1.0) -> AdmissionController:
+    return AdmissionController("Test", max_concurrency=max_concurrency, max_queue=max_queue, queue_timeout=queue_timeout)
+
+
+def test_acquire_within_concurrency_does_not_queue():
+    async def main():
+        controller = _controller(max_concurrency=2)
+        await controller.acquire()
+        await controller.acquire()
+        assert controller.active == 2 and controller.queue_depth == 0
+        controller.release()
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(main())
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    order = []
+
+    async def worker(controller, name, priority):
+        async with controller.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        controller = _controller(max_concurrency=1)
+        await controller.acquire()
+        tasks = []
+        for name, priority in [("b1", "batch"), ("i1", "interactive"), ("b2", "batch"), ("i2", "interactive")]:
+            tasks.append(asyncio.ensure_future(worker(controller, name, priority)))
+            await asyncio.sleep(0)
+        assert controller.queue_depth == 4
+        controller.release()
+        await asyncio.gather(*tasks)
+        assert controller.active == 0
+
+    asyncio.run(main())
+    assert order == ["i1", "i2", "b1", "b2"]
+
+
+def test_full_queue_rejects_with_429():
+    async def main():
+        controller = _controller(max_concurrency=1, max_queue=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire()
+        controller.release()
+        await waiter
+        return info.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert rejected.retry_after >= 1
+
+
+def test_queue_timeout_rejects_with_503_and_frees_queue():
+    async def main():
+        controller = _controller(max_concurrency=1, queue_timeout=0.02)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire()
+        assert controller.queue_depth == 0
+        # 超时的等待者不应拿走随后归还的名额
+        controller.release()
+        assert controller.active == 0
+        return info.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 503
+
+
+def test_rejection_maps_to_http_exception_with_retry_after():
+    exc = AdmissionRejected(503, 7, "服务繁忙，排队超时").to_http_exception()
+    assert exc.status_code == 503
+    assert exc.headers == {"Retry-After": "7"}
+    assert exc.detail == "服务繁忙，排队超时"
+
+
+def test_retry_after_grows_with_backlog():
+    async def main():
+        controller = _controller(max_concurrency=1, max_queue=10)
+        await controller.acquire()
+        short = controller._retry_after()
+        waiters = [asyncio.ensure_future(controller.acquire()) for _ in range(4)]
+        await asyncio.sleep(0)
+        long = controller._retry_after()
+        for _ in range(5):
+            controller.release()
+        await asyncio.gather(*waiters)
+        return short, long
+
+    short, long = asyncio.run(main())
+    assert long > short
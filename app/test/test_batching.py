@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from app.core.batching import plan_length_batches
+
+
+def _random_lengths(seed: int, n: int) -> list[int]:
+    rng = random.Random(seed)
+    return [rng.randint(1, 512) for _ in range(n)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("budget,max_size", [(4096, 32), (8192, 64), (512, 8), (100000, 16)])
+def test_batches_respect_budget_and_cover_all(seed, budget, max_size):
+    lengths = _random_lengths(seed, 300)
+    batches = plan_length_batches(lengths, budget, max_size)
+
+    # 每个下标恰好出现一次
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert 0 < len(batch) <= max_size
+        assert max(lengths[i] for i in batch) * len(batch) <= budget
+
+
+def test_batches_are_sorted_descending():
+    lengths = _random_lengths(0, 200)
+    batches = plan_length_batches(lengths, 4096, 32)
+    flat = [lengths[i] for batch in batches for i in batch]
+
+    assert flat == sorted(lengths, reverse=True)
+
+
+def test_short_sequences_get_larger_batches():
+    lengths = [500] * 8 + [20] * 64
+    batches = plan_length_batches(lengths, 2048, 64)
+
+    assert [len(b) for b in batches] == [4, 4, 64]
+
+
+def test_oversized_item_goes_alone():
+    batches = plan_length_batches([600, 10, 10], 512, 8)
+
+    assert batches == [[0], [1, 2]]
+
+
+def test_empty_input():
+    assert plan_length_batches([], 4096, 32) == []
+
+
+def test_zero_lengths_do_not_overfill():
+    # 长度按 1 计，批大小仍受预算约束
+    batches = plan_length_batches([0] * 10, 4, 100)
+
+    assert [len(b) for b in batches] == [4, 4, 2]
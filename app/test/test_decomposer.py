@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+pytest.importorskip("langchain_ollama")
+
+from app.core.decomposer import MULTI_HOP_PATTERN, QueryDecomposer, dedupe_queries
+
+
+@pytest.mark.parametrize("query", [
+    "石英和长石哪个更硬？",
+    "石英与方解石的区别是什么？",
+    "黄铁矿和黄铜矿的化学成分分别是什么？",
+    "Were Scott Derrickson and Ed Wood of the same nationality?",
+    "Are Random House Tower and 888 7th Avenue both used for real estate?",
+    "Which is older, the Eiffel Tower or the Statue of Liberty, compared by completion year?",
+    "What government position was held by the woman who portrayed Corliss Archer in the film Kiss and Tell?",
+])
+def test_multi_hop_questions_are_decomposed(query):
+    assert QueryDecomposer.needs_decomposition(query)
+
+
+@pytest.mark.parametrize("query", [
+    "你好",
+    "谢谢你和你的团队",
+    "今天天气和心情都不错",
+    "石英的化学成分是什么？",
+    "黄铁矿的硬度和比重是多少？",
+    "What is the chemical formula of hematite?",
+    "Which minerals are associated with cassiterite?",
+    "In which year was the mineral quartz first described?",
+    "Tell me a joke and make it funny",
+    "What is that mineral called?",
+    "What happens when calcite meets acid?",
+])
+def test_single_hop_and_chit_chat_are_not_decomposed(query):
+    assert not QueryDecomposer.needs_decomposition(query), MULTI_HOP_PATTERN.search(query)
+
+
+def test_dedupe_keeps_order_and_drops_normalized_duplicates():
+    queries = ["石英的硬度是多少？", "石英的硬度是多少", "  石英的硬度是多少? ", "长石的硬度是多少？"]
+    assert dedupe_queries(queries) == ["石英的硬度是多少？", "长石的硬度是多少？"]
+
+
+def test_dedupe_drops_high_overlap_and_blank_queries():
+    queries = [
+        "What is the nationality of Scott Derrickson?",
+        "what is the nationality of scott derrickson",
+        "",
+        "   ",
+        "What is the nationality of Ed Wood?",
+    ]
+    assert dedupe_queries(queries) == [
+        "What is the nationality of Scott Derrickson?",
+        "What is the nationality of Ed Wood?",
+    ]
+
+
+def test_dedupe_overlap_threshold():
+    queries = ["quartz hardness scale value", "quartz hardness scale"]
+    # Jaccard = 3 / 4
+    assert dedupe_queries(queries, overlap=0.8) == queries
+    assert dedupe_queries(queries, overlap=0.7) == queries[:1]
@@ -0,0 +1,125 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from langchain_core.documents import Document
+
+from app.core.dedup import MinHasher, NearDuplicateIndex
+
+BASE = (
+    "黄铁矿是一种铁的二硫化物，化学式为 FeS2，常呈立方体晶形，具有浅黄铜色和强金属光泽，"
+    "莫氏硬度 6 到 6.5，常与黄铜矿、方铅矿、闪锌矿共生，广泛分布于热液矿床与沉积岩中。"
+)
+NEAR = BASE.replace("广泛分布于", "普遍分布于")
+OTHER = (
+    "石英是地壳中最常见的矿物之一，化学成分为二氧化硅，莫氏硬度为 7，"
+    "无解理，贝壳状断口，常见于花岗岩、伟晶岩和各类热液脉中，是重要的工业原料。"
+)
+
+
+def _doc(text: str, source: str = "a.pdf") -> Document:
+    return Document(page_content=text, metadata={"source": source})
+
+
+def _jaccard(a: str, b: str, n: int = 5) -> float:
+    sa = {a[i:i + n] for i in range(len(a) - n + 1)}
+    sb = {b[i:i + n] for i in range(len(b) - n + 1)}
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_signature_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    for a, b in [(BASE, NEAR), (BASE, OTHER)]:
+        estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+        assert abs(estimate - _jaccard(a, b)) < 0.1
+
+
+def test_signature_ignores_case_width_and_whitespace():
+    hasher = MinHasher()
+    assert (hasher.signature("Pyrite  FeS2 黄铁矿") == hasher.signature("ｐｙｒｉｔｅ fes2\n黄铁矿")).all()
+
+
+def test_split_skips_duplicates_within_batch_and_against_index(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    kept, duplicates = index.split([_doc(BASE), _doc(NEAR), _doc(OTHER)])
+    assert [d.page_content for d in kept] == [BASE, OTHER]
+    assert [d.page_content for d, _ in duplicates] == [NEAR]
+    assert duplicates[0][1]["source"] == "a.pdf"
+
+    # split 只判断不登记：入库确认后才 add
+    assert len(index) == 0
+    index.add(kept)
+    kept, duplicates = index.split([_doc(NEAR, "b.pdf"), _doc("全新的内容，与库中任何分块都不相似。" * 3, "b.pdf")])
+    assert len(kept) == 1 and len(duplicates) == 1
+    assert duplicates[0][1]["source"] == "a.pdf"
+
+
+def test_delete_by_source_and_reload(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    index.add([_doc(BASE, "a.pdf"), _doc(OTHER, "b.pdf")])
+
+    reopened = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    assert len(reopened) == 2
+    assert reopened.delete_by_source("a.pdf") == 1
+    # 旧版本删除后，重新上传的新版本不应被判为重复
+    kept, _ = reopened.split([_doc(NEAR, "a.pdf")])
+    assert len(kept) == 1
+
+    again = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    assert len(again) == 1
+    assert len(again.split([_doc(OTHER)])[1]) == 1
+
+
+def test_load_truncates_uncommitted_tail(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    index.add([_doc(BASE)])
+    # 模拟写了签名与 meta、未更新 manifest 就中断
+    with open(index._signatures_path, "ab") as f:
+        f.write(b"\x01" * 64)
+    with open(index._meta_path, "a", encoding="utf-8") as f:
+        f.write('{"source": "half')
+
+    reopened = NearDuplicateIndex(str(tmp_path), threshold=0.8)
+    assert len(reopened) == 1
+    reopened.add([_doc(OTHER, "b.pdf")])
+    assert len(NearDuplicateIndex(str(tmp_path), threshold=0.8)) == 2
+    assert len(NearDuplicateIndex(str(tmp_path), threshold=0.8).split([_doc(OTHER)])[1]) == 1
+
+
+def _hotpot(text: str, question_id: int) -> Document:
+    return Document(page_content=text, metadata={"source": "hotpotqa", "question_id": question_id, "doc_type": "wikipedia"})
+
+
+def test_scoped_dedup_keeps_shared_paragraph_per_question(tmp_path):
+    # 不同问题共用的段落各保留一份，按 question_ids 过滤时每个问题都能检索到
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.8, scope_fields=("source", "question_id", "doc_type"))
+    kept, duplicates = index.split([_hotpot(BASE, 0), _hotpot(OTHER, 0), _hotpot(NEAR, 1), _hotpot(BASE, 0)])
+    assert [(d.page_content, d.metadata["question_id"]) for d in kept] == [(BASE, 0), (OTHER, 0), (NEAR, 1)]
+    assert len(duplicates) == 1
+
+    index.add(kept)
+    kept, duplicates = index.split([_hotpot(BASE, 1), _hotpot(BASE, 2)])
+    assert [d.metadata["question_id"] for d in kept] == [2]
+    assert duplicates[0][1]["question_id"] == 1
+
+
+def test_scope_treats_missing_fields_as_defaults(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path), threshold=0.8, scope_fields=("source", "question_id"))
+    index.add([_doc(BASE, "a.pdf")])
+    # 早期登记的行没有 question_id (None)，与补齐后的缺省值 -1 视为同一范围
+    index._meta[0]["question_id"] = None
+    doc = Document(page_content=NEAR, metadata={"source": "a.pdf", "question_id": -1})
+    assert len(index.split([doc])[1]) == 1
+    assert len(index.split([_doc(NEAR, "b.pdf")])[0]) == 1
+
+
+def test_unknown_scope_field_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(str(tmp_path), scope_fields=("ingested_at",))
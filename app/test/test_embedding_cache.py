@@ -0,0 +1,86 @@
+import os
+import sys
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.embedding_cache import CachedEmbeddings
+
+
+class LengthEmbeddings(Embeddings):
+    """
+    确定性的假模型：向量由文本长度决定，并记录每次实际编码的文本
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[1.0, float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_hits_are_read_from_disk(tmp_path):
+    inner = LengthEmbeddings()
+    cache = CachedEmbeddings(inner, "ns", str(tmp_path))
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [1.0, 2.0], [1.0, 1.0]]
+    assert inner.calls == [["a", "bb"]]
+
+    reopened = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.embed_documents(["bb", "ccc"]) == [[1.0, 2.0], [1.0, 3.0]]
+    assert reopened.inner.calls == [["ccc"]]
+
+
+def test_namespaces_do_not_share_vectors(tmp_path):
+    CachedEmbeddings(LengthEmbeddings(), "model-a", str(tmp_path)).embed_documents(["a"])
+    other = CachedEmbeddings(LengthEmbeddings(), "model-b", str(tmp_path))
+    assert len(other) == 0
+
+
+def test_instances_sharing_a_directory_see_each_others_rows(tmp_path):
+    # 两个实例模拟服务进程与入库脚本同时打开同一缓存目录
+    first = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+    second = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+
+    first.embed_documents(["a"])
+    second.embed_documents(["bb", "ccc"])
+    # first 追加的行必须接在 second 写入的行之后，读回的是自己的向量
+    assert first.embed_documents(["dddd"]) == [[1.0, 4.0]]
+    assert first.embed_documents(["bb", "ccc", "dddd"]) == [[1.0, 2.0], [1.0, 3.0], [1.0, 4.0]]
+    assert first.inner.calls == [["a"], ["dddd"]]
+    assert second.embed_documents(["dddd", "a"]) == [[1.0, 4.0], [1.0, 1.0]]
+    assert second.inner.calls == [["bb", "ccc"]]
+
+    reopened = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+    assert reopened.embed_documents(["a", "bb", "ccc", "dddd"]) == [[1.0, 1.0], [1.0, 2.0], [1.0, 3.0], [1.0, 4.0]]
+    assert reopened.inner.calls == []
+
+
+def test_truncates_interrupted_write(tmp_path):
+    cache = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+    cache.embed_documents(["a", "bb"])
+    # 模拟只写了向量、没写键就中断
+    with open(cache._vectors_path, "ab") as f:
+        f.write(b"\x00" * 4)
+
+    reopened = CachedEmbeddings(LengthEmbeddings(), "ns", str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.embed_documents(["ccc", "a"]) == [[1.0, 3.0], [1.0, 1.0]]
+
+
+def test_queries_do_not_enter_document_cache(tmp_path):
+    inner = LengthEmbeddings()
+    cache = CachedEmbeddings(inner, "ns", str(tmp_path), query_cache_size=2)
+    assert cache.embed_queries(["q1", "q22", "q1"]) == [[1.0, 2.0], [1.0, 3.0], [1.0, 2.0]]
+    assert cache.embed_queries(["q22"]) == [[1.0, 3.0]]
+    assert inner.calls == [["q1", "q22"]]
+    assert len(cache) == 0
+    assert not os.path.exists(cache._keys_path)
@@ -0,0 +1,72 @@
+import sys
+import os
+
+import numpy as np
+import pytest
+
+# --- 1. 设置路径 ---
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("langchain_huggingface")
+
+from app.core.config import settings
+from app.core.vector import build_embeddings
+
+# 默认对比正式使用的 BGE-M3；CI 上可用 PARITY_MODEL 换成小模型
+MODEL_NAME = os.environ.get("PARITY_MODEL", settings.embedding_model)
+
+TEXTS = [
+    "石英的化学成分是二氧化硅 (SiO2)，莫氏硬度为 7。",
+    "黄铁矿 FeS2 常与黄铜矿、方铅矿共生，具有金属光泽。",
+    "方解石遇稀盐酸剧烈起泡，是鉴定碳酸盐矿物的常用方法。",
+    "Which minerals are associated with cassiterite in granite-related tin deposits?",
+    "你好",
+]
+
+# 与 fp32 参考向量的最小余弦相似度
+MIN_COSINE = {
+    "int8": 0.98,
+    "onnx": 0.999,
+}
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return np.asarray(build_embeddings(MODEL_NAME, "torch").embed_documents(TEXTS))
+
+
+@pytest.mark.parametrize("backend", ["int8", "onnx"])
+def test_backend_matches_fp32(backend, reference):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("optimum")
+
+    vectors = np.asarray(build_embeddings(MODEL_NAME, backend).embed_documents(TEXTS))
+    assert vectors.shape == reference.shape
+
+    cosine = np.sum(vectors * reference, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+    assert cosine.min() >= MIN_COSINE[backend], f"{backend} 余弦相似度过低: {cosine.round(4).tolist()}"
+
+    # 检索排序也应一致：参考向量中最近邻明显领先 (差距 > 0.02) 的文本，其最近邻 (排除自身) 不变
+    def similarities(m):
+        sims = m @ m.T
+        np.fill_diagonal(sims, -np.inf)
+        return sims
+
+    ref_sims, sims = similarities(reference), similarities(vectors)
+    top2 = np.sort(ref_sims, axis=1)[:, -2:]
+    clear = (top2[:, 1] - top2[:, 0]) > 0.02
+    assert (ref_sims.argmax(axis=1)[clear] == sims.argmax(axis=1)[clear]).all()
+
+
+def test_onnx_backend_without_extra_names_it(monkeypatch):
+    # sys.modules 中置为 None 的模块在 import 时抛出 ImportError
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="--extra onnx"):
+        build_embeddings(MODEL_NAME, "onnx")
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from langchain_core.documents import Document
+
+from app.core.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "黄铁矿 FeS₂ 呈浅黄铜色，具强金属光泽。",
+    "石英的化学成分是 SiO2，莫氏硬度为 7。",
+    "方解石遇稀盐酸剧烈起泡。",
+    "Pyrite is often called fool's gold.",
+]
+METADATAS = [
+    {"source": "a.pdf"},
+    {"source": "a.pdf"},
+    {"source": "b.pdf"},
+    {"source": "b.pdf"},
+]
+
+
+def _index(tmp_path) -> LexicalIndex:
+    index = LexicalIndex(str(tmp_path))
+    index.add(TEXTS, METADATAS)
+    return index
+
+
+def test_tokenize_normalizes_formulas_and_splits_chinese_bigrams():
+    assert tokenize("FeS₂ 黄铁矿") == ["fes2", "黄铁", "铁矿"]
+    assert tokenize("Ｐｙｒｉｔｅ 7.5") == ["pyrite", "7.5"]
+
+
+def test_search_ranks_exact_term_matches(tmp_path):
+    index = _index(tmp_path)
+    results = index.search("FeS2 的颜色", k=2)
+    assert results[0][0].page_content == TEXTS[0]
+    assert all(score > 0 for _, score in results)
+    assert index.search("pyrite", k=5)[0][0].page_content == TEXTS[3]
+    assert index.search("不存在的词汇", k=5) == []
+
+
+def test_predicate_filters_on_metadata(tmp_path):
+    index = _index(tmp_path)
+    results = index.search("石英 方解石", k=5, predicate=lambda m: m["source"] == "b.pdf")
+    assert [doc.page_content for doc, _ in results] == [TEXTS[2]]
+
+
+def test_delete_compact_and_reload(tmp_path):
+    index = _index(tmp_path)
+    assert index.delete_by_source("a.pdf") == 2
+    assert index.search("石英", k=5) == []
+
+    reopened = LexicalIndex(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.search("石英", k=5) == []
+    assert reopened.search("方解石", k=5)[0][0].page_content == TEXTS[2]
+
+    # 墓碑过半时压缩，文档号重新编排后检索结果不变
+    reopened.delete_by_source("b.pdf")
+    assert len(reopened) == 0
+    assert reopened.search("方解石", k=5) == []
+
+
+def test_search_during_concurrent_writes(tmp_path):
+    index = _index(tmp_path)
+    errors = []
+
+    def writer():
+        for i in range(200):
+            index.add([f"石英 样品 {i}"], [{"source": "c.pdf"}])
+
+    def reader():
+        try:
+            for _ in range(200):
+                for doc, _ in index.search("石英", k=10):
+                    assert "石英" in doc.page_content
+        except Exception as e:  # pragma: no cover - 失败时在主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(index.search("石英", k=1000)) == 201
+
+
+def test_reciprocal_rank_fusion_merges_by_content():
+    a, b, c = (Document(page_content=t) for t in ("a", "b", "c"))
+    fused = reciprocal_rank_fusion([[a, b], [Document(page_content="b"), c]], k=60)
+    assert [d.page_content for d in fused] == ["b", "a", "c"]
+    # 多路出现时保留第一路的对象
+    assert fused[0] is b
@@ -0,0 +1,151 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from pydantic import ValidationError
+
+from app.core.config import Settings
+from app.core.local_vector import LocalVectorStore
+
+DIM = 384
+N = 2000
+K = 10
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # 真实句向量集中在低维子空间里 (各向异性)；各向同性的高斯向量近邻几乎等距，
+    # 任何近似检索的召回都没有参考意义。查询取自语料附近，保证真实近邻彼此可分
+    rng = np.random.default_rng(0)
+    basis = rng.normal(size=(32, DIM))
+    vectors = rng.normal(size=(N, 32)) @ basis
+    queries = vectors[rng.integers(N, size=20)] + 0.3 * rng.normal(size=(20, 32)) @ basis
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def _store(path, vectors, **kwargs) -> LocalVectorStore:
+    store = LocalVectorStore(embedding_function=None, persist_dir=str(path), dtype="float32", **kwargs) # type: ignore
+    store.add_embeddings(
+        [f"doc {i}" for i in range(len(vectors))],
+        vectors.tolist(),
+        [{"source": "even.pdf" if i % 2 == 0 else "odd.pdf", "row": i} for i in range(len(vectors))],
+    )
+    return store
+
+
+def _rows(hits):
+    return [doc.metadata["row"] for doc, _ in hits]
+
+
+def _recall(store, queries, truth, **kwargs) -> float:
+    results = store.batch_search_with_score(queries.tolist(), K, **kwargs)
+    return float(np.mean([len(set(_rows(hits)) & set(expected)) / K for hits, expected in zip(results, truth)]))
+
+
+def _truth(vectors, queries, allowed=None):
+    scores = queries @ vectors.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :K]
+
+
+def test_flat_search_is_exact(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors)
+    results = store.batch_search_with_score(queries.tolist(), K)
+    truth = _truth(vectors, queries)
+    for hits, expected in zip(results, truth):
+        assert _rows(hits) == expected.tolist()
+        scores = [s for _, s in hits]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_predicate_and_deletes_are_pushed_down(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors)
+    store.delete_by_source("odd.pdf")
+    allowed = np.arange(N) % 2 == 0
+    assert _recall(store, queries, _truth(vectors, queries, allowed)) == 1.0
+
+    only_first = lambda m: m["row"] < 5
+    hits = store.batch_search_with_score(queries[:1].tolist(), K, predicate=only_first)[0]
+    assert sorted(_rows(hits)) == [0, 2, 4]
+
+
+def test_binary_rescore_recall(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors)
+    truth = _truth(vectors, queries)
+    assert _recall(store, queries, truth, binary_rescore=4) >= 0.9
+    # 候选数覆盖全集时退化为精确检索
+    assert _recall(store, queries, truth, binary_rescore=N) == 1.0
+
+
+def test_binary_codes_follow_writes_and_reload(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors[:1000])
+    store.batch_search_with_score(queries[:1].tolist(), K, binary_rescore=4)
+    # 二值码建好之后的写入要同步追加
+    store.add_embeddings(
+        [f"doc {i}" for i in range(1000, N)],
+        vectors[1000:].tolist(),
+        [{"source": "x.pdf", "row": i} for i in range(1000, N)],
+    )
+    assert store._codes.shape == (N, DIM // 8)
+
+    reopened = LocalVectorStore(embedding_function=None, persist_dir=str(tmp_path)) # type: ignore
+    assert len(reopened) == N
+    assert _recall(reopened, queries, _truth(vectors, queries), binary_rescore=N) == 1.0
+
+
+def test_binary_rescore_respects_filters(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors)
+    results = store.batch_search_with_score(
+        queries.tolist(), K, predicate=lambda m: m["source"] == "even.pdf", binary_rescore=4
+    )
+    assert all(row % 2 == 0 for hits in results for row in _rows(hits))
+
+
+def test_hnsw_search_recall_and_ef(tmp_path, corpus):
+    pytest.importorskip("hnswlib")
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors, index_type="hnsw")
+    truth = _truth(vectors, queries)
+    assert _recall(store, queries, truth, param={"params": {"ef": 256}}) >= 0.95
+
+    # 严格过滤时退化为候选子集上的暴力检索
+    store.delete_by_source("odd.pdf")
+    hits = store.batch_search_with_score(queries[:1].tolist(), K, predicate=lambda m: m["row"] < 40)[0]
+    assert all(row % 2 == 0 and row < 40 for row in _rows(hits))
+    assert len(hits) == K
+
+
+def test_compact_keeps_ids_and_results(tmp_path, corpus):
+    vectors, queries = corpus
+    store = _store(tmp_path, vectors[:100])
+    before = {doc.metadata["row"]: doc.metadata["pk"] for doc, _ in store.batch_search_with_score(queries[:1].tolist(), 100)[0]}
+    store.delete_by_source("odd.pdf")
+    store.delete(ids=[before[0]])  # 墓碑过半，触发压缩
+    assert len(store) == 49
+    after = store.batch_search_with_score(queries[:1].tolist(), 100)[0]
+    assert sorted(_rows(after)) == list(range(2, 100, 2))
+    assert all(doc.metadata["pk"] == before[doc.metadata["row"]] for doc, _ in after)
+
+
+def test_binary_quantization_requires_local_backend():
+    # Milvus 集合没有二值向量字段，配置组合在启动时被拒绝，而不是悄悄退回全精度
+    with pytest.raises(ValidationError, match="local"):
+        Settings(vector_backend="milvus", vector_quantization="binary")
+    with pytest.raises(ValidationError):
+        Settings(vector_quantization="int4")
+    assert Settings(vector_backend="local", vector_quantization="binary").vector_quantization == "binary"
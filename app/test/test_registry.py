@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from app.core import registry as registry_module
+from app.core.registry import ComponentRegistry, REQUIRED_COMPONENTS
+
+
+def _fail():
+    raise RuntimeError("不应在启动时加载")
+
+
+async def _run_inline(fn, *args):
+    # 预热函数直接在当前线程执行，不经过线程池
+    return fn(*args)
+
+
+def _patch_warmers(monkeypatch, fn):
+    for name in ("_warm_embedding", "_warm_reranker", "_warm_vector_store", "_warm_neo4j",
+                 "_warm_llm", "_warm_router", "web_retriever"):
+        monkeypatch.setattr(ComponentRegistry, name, staticmethod(fn))
+
+
+def test_not_ready_before_start():
+    assert not ComponentRegistry().ready
+
+
+def test_warmup_off_is_ready_without_loading(monkeypatch):
+    _patch_warmers(monkeypatch, _fail)
+    registry = ComponentRegistry()
+    asyncio.run(registry.start(warm=False))
+
+    assert registry.started and registry.lazy
+    assert registry.ready
+    assert registry.status == {}
+
+
+def test_warmup_on_reports_each_component(monkeypatch):
+    _patch_warmers(monkeypatch, lambda: None)
+    monkeypatch.setattr(registry_module, "run_blocking", _run_inline)
+    registry = ComponentRegistry()
+    asyncio.run(registry.start())
+
+    assert registry.ready
+    assert all(registry.status[name]["ready"] for name in REQUIRED_COMPONENTS)
+
+
+def test_required_component_failure_is_not_ready(monkeypatch):
+    _patch_warmers(monkeypatch, lambda: None)
+    monkeypatch.setattr(ComponentRegistry, "_warm_llm", staticmethod(_fail))
+    monkeypatch.setattr(registry_module, "run_blocking", _run_inline)
+    registry = ComponentRegistry()
+    asyncio.run(registry.start())
+
+    assert not registry.ready
+    assert registry.status["llm"]["ready"] is False
+    assert registry.status["neo4j"]["ready"] is True
+
+
+def test_optional_component_failure_stays_ready(monkeypatch):
+    _patch_warmers(monkeypatch, lambda: None)
+    monkeypatch.setattr(ComponentRegistry, "_warm_neo4j", staticmethod(_fail))
+    monkeypatch.setattr(registry_module, "run_blocking", _run_inline)
+    registry = ComponentRegistry()
+    asyncio.run(registry.start())
+
+    assert registry.ready
+    assert registry.status["neo4j"]["ready"] is False
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from app.core.config import settings
+from app.core.rerank import RerankBatcher, RerankService
+
+
+@pytest.fixture
+def forward_calls(monkeypatch):
+    """
+    用确定性的假前向替换模型 (分数 = 文档长度)，记录每次真正送进模型的 pair
+    """
+    calls: list[list[tuple[str, str]]] = []
+
+    def fake_forward(cls, pairs, batch_size=None):
+        calls.append(list(pairs))
+        return [float(len(d)) for _, d in pairs]
+
+    monkeypatch.setattr(RerankService, "_forward", classmethod(fake_forward))
+    monkeypatch.setattr(RerankService, "_score_cache", type(RerankService._score_cache)())
+    monkeypatch.setattr(settings, "rerank_cache_enabled", True)
+    monkeypatch.setattr(settings, "rerank_cache_size", 100)
+    return calls
+
+
+def test_hits_skip_forward(forward_calls):
+    docs = ["黄铁矿", "石英晶体", "方解石遇酸起泡"]
+    first = RerankService.compute_score("黄铁矿是什么", docs)
+    second = RerankService.compute_score("黄铁矿是什么", docs)
+
+    assert first == second == [3.0, 4.0, 7.0]
+    assert len(forward_calls) == 1
+
+
+def test_only_misses_are_forwarded(forward_calls):
+    RerankService.compute_score("q", ["a", "bb"])
+    scores = RerankService.compute_score("q", ["bb", "ccc", "a"])
+
+    assert scores == [2.0, 3.0, 1.0]
+    assert forward_calls[-1] == [("q", "ccc")]
+
+
+def test_query_is_normalized(forward_calls):
+    RerankService.compute_score("What is Pyrite?", ["doc"])
+    RerankService.compute_score("  what is pyrite? ", ["doc"])
+
+    assert len(forward_calls) == 1
+
+
+def test_duplicate_misses_are_deduped(forward_calls):
+    # 重叠子问题会把同一批候选重复送进来
+    pairs = [("q", "a"), ("q", "bb"), ("q", "a"), ("q2", "a")]
+    scores = RerankService.compute_pair_scores(pairs)
+
+    assert scores == [1.0, 2.0, 1.0, 1.0]
+    assert forward_calls == [[("q", "a"), ("q", "bb"), ("q2", "a")]]
+
+
+def test_lru_eviction(forward_calls, monkeypatch):
+    monkeypatch.setattr(settings, "rerank_cache_size", 2)
+    RerankService.compute_score("q", ["a", "bb"])
+    RerankService.compute_score("q", ["a"])  # 刷新 a 为最近使用
+    RerankService.compute_score("q", ["ccc"])  # 淘汰 bb
+    assert len(RerankService._score_cache) == 2
+
+    forward_calls.clear()
+    RerankService.compute_score("q", ["a", "bb"])
+    assert forward_calls == [[("q", "bb")]]
+
+
+def test_cache_disabled(forward_calls, monkeypatch):
+    monkeypatch.setattr(settings, "rerank_cache_enabled", False)
+    RerankService.compute_score("q", ["a", "a"])
+    RerankService.compute_score("q", ["a"])
+
+    assert forward_calls == [[("q", "a"), ("q", "a")], [("q", "a")]]
+    assert len(RerankService._score_cache) == 0
+
+
+def test_batcher_merge_limit_follows_forward_budget(monkeypatch):
+    # 合并上限由前向预算推出，调大预算不会被另一个独立的上限抵消
+    monkeypatch.setattr(settings, "rerank_batch_max_forwards", 3)
+    monkeypatch.setattr(settings, "rerank_batch_token_budget", 4096)
+    assert RerankBatcher.merge_limit() == 3 * 4096
+
+    monkeypatch.setattr(settings, "rerank_batch_token_budget", 0)
+    monkeypatch.setattr(settings, "rerank_batch_size", 16)
+    assert RerankBatcher.merge_limit() == 3 * 16 * 512
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+pytest.importorskip("langchain_ollama")
+pytest.importorskip("langchain_milvus")
+pytest.importorskip("langchain_huggingface")
+
+from app.core.config import settings
+from app.core.router import SemanticRouter
+
+SIMS = {"vector": 0.72, "graph": 0.69, "web": 0.41, "generate": 0.30}
+
+
+def test_below_threshold_defers_to_llm():
+    assert SemanticRouter.decide(SIMS, threshold=0.8, margin=0.0) is None
+
+
+def test_close_runner_up_defers_to_llm():
+    # vector 与 graph 只差 0.03，快速层不应同时选中两者冒充高置信度
+    assert SemanticRouter.decide(SIMS, threshold=0.6, margin=0.05) is None
+
+
+def test_clear_winner_selects_only_top_route():
+    assert SemanticRouter.decide(SIMS, threshold=0.6, margin=0.02) == ["vector"]
+    assert SemanticRouter.decide({"generate": 0.8, "vector": 0.5}, threshold=0.6, margin=0.1) == ["generate"]
+
+
+@pytest.fixture
+def fresh_router(monkeypatch):
+    monkeypatch.setattr(settings, "router_confidence_threshold", None)
+    monkeypatch.setattr(settings, "router_confidence_margin", None)
+    monkeypatch.setattr(settings, "router_prototypes_path", None)
+    return SemanticRouter()
+
+
+def test_uncalibrated_router_disables_embedding_tier(fresh_router):
+    assert fresh_router.confidence() is None
+    assert fresh_router._fast_route("石英的硬度是多少", [1.0, 0.0]) is None
+    # 关键词规则仍然生效
+    assert fresh_router._fast_route("你好", None) == ["generate"]
+
+
+def test_calibrated_file_supplies_defaults(fresh_router, tmp_path, monkeypatch):
+    path = tmp_path / "router_prototypes.npz"
+    np.savez(path, routes=np.array(["vector", "graph"]), prototypes=np.eye(2, dtype=np.float32),
+             threshold=np.float64(0.55), margin=np.float64(0.07))
+    monkeypatch.setattr(settings, "router_prototypes_path", str(path))
+
+    assert fresh_router.confidence() == (0.55, 0.07)
+    assert fresh_router._fast_route("石英的硬度是多少", [1.0, 0.1]) == ["vector"]
+
+    # 显式配置覆盖校准值
+    monkeypatch.setattr(settings, "router_confidence_margin", 0.5)
+    assert fresh_router.confidence() == (0.55, 0.5)
+    assert fresh_router._fast_route("石英的硬度是多少", [1.0, 0.6]) is None
+
+
+def test_prototype_file_without_recommendation_needs_settings(fresh_router, tmp_path, monkeypatch):
+    path = tmp_path / "router_prototypes.npz"
+    np.savez(path, routes=np.array(["vector", "graph"]), prototypes=np.eye(2, dtype=np.float32))
+    monkeypatch.setattr(settings, "router_prototypes_path", str(path))
+    assert fresh_router.confidence() is None
+
+    monkeypatch.setattr(settings, "router_confidence_threshold", 0.6)
+    monkeypatch.setattr(settings, "router_confidence_margin", 0.05)
+    assert fresh_router.confidence() == (0.6, 0.05)
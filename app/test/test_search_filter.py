@@ -0,0 +1,94 @@
+import os
+import sys
+from datetime import date, datetime, timezone
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from app.core.search_filter import (
+    FILTER_FIELD_DEFAULTS,
+    UnsupportedFilterError,
+    normalize_metadata,
+    to_milvus_expr,
+    to_predicate,
+)
+
+ALL_FIELDS = ["pk", "text", "vector", *FILTER_FIELD_DEFAULTS]
+
+
+def test_normalize_metadata_fills_defaults():
+    metadata = normalize_metadata({"source": "a.pdf", "page": 3}, ingested_at=1700000000)
+    assert metadata == {"source": "a.pdf", "question_id": -1, "ingested_at": 1700000000, "doc_type": "", "page": 3}
+    # 已有的入库时间不被覆盖
+    assert normalize_metadata({"ingested_at": 5}, ingested_at=1700000000)["ingested_at"] == 5
+
+
+def test_empty_filters():
+    assert to_milvus_expr(None) is None
+    assert to_milvus_expr({}) is None
+    assert to_milvus_expr({"sources": []}, ALL_FIELDS) is None
+    assert to_predicate(None) is None
+    assert to_predicate({"sources": None}) is None
+
+
+def test_list_values_are_combined_with_and():
+    expr = to_milvus_expr({"sources": ["a.pdf", "b.pdf"], "question_ids": [1, 2], "doc_types": ["pdf"]}, ALL_FIELDS)
+    assert expr == 'source in ["a.pdf", "b.pdf"] and question_id in [1, 2] and doc_type in ["pdf"]'
+
+
+def test_string_values_are_escaped():
+    expr = to_milvus_expr({"sources": ['报告 "终稿".pdf', "C:\\docs\\a.pdf"]}, ALL_FIELDS)
+    assert expr == 'source in ["报告 \\"终稿\\".pdf", "C:\\\\docs\\\\a.pdf"]'
+    # 注入尝试仍然只是字符串字面量的一部分
+    expr = to_milvus_expr({"sources": ['x"] or source != "']}, ALL_FIELDS)
+    assert expr == 'source in ["x\\"] or source != \\""]'
+
+
+def test_time_range_accepts_datetime_date_and_epoch():
+    after = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    expr = to_milvus_expr({"ingested_after": after, "ingested_before": 1800000000}, ALL_FIELDS)
+    assert expr == f"ingested_at >= {int(after.timestamp())} and ingested_at < 1800000000"
+    day = date(2024, 1, 1)
+    assert to_milvus_expr({"ingested_after": day}, ALL_FIELDS) == (
+        f"ingested_at >= {int(datetime(2024, 1, 1).timestamp())}"
+    )
+
+
+def test_missing_field_raises_instead_of_widening():
+    legacy_fields = ["pk", "text", "vector", "source"]
+    with pytest.raises(UnsupportedFilterError) as info:
+        to_milvus_expr({"sources": ["a.pdf"], "doc_types": ["pdf"], "ingested_after": 0}, legacy_fields)
+    assert info.value.fields == ["doc_type", "ingested_at"]
+    # 只用到集合已有字段时正常生成
+    assert to_milvus_expr({"sources": ["a.pdf"]}, legacy_fields) == 'source in ["a.pdf"]'
+
+
+def test_fields_unknown_skips_check():
+    # 集合尚未创建时不知道字段，按配置生成表达式
+    assert to_milvus_expr({"doc_types": ["pdf"]}, None) == 'doc_type in ["pdf"]'
+
+
+def test_predicate_matches_expr_semantics():
+    predicate = to_predicate({
+        "sources": ["a.pdf"],
+        "question_ids": [1],
+        "ingested_after": 100,
+        "ingested_before": 200,
+    })
+    base = {"source": "a.pdf", "question_id": 1, "ingested_at": 100}
+    assert predicate(base)
+    assert not predicate({**base, "source": "b.pdf"})
+    assert not predicate({**base, "question_id": 2})
+    assert not predicate({**base, "ingested_at": 99})
+    assert not predicate({**base, "ingested_at": 200})
+
+
+def test_predicate_uses_defaults_for_missing_metadata():
+    # 缺字段的旧文档取缺省值，不会因为缺字段而被放进结果
+    assert not to_predicate({"doc_types": ["pdf"]})({"source": "a.pdf"})
+    assert to_predicate({"question_ids": [-1]})({"source": "a.pdf"})
+    assert not to_predicate({"ingested_after": 1})({})
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# 把项目根目录加入 Python 搜索路径，这样才能 import app
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from app.core.singleflight import SingleFlight, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  石英的硬度是多少？ ") == normalize_query("石英的硬度是多少?")
+    assert normalize_query("What  IS Quartz?") == "what is quartz"
+    assert normalize_query("ＳｉＯ２") == "sio2"
+
+
+def test_concurrent_calls_are_coalesced():
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        assert flight.inflight() == 0
+        return results
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert [value for value, _ in results] == [1] * 5
+    # 只有第一个调用者是发起者
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+
+
+def test_different_keys_and_sequential_calls_are_not_coalesced():
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def main():
+        flight = SingleFlight("test")
+        await asyncio.gather(flight.do("a", fn), flight.do("b", fn))
+        # 上一次执行完成后同一 key 重新执行
+        await flight.do("a", fn)
+
+    asyncio.run(main())
+    assert calls == 3
+
+
+def test_exception_propagates_to_all_waiters():
+    async def fn():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+        assert flight.inflight() == 0
+        return results
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(r, ValueError) and str(r) == "boom" for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_other_waiters():
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        flight = SingleFlight("test")
+        first = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("done", True)
@@ -0,0 +1,102 @@
+"""
+重排序批处理吞吐对比
+
+用法:
+    python tools/bench_rerank.py                              # 合成长短混合的 (query, doc) 对
+    python tools/bench_rerank.py --texts data/chunks.jsonl    # 用真实分块 (每行 {"text": ...})
+    python tools/bench_rerank.py --budgets 4096 8192 16384 --batch-size 64
+
+对同一批 (query, doc) 对分别用原路径 (token 预算 0：按原顺序每 batch_size 对切批，
+批内 pad 到最长序列) 与长度分桶路径 (各 --budgets 取值) 打分，输出吞吐 (pairs/s) 与
+相对原路径的最大分数差 (验证分桶后分数仍按原顺序返回)。测量期间关闭分数缓存。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from app.core.config import settings
+from app.core.rerank import RerankService
+
+SYNTHETIC_SENTENCES = [
+    "黄铁矿 (FeS2) 是最常见的硫化物矿物，呈浅黄铜色，具强金属光泽。",
+    "石英的莫氏硬度为 7，常见于花岗岩、伟晶岩和热液脉中。",
+    "方解石遇稀盐酸剧烈起泡，具三组完全解理。",
+    "Hematite is an iron oxide mineral with a characteristic reddish-brown streak.",
+    "Feldspars make up roughly half of the Earth's crust by volume.",
+]
+QUERIES = ["黄铁矿的化学成分是什么", "如何区分石英和方解石", "What is the streak color of hematite?"]
+
+
+def load_pairs(args):
+    """
+    返回 (query, doc) 对列表。文档长度刻意长短混合 (短句到接近 512 token)，
+    与检索粗排候选的真实分布相近，也是分桶相对固定切批的收益来源
+    """
+    rng = np.random.default_rng(args.seed)
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            docs = [json.loads(line)["text"] for line in f if line.strip()]
+    else:
+        # 长度按对数均匀分布在 1 ~ 40 句之间
+        repeats = np.exp(rng.uniform(0, np.log(40), size=args.n)).astype(int) + 1
+        docs = ["".join(rng.choice(SYNTHETIC_SENTENCES, size=r)) for r in repeats]
+    picks = rng.choice(len(docs), size=args.n, replace=len(docs) < args.n)
+    return [(QUERIES[i % len(QUERIES)], docs[p]) for i, p in enumerate(picks)]
+
+
+def run(pairs, budget: int, batch_size: int, repeat: int):
+    """
+    返回 (每次耗时列表, 最后一次的分数)
+    """
+    settings.rerank_batch_token_budget = budget
+    RerankService._forward(pairs[:batch_size], batch_size)  # 预热 (CUDA kernel / 线程池)
+    timings, scores = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scores = RerankService._forward(pairs, batch_size)
+        timings.append(time.perf_counter() - start)
+    return timings, np.asarray(scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重排序批处理吞吐对比")
+    parser.add_argument("--texts", help="JSONL 文本文件 (每行 {\"text\": ...})，为空使用合成文本")
+    parser.add_argument("--n", type=int, default=512, help="(query, doc) 对数量")
+    parser.add_argument("--batch-size", type=int, default=settings.rerank_batch_size, help="单批 pair 数量上限")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[settings.rerank_batch_token_budget or 8192],
+                        help="长度分桶路径的 token 预算")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    settings.rerank_cache_enabled = False
+    pairs = load_pairs(args)
+    RerankService.get_instance()
+    lengths = [len(ids) for ids in RerankService._tokenizer(  # type: ignore
+        [[q, d] for q, d in pairs], truncation=True, max_length=512)["input_ids"]]
+    print(f"📐 {len(pairs)} 对，token 长度 min={min(lengths)} median={int(np.median(lengths))} max={max(lengths)}，"
+          f"设备 {RerankService._model.device}")  # type: ignore
+
+    baseline_timings, baseline_scores = run(pairs, 0, args.batch_size, args.repeat)
+    baseline = len(pairs) / min(baseline_timings)
+    print(f"  {'固定切批':<12} batch_size={args.batch_size:<5} {baseline:8.1f} pairs/s")
+
+    for budget in args.budgets:
+        timings, scores = run(pairs, budget, args.batch_size, args.repeat)
+        throughput = len(pairs) / min(timings)
+        diff = float(np.abs(scores - baseline_scores).max())
+        print(f"  {'长度分桶':<12} budget={budget:<8} {throughput:8.1f} pairs/s  "
+              f"x{throughput / baseline:.2f}  最大分数差={diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+快速路由层离线校准
+
+用法:
+    python tools/calibrate_router.py --data data/router_labels.jsonl --out data/router_prototypes.npz
+    python tools/calibrate_router.py --hotpot 200   # 无人工标注时，用路由 LLM 给 HotpotQA 问题打标签
+
+标注文件每行一个 JSON: {"query": "...", "routes": ["vector", "graph"]}
+输出:
+    1. 不同 (阈值, 间隔) 下快速路由层的覆盖率 (跳过 LLM 的比例) 与决策准确率
+    2. 由全部标注构建的原型文件，连同推荐的阈值与间隔一起保存，配置 ROUTER_PROTOTYPES_PATH 后生效
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from app.core.vector import embed_queries
+from app.core.router import router, build_prototypes, SemanticRouter, GREETING_PATTERN, ROUTE_EXAMPLES
+
+THRESHOLDS = [round(t, 2) for t in np.arange(0.40, 0.91, 0.05)]
+MARGINS = [0.0, 0.02, 0.04, 0.06, 0.08, 0.10, 0.15]
+
+
+def load_labels(args):
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return [(row["query"], row["routes"]) for row in rows]
+
+    from tools.load_hotpotqa import load_hotpot_samples
+    print(f"🏷️ 使用路由 LLM 为 {args.hotpot} 条 HotpotQA 问题打标签 (较慢)...")
+    labelled = []
+    for i, sample in enumerate(load_hotpot_samples(args.hotpot)):
+        routes = router.llm_route(sample["question"])
+        labelled.append((sample["question"], routes))
+        print(f"  [{i+1}/{args.hotpot}] {routes}")
+    return labelled
+
+
+def evaluate(labelled, vectors, names, prototypes):
+    """
+    返回 {(阈值, 间隔): (覆盖率, 准确率)}，准确率只在快速层做出决策的样本上统计 (与标签集合完全一致)
+    """
+    sims = vectors @ prototypes.T
+    report = {}
+    for threshold in THRESHOLDS:
+        for margin in MARGINS:
+            covered, correct = 0, 0
+            for (query, routes), row in zip(labelled, sims):
+                if GREETING_PATTERN.match(query):
+                    decision = ["generate"]
+                else:
+                    decision = SemanticRouter.decide(dict(zip(names, row.tolist())), threshold, margin)
+                if decision is None:
+                    continue
+                covered += 1
+                correct += int(set(decision) == set(routes))
+            report[(threshold, margin)] = (covered / len(labelled), correct / covered if covered else 0.0)
+    return report
+
+
+def recommend(report, min_accuracy: float):
+    """
+    准确率达标的组合中覆盖率最高的一个；覆盖率相同取更保守 (阈值、间隔更大) 的
+    """
+    candidates = [
+        (coverage, key) for key, (coverage, accuracy) in report.items()
+        if accuracy >= min_accuracy and coverage > 0
+    ]
+    return max(candidates)[1] if candidates else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校准快速路由层的原型与置信度阈值")
+    parser.add_argument("--data", help="标注文件 (JSONL)")
+    parser.add_argument("--hotpot", type=int, default=100, help="无标注文件时使用的 HotpotQA 问题数量")
+    parser.add_argument("--out", default="data/router_prototypes.npz", help="原型输出路径")
+    parser.add_argument("--min-accuracy", type=float, default=0.9, help="推荐阈值需要满足的最低准确率")
+    args = parser.parse_args()
+
+    labelled = load_labels(args)
+    # 内置示例一并参与，保证每个数据源都有原型
+    labelled += [(q, [route]) for route, examples in ROUTE_EXAMPLES.items() for q in examples]
+
+    # 一半构建原型、一半评估，避免在训练样本上评估导致结果虚高
+    random.seed(0)
+    random.shuffle(labelled)
+    split = len(labelled) // 2
+    train, test = labelled[:split], labelled[split:]
+
+    names, prototypes = build_prototypes(train)
+    test_vectors = np.asarray(embed_queries([q for q, _ in test]), dtype=np.float32)
+    report = evaluate(test, test_vectors, names, prototypes)
+
+    print(f"\n📊 评估集 {len(test)} 条")
+    print(f"{'阈值':>6} | {'间隔':>6} | {'跳过LLM':>8} | {'准确率':>8}")
+    for (threshold, margin), (coverage, accuracy) in report.items():
+        if coverage > 0:
+            print(f"{threshold:>6.2f} | {margin:>6.2f} | {coverage:>8.1%} | {accuracy:>8.1%}")
+    recommended = recommend(report, args.min_accuracy)
+
+    # 用全部标注构建最终原型；推荐值随原型一起保存，作为快速路由层的默认阈值与间隔
+    names, prototypes = build_prototypes(labelled)
+    extra = {}
+    if recommended is not None:
+        extra = {"threshold": np.float64(recommended[0]), "margin": np.float64(recommended[1])}
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    np.savez(args.out, routes=np.array(names), prototypes=prototypes.astype(np.float32), **extra)
+    print(f"\n💾 原型已保存: {args.out}")
+    print(f"   配置: ROUTER_PROTOTYPES_PATH={args.out}")
+    if recommended is not None:
+        coverage = report[recommended][0]
+        print(f"   推荐: 阈值 {recommended[0]}，间隔 {recommended[1]} (约 {coverage:.0%} 的问题跳过路由 LLM，已写入原型文件)")
+    else:
+        print(f"   没有阈值能达到 {args.min_accuracy:.0%} 准确率，原型文件未写入推荐值 (快速路由层仅使用关键词规则)，建议补充标注数据")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ judge_embeddings = OllamaEmbeddings(model="bge-m3")
 LIMIT = 5
 test_data = load_hotpot_samples(LIMIT)
 
-API_URL = "http://localhost:8000/v1/chat"
+API_URL = "http://localhost:8000/v1/chat/batch"
 
 data_samples = {
     'question': [],
@@ -28,38 +28,46 @@ data_samples = {
 
 print("\n🚀 开始 HotpotQA 挑战赛...")
 
-for item in test_data:
+# 2. 调用 Agent (批量接口：一次请求提交全部问题，向量检索与重排序在服务端合并执行)
+# 关闭 Web 搜索，因为我们要测的是内部检索能力 (Vector + Graph)
+# 如果开了 Web，它直接去谷歌搜答案了，就测不出我们架构的水平了
+payload = {
+    "requests": [
+        {
+            "query": item["question"],
+            "enable_vector": True,
+            "enable_graph": True,
+            "enable_web": False # 🔴 关掉联网！只测内功！
+        }
+        for item in test_data
+    ]
+}
+
+try:
+    # 批量评测以 batch 优先级排队，不抢占交互式请求
+    responses = requests.post(API_URL, json=payload, headers={"X-Request-Priority": "batch"}).json().get("responses", [])
+except Exception as e:
+    print(f"❌ 错误: {e}")
+    responses = []
+
+for item, response in zip(test_data, responses):
     q = item["question"]
     truth = item["answer"]
-    
+
     print(f"\n❓ 问题: {q}")
     print(f"✅ 答案: {truth}")
-    
-    # 2. 调用 Agent
-    # 关闭 Web 搜索，因为我们要测的是内部检索能力 (Vector + Graph)
-    # 如果开了 Web，它直接去谷歌搜答案了，就测不出我们架构的水平了
-    try:
-        response = requests.post(API_URL, json={
-            "query": q,
-            "enable_vector": True,
-            "enable_graph": True, 
-            "enable_web": False # 🔴 关掉联网！只测内功！
-        }).json()
-        
-        ans = response.get("final_answer", "")
-        print(f"🤖 回答: {ans}")
-        
-        # 提取上下文
-        source_list = response.get("sources", [])
-        ctxs = [src["content"] for src in source_list]
-        
-        data_samples['question'].append(q)
-        data_samples['answer'].append(ans)
-        data_samples['contexts'].append(ctxs)
-        data_samples['ground_truth'].append(truth)
-        
-    except Exception as e:
-        print(f"❌ 错误: {e}")
+
+    ans = response.get("answer", "")
+    print(f"🤖 回答: {ans}")
+
+    # 提取上下文
+    source_list = response.get("sources", [])
+    ctxs = [src["content"] for src in source_list]
+
+    data_samples['question'].append(q)
+    data_samples['answer'].append(ans)
+    data_samples['contexts'].append(ctxs)
+    data_samples['ground_truth'].append(truth)
 
 # 3. Ragas 评分
 print("\n⚖️ 裁判打分中...")
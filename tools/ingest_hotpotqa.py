@@ -8,38 +8,56 @@ project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
 from tools.load_hotpotqa import load_hotpot_samples
-from app.core.vector import get_vector_store
+from app.core.vector import VectorStoreService
 from app.core.graph_extract import extract_and_store_graph
+from app.core.answer_cache import invalidate_answer_cache
+from app.core.dedup import get_dedup_index
+from app.core.config import settings
 
 def ingest_hotpot_data(limit=10):
     # 1. 加载数据
     samples = load_hotpot_samples(limit)
     
-    vector_store = get_vector_store()
-    
     print(f"🚀 开始将 {limit} 条 HotpotQA 数据的上下文入库...")
     print("⚠️ 警告：这将调用 LLM 进行图谱抽取，速度较慢，请耐心等待...")
 
-    total_docs = []
-    
-    for i, sample in enumerate(samples):
-        print(f"\n--- 处理第 {i+1}/{limit} 个问题上下文 ---")
-        
-        # 将字符串转为 Document 对象
-        chunks = [
-            Document(page_content=txt, metadata={"source": "hotpotqa", "question_id": i}) 
+    # 将字符串转为 Document 对象
+    chunks_per_sample = [
+        [
+            Document(page_content=txt, metadata={"source": "hotpotqa", "question_id": i, "doc_type": "wikipedia"}) 
             for txt in sample["context_docs"]
         ]
+        for i, sample in enumerate(samples)
+    ]
+
+    # 2. 向量入库：所有问题的上下文合并成一批，多进程编码后一次写入
+    all_chunks = [chunk for chunks in chunks_per_sample for chunk in chunks]
+    if settings.ingest_dedup_enabled:
+        # 默认判重范围包含 question_id：同一问题内的重复段落跳过，不同问题共用的段落各自保留一份，
+        # 按 question_ids 过滤检索时每个问题都能取到自己的支撑段落 (DEDUP_SCOPE_FIELDS=[] 时跨问题判重)
+        kept, duplicates = get_dedup_index().split(all_chunks)
+        print(f"♻️ [Dedup] 跳过 {len(duplicates)} 个重复段落")
+        kept_ids = {id(chunk) for chunk in kept}
+        chunks_per_sample = [[c for c in chunks if id(c) in kept_ids] for chunks in chunks_per_sample]
+        all_chunks = kept
+    print(f"💾 [Vector] 存入 Milvus ({len(all_chunks)} chunks)...")
+    try:
+        VectorStoreService.add_documents_bulk(all_chunks)
         
-        # 2. 向量入库
-        print(f"💾 [Vector] 存入 Milvus ({len(chunks)} chunks)...")
-        vector_store.add_documents(chunks)
-        
-        # 3. 图谱抽取与入库
-        # HotpotQA 的核心就在这里！看看 LLM 能不能把 Wiki 里的实体关系抽出来
-        print(f"⛏️ [Graph] 抽取图谱知识...")
-        extract_and_store_graph(chunks)
-        
+        for i, chunks in enumerate(chunks_per_sample):
+            print(f"\n--- 处理第 {i+1}/{limit} 个问题上下文 ---")
+            if not chunks:
+                print("所有段落均已入库，跳过图谱抽取")
+                continue
+            
+            # 3. 图谱抽取与入库
+            # HotpotQA 的核心就在这里！看看 LLM 能不能把 Wiki 里的实体关系抽出来
+            print(f"⛏️ [Graph] 抽取图谱知识...")
+            extract_and_store_graph(chunks)
+    finally:
+        # 知识库已变化：更新版本文件，正在运行的服务下次查询缓存时会清空旧回答
+        invalidate_answer_cache()
+
     print("\n🎉 入库完成！现在你的数据库里已经有了 Wikipedia 的知识。")
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""
+Milvus 索引召回率 / 延迟扫描
+
+用法:
+    python tools/sweep_milvus_index.py                                  # Milvus Lite (本地 .db 文件) + 合成数据
+    python tools/sweep_milvus_index.py --uri http://localhost:19530 --index-types HNSW IVF_FLAT IVF_PQ DISKANN
+    python tools/sweep_milvus_index.py --texts data/chunks.jsonl         # 用真实分块的 BGE-M3 向量
+    python tools/sweep_milvus_index.py --backend hnswlib                # 没有 Milvus 时用 hnswlib 近似 HNSW 档位
+
+对每种索引类型建一个临时集合，依次用 fast / balanced / accurate 档位 (以及 --extra 给出的参数) 搜索，
+与 numpy 暴力检索的精确结果对比，输出 recall@k 与单次查询的平均 / P95 延迟。
+注意: Milvus Lite 只支持 FLAT / IVF_FLAT / AUTOINDEX，HNSW / IVF_PQ / DISKANN 需要 Milvus Standalone。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from app.core.vector import INDEX_BUILD_DEFAULTS, SEARCH_PRESETS
+
+COLLECTION_PREFIX = "index_sweep_"
+
+
+def load_vectors(args):
+    """
+    返回 (库向量, 查询向量)，均已 L2 归一化
+    """
+    rng = np.random.default_rng(args.seed)
+    if args.texts:
+        from app.core.vector import get_embeddings
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [json.loads(line)["text"] for line in f if line.strip()][:args.n]
+        print(f"🧮 正在编码 {len(texts)} 条文本...")
+        base = np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+        # 查询取库中向量加噪声，模拟与某个分块相近的问题
+        picks = rng.choice(len(base), size=min(args.queries, len(base)), replace=False)
+        queries = base[picks] + rng.normal(scale=0.02, size=(len(picks), base.shape[1])).astype(np.float32)
+    else:
+        # 合成数据：围绕若干簇中心分布，比均匀随机向量更接近真实语料的聚集结构
+        centers = rng.normal(size=(max(args.n // 500, 8), args.dim)).astype(np.float32)
+        base = centers[rng.integers(len(centers), size=args.n)] + rng.normal(scale=0.6, size=(args.n, args.dim)).astype(np.float32)
+        queries = centers[rng.integers(len(centers), size=args.queries)] + rng.normal(scale=0.6, size=(args.queries, args.dim)).astype(np.float32)
+
+    normalize = lambda m: m / np.linalg.norm(m, axis=1, keepdims=True)
+    return normalize(base), normalize(queries)
+
+
+def exact_top_k(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    # 向量已归一化，内积最大即 L2 距离最小
+    sims = queries @ base.T
+    return np.argsort(-sims, axis=1)[:, :k]
+
+
+def param_grid(index_type: str, extra):
+    """
+    [(标签, 搜索参数)]：该索引类型的全部档位，加上命令行给出的自定义组合
+    """
+    grid = list(SEARCH_PRESETS.get(index_type, {}).items()) or [("default", {})]
+    grid += [("custom", json.loads(item)) for item in extra]
+    return grid
+
+
+def report(index_type, label, params, latencies, recall):
+    latencies = np.asarray(latencies) * 1000
+    print(f"  {index_type:<10} {label:<9} {json.dumps(params):<24} "
+          f"recall={recall:.4f}  mean={latencies.mean():.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
+
+
+def sweep_milvus(args, base, queries, truth):
+    from pymilvus import MilvusClient, DataType
+
+    client = MilvusClient(args.uri)
+    for index_type in args.index_types:
+        name = f"{COLLECTION_PREFIX}{index_type.lower()}"
+        if client.has_collection(name):
+            client.drop_collection(name)
+
+        schema = MilvusClient.create_schema(auto_id=False)
+        schema.add_field("id", DataType.INT64, is_primary=True)
+        schema.add_field("vector", DataType.FLOAT_VECTOR, dim=base.shape[1])
+        index_params = client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector", index_type=index_type, metric_type="L2",
+            params=INDEX_BUILD_DEFAULTS.get(index_type, {})
+        )
+
+        print(f"🏗️ {index_type}: 写入 {len(base)} 条向量并建索引...")
+        try:
+            client.create_collection(name, schema=schema)
+            for start in range(0, len(base), 5000):
+                rows = base[start:start + 5000]
+                client.insert(name, [{"id": start + i, "vector": v.tolist()} for i, v in enumerate(rows)])
+            build_start = time.perf_counter()
+            client.create_index(name, index_params)
+            client.load_collection(name)
+            print(f"  建索引 + 加载耗时 {time.perf_counter() - build_start:.1f}s")
+        except Exception as e:
+            print(f"  ⚠️ 跳过 {index_type}: {e}")
+            client.drop_collection(name)
+            continue
+
+        for label, params in param_grid(index_type, args.extra):
+            search_params = {"metric_type": "L2", "params": dict(params)}
+            for key in ("ef", "search_list"):
+                if key in search_params["params"]:
+                    search_params["params"][key] = max(search_params["params"][key], args.k)
+
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = client.search(name, data=[query.tolist()], limit=args.k, search_params=search_params)
+                latencies.append(time.perf_counter() - start)
+                hits += len({hit["id"] for hit in result[0]} & set(expected.tolist()))
+            report(index_type, label, search_params["params"], latencies, hits / truth.size)
+
+        if not args.keep:
+            client.drop_collection(name)
+
+
+def sweep_hnswlib(args, base, queries, truth):
+    """
+    没有可用 Milvus 时的替身：hnswlib 与 Milvus HNSW 同为 HNSW 图，ef 对召回 / 延迟的影响趋势一致
+    """
+    import hnswlib
+
+    build = INDEX_BUILD_DEFAULTS["HNSW"]
+    index = hnswlib.Index(space="ip", dim=base.shape[1])
+    index.init_index(max_elements=len(base), ef_construction=build["efConstruction"], M=build["M"])
+    build_start = time.perf_counter()
+    index.add_items(base, np.arange(len(base)))
+    print(f"🏗️ hnswlib HNSW 建索引耗时 {time.perf_counter() - build_start:.1f}s")
+
+    for label, params in param_grid("HNSW", args.extra):
+        ef = max(params.get("ef", 64), args.k)
+        index.set_ef(ef)
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            labels, _ = index.knn_query(query, k=args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(labels[0].tolist()) & set(expected.tolist()))
+        report("HNSW*", label, {"ef": ef}, latencies, hits / truth.size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus 索引召回率 / 延迟扫描")
+    parser.add_argument("--backend", choices=["milvus", "hnswlib"], default="milvus")
+    parser.add_argument("--uri", default="./milvus_sweep.db", help="Milvus 地址或 Milvus Lite 文件路径")
+    parser.add_argument("--index-types", nargs="+", default=["IVF_FLAT", "HNSW", "IVF_PQ"])
+    parser.add_argument("--extra", nargs="*", default=[], help='额外的搜索参数组合，如 \'{"ef": 128}\'')
+    parser.add_argument("--texts", help="JSONL 文本文件 (每行 {\"text\": ...})，为空使用合成向量")
+    parser.add_argument("--n", type=int, default=50000, help="库向量数量")
+    parser.add_argument("--dim", type=int, default=1024, help="合成向量维度 (BGE-M3 为 1024)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=30, help="召回数量 (对应检索器的 search_k)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="保留临时集合")
+    args = parser.parse_args()
+    args.index_types = [t.upper() for t in args.index_types]
+
+    base, queries = load_vectors(args)
+    print(f"📐 库向量 {base.shape}，查询 {len(queries)} 条，计算精确 top-{args.k}...")
+    truth = exact_top_k(base, queries, args.k)
+
+    if args.backend == "hnswlib":
+        sweep_hnswlib(args, base, queries, truth)
+    else:
+        sweep_milvus(args, base, queries, truth)
+
+
+if __name__ == "__main__":
+    main()
@@ -61,7 +61,8 @@ if prompt := st.chat_input("请输入关于矿物的问题 (例如: 石膏的用
         try:
             with st.spinner("🔍 Agent 正在进行多源检索与推理..."):
                 start_time = time.time()
-                response = requests.post(API_URL, json=payload)
+                # 交互式流量优先于批量评测脚本排队
+                response = requests.post(API_URL, json=payload, headers={"X-Request-Priority": "interactive"})
                 end_time = time.time()
                 
             if response.status_code == 200: